@@ -319,34 +319,29 @@ def get_daily_revenue(
     
     verify_admin_permission(auth_header)
     
-    # Obtener todas las reservas confirmadas de los últimos días
-    date_from = datetime.now() - timedelta(days=days)
+    # Totales diarios ya agregados por reservations_service (una fila por día)
+    date_to = datetime.now().date()
+    date_from = date_to - timedelta(days=days - 1)
     
     try:
         response = requests.get(
-            f"{RESERVATIONS_SERVICE_URL}/reservations?status=confirmada&limit=100",
+            f"{RESERVATIONS_SERVICE_URL}/reservations/rollups",
+            params={"from": date_from.isoformat(), "to": date_to.isoformat(), "group_by": "day"},
             headers={"Authorization": auth_header},
             timeout=15
         )
         
         if response.status_code == 200:
-            reservations = response.json().get("reservations", [])
-            
-            # Agrupar por día
+            # Días sin reservas en 0
             daily_revenue = {}
             for i in range(days):
-                date = (datetime.now() - timedelta(days=i)).date()
+                date = date_to - timedelta(days=i)
                 daily_revenue[date.isoformat()] = 0
             
-            for reservation in reservations:
-                created_date = datetime.fromisoformat(
-                    reservation.get("created_at", "").replace("Z", "")
-                ).date()
-                
-                if created_date >= date_from.date():
-                    date_key = created_date.isoformat()
-                    if date_key in daily_revenue:
-                        daily_revenue[date_key] += reservation.get("total_price", 0)
+            for bucket in response.json().get("buckets", []):
+                date_key = bucket.get("period")
+                if date_key in daily_revenue:
+                    daily_revenue[date_key] = bucket.get("revenue", 0)
             
             return {
                 "daily_revenue": daily_revenue,
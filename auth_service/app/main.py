@@ -1,7 +1,9 @@
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.routes import auth_routes
 from app.database import init_db
+from app.db_common import pool_metrics_text, pool_status
 
 app = FastAPI(title="Auth Service")
 
@@ -21,3 +23,18 @@ app.include_router(auth_routes, prefix="/auth", tags=["Authentication"])
 def health_check():
     return {"status": "healthy", "service": "auth_service"}
 
+@app.get("/ready")
+def readiness_check():
+    """Sonda del balanceador: 503 con el pool de conexiones agotado para que desvíe tráfico"""
+    pools = pool_status()
+    if any(pool["exhausted"] for pool in pools):
+        return JSONResponse(
+            status_code=503,
+            content={"status": "exhausted", "service": "auth_service", "pools": pools},
+            headers={"Retry-After": "1"}
+        )
+    return {"status": "ready", "service": "auth_service", "pools": pools}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(pool_metrics_text(), media_type="text/plain; version=0.0.4")
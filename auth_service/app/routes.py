@@ -4,9 +4,14 @@ from sqlalchemy import func
 from typing import Optional
 from app import models, schemas, database, auth
 from app.utils import send_password_reset_email 
+import os
 
 auth_routes = APIRouter()
 
+# Token compartido para llamadas entre servicios (sin él no se exponen emails en lote)
+INTERNAL_SERVICE_TOKEN = os.getenv("INTERNAL_SERVICE_TOKEN")
+MAX_LOOKUP_USERS = 1000
+
 @auth_routes.post("/register", response_model=schemas.UserResponse)
 def register_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
     existing_user = db.query(models.User).filter(models.User.email == user.email).first()
@@ -92,7 +97,7 @@ def update_profile(
 
 @auth_routes.get("/me", response_model=schemas.UserResponse)
 def get_current_user_info(
-    db: Session = Depends(database.get_db),
+    db: Session = Depends(database.get_read_db),
     request: Request = None
 ):
     auth_header = None
@@ -158,7 +163,7 @@ def get_all_users(
     limit: int = Query(20, ge=1, le=100),
     role: Optional[str] = Query(None),
     is_active: Optional[bool] = Query(None),
-    db: Session = Depends(database.get_db),
+    db: Session = Depends(database.get_read_db),
     request: Request = None
 ):
     auth_header = None
@@ -209,7 +214,7 @@ def get_all_users(
 
 @auth_routes.get("/users/stats")
 def get_users_stats(
-    db: Session = Depends(database.get_db),
+    db: Session = Depends(database.get_read_db),
     request: Request = None
 ):
     auth_header = None
@@ -237,10 +242,30 @@ def get_users_stats(
         "regular_users": total_users - admin_users
     }
 
+@auth_routes.post("/users/lookup", response_model=schemas.UserLookupResponse)
+def lookup_users(
+    lookup: schemas.UserLookupRequest,
+    db: Session = Depends(database.get_read_db),
+    request: Request = None
+):
+    """Emails de varios usuarios en una sola consulta (uso interno entre servicios)"""
+    token = request.headers.get("X-Internal-Token") if request else None
+    if not INTERNAL_SERVICE_TOKEN or token != INTERNAL_SERVICE_TOKEN:
+        raise HTTPException(status_code=401, detail="Invalid internal token")
+    
+    if len(lookup.user_ids) > MAX_LOOKUP_USERS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_LOOKUP_USERS} users per lookup")
+    
+    users = db.query(models.User).filter(
+        models.User.id.in_(set(lookup.user_ids)),
+        models.User.is_active == True
+    ).all()
+    return {"users": users}
+
 @auth_routes.get("/user/{user_id}", response_model=schemas.UserResponse)
 def get_user_by_id(
     user_id: int,
-    db: Session = Depends(database.get_db),
+    db: Session = Depends(database.get_read_db),
     request: Request = None
 ):
     auth_header = None
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from typing import Optional, List
 
 class UserBase(BaseModel):
     username: str
@@ -39,4 +39,18 @@ class Token(BaseModel):
     token_type: str
 
 class TokenData(BaseModel):
-    username: Optional[str] = None
\ No newline at end of file
+    username: Optional[str] = None
+
+class UserLookupRequest(BaseModel):
+    user_ids: List[int]
+
+class UserContact(BaseModel):
+    id: int
+    email: EmailStr
+    username: str
+
+    class Config:
+        from_attributes = True
+
+class UserLookupResponse(BaseModel):
+    users: List[UserContact]
@@ -0,0 +1,27 @@
+from typing import Optional
+
+from fastapi import HTTPException, Request, Response
+
+# Respuesta cuando la versión del cliente ya no es la actual (If-Match o UPDATE concurrente)
+STALE_WRITE_DETAIL = "El recurso fue modificado por otra petición; vuelve a cargarlo e inténtalo de nuevo"
+
+
+def version_etag(version: int) -> str:
+    """ETag de una fila versionada: la columna version entre comillas"""
+    return f'"{version}"'
+
+
+def set_version_etag(response: Optional[Response], version: int):
+    if response is not None:
+        response.headers["ETag"] = version_etag(version)
+
+
+def check_if_match(request: Optional[Request], version: int):
+    """409 si la cabecera If-Match no incluye la versión actual; sin cabecera no se exige"""
+    if_match = request.headers.get("if-match") if request else None
+    if not if_match or if_match.strip() == "*":
+        return
+    # Se aceptan ETags débiles (W/"3"): los proxies que comprimen los debilitan
+    etags = [etag.strip().removeprefix("W/") for etag in if_match.split(",")]
+    if version_etag(version) not in etags:
+        raise HTTPException(status_code=409, detail=STALE_WRITE_DETAIL)
@@ -0,0 +1,74 @@
+import logging
+import os
+import threading
+
+import requests
+
+RESERVATIONS_SERVICE_URL = os.getenv("RESERVATIONS_SERVICE_URL")
+INTERNAL_SERVICE_TOKEN = os.getenv("INTERNAL_SERVICE_TOKEN")
+
+logger = logging.getLogger(__name__)
+
+# Máximo de canchas pendientes de notificar si reservations_service no responde
+MAX_PENDING_EVENTS = int(os.getenv("FIELD_EVENTS_MAX_PENDING", "1000"))
+
+
+def field_snapshot(field) -> dict:
+    """Datos de la cancha que reservations_service guarda en su caché local"""
+    return {
+        "field_id": field.id,
+        "name": field.name,
+        "location": field.location,
+        "price_per_hour": field.price_per_hour,
+        "is_active": bool(field.is_active),
+        "schedule_version": field.schedule_version or 0,
+        # reservations_service descarta eventos con una versión anterior a la que ya tiene
+        "version": field.version or 0,
+    }
+
+
+class FieldEventPublisher:
+    """Envía eventos de cambios de canchas a reservations_service en lotes"""
+
+    def __init__(self):
+        self._pending = {}  # field_id -> última versión de la cancha
+        self._lock = threading.Lock()
+
+    def publish(self, field):
+        """Encolar el estado actual de la cancha (tomar la foto antes de cerrar la sesión)"""
+        with self._lock:
+            # Solo interesa el último estado de cada cancha
+            self._pending.pop(field.id, None)
+            self._pending[field.id] = field_snapshot(field)
+            while len(self._pending) > MAX_PENDING_EVENTS:
+                self._pending.pop(next(iter(self._pending)))
+
+    def flush(self):
+        """Enviar todos los eventos pendientes en una sola petición"""
+        with self._lock:
+            events = list(self._pending.values())
+            self._pending.clear()
+        if not events:
+            return
+
+        headers = {"X-Internal-Token": INTERNAL_SERVICE_TOKEN} if INTERNAL_SERVICE_TOKEN else {}
+        try:
+            response = requests.post(
+                f"{RESERVATIONS_SERVICE_URL}/reservations/internal/field-events",
+                json={"events": events},
+                headers=headers,
+                timeout=5
+            )
+            if response.status_code == 200:
+                return
+            logger.warning(f"Error enviando eventos de canchas: {response.status_code}")
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Error enviando eventos de canchas: {e}")
+
+        # Reintentar en el próximo envío sin pisar cambios más recientes
+        with self._lock:
+            for event in events:
+                self._pending.setdefault(event["field_id"], event)
+
+
+field_events = FieldEventPublisher()
@@ -0,0 +1,62 @@
+import math
+import os
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+
+# Tamaño de celda de la rejilla en grados (0.05° ≈ 5.5 km de latitud)
+GRID_CELL_DEGREES = float(os.getenv("FIELDS_GRID_CELL_DEGREES", "0.05"))
+
+
+def grid_cell(latitude: float, longitude: float) -> tuple[int, int]:
+    """Celda (fila, columna) de la rejilla que contiene un punto"""
+    return (
+        math.floor(latitude / GRID_CELL_DEGREES),
+        math.floor(longitude / GRID_CELL_DEGREES),
+    )
+
+
+def bounding_cells(latitude: float, longitude: float, radius_km: float) -> tuple[int, int, list[tuple[int, int]]]:
+    """Celdas que cubren un círculo de radio dado: (fila_min, fila_max, [(col_min, col_max), ...]).
+
+    Si el círculo cruza el antimeridiano (±180°) las columnas se parten en dos intervalos,
+    uno a cada lado.
+    """
+    delta_lat = radius_km / KM_PER_DEGREE_LAT
+    # Cerca de los polos el coseno tiende a 0: acotar para no dividir por cero
+    cos_lat = max(math.cos(math.radians(latitude)), 0.01)
+    delta_lon = min(radius_km / (KM_PER_DEGREE_LAT * cos_lat), 180.0)
+
+    min_row = grid_cell(max(latitude - delta_lat, -90.0), longitude)[0]
+    max_row = grid_cell(min(latitude + delta_lat, 90.0), longitude)[0]
+
+    def column(lon: float) -> int:
+        return grid_cell(latitude, lon)[1]
+
+    west, east = longitude - delta_lon, longitude + delta_lon
+    if delta_lon >= 180.0:
+        col_ranges = [(column(-180.0), column(180.0))]
+    elif west < -180.0:
+        col_ranges = [(column(-180.0), column(east)), (column(west + 360.0), column(180.0))]
+    elif east > 180.0:
+        col_ranges = [(column(west), column(180.0)), (column(-180.0), column(east - 360.0))]
+    else:
+        col_ranges = [(column(west), column(east))]
+    return min_row, max_row, col_ranges
+
+
+def haversine_km(latitude: float, longitude: float, points: list[tuple[float, float]]) -> list[float]:
+    """Distancias en km desde un origen a una lista de puntos (lat, lon), calculadas en bloque"""
+    lat1 = math.radians(latitude)
+    lon1 = math.radians(longitude)
+    cos_lat1 = math.cos(lat1)
+    sin, cos, asin, sqrt, radians = math.sin, math.cos, math.asin, math.sqrt, math.radians
+
+    distances = []
+    for lat, lon in points:
+        lat2 = radians(lat)
+        dlat = lat2 - lat1
+        dlon = radians(lon) - lon1
+        a = sin(dlat / 2) ** 2 + cos_lat1 * cos(lat2) * sin(dlon / 2) ** 2
+        distances.append(2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a))))
+    return distances
@@ -1,7 +1,12 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy.orm.exc import StaleDataError
 from app.routes import fields_router
 from app.database import init_db
+from app.db_common import pool_metrics_text, pool_status
+from app.reservations_client import reservations_client, ReservationsUnavailable
+from app.concurrency import STALE_WRITE_DETAIL
 
 app = FastAPI(title="Fields Management Service")
 
@@ -18,6 +23,40 @@ app.add_middleware(
 
 app.include_router(fields_router, prefix="/fields", tags=["Fields"])
 
+@app.exception_handler(ReservationsUnavailable)
+async def reservations_unavailable_handler(request: Request, exc: ReservationsUnavailable):
+    # Mejor un error explícito que mostrar la cancha como libre sin saberlo
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "No se pudo verificar la disponibilidad en este momento"},
+        headers={"Retry-After": "5"}
+    )
+
+@app.exception_handler(StaleDataError)
+async def stale_data_handler(request: Request, exc: StaleDataError):
+    # Otra petición confirmó antes una versión nueva de la fila: no se pisa su cambio
+    return JSONResponse(status_code=409, content={"detail": STALE_WRITE_DETAIL})
+
+@app.on_event("shutdown")
+async def close_reservations_client():
+    await reservations_client.close()
+
 @app.get("/health")
 def health_check():
-    return {"status": "healthy", "service": "fields_service"}
\ No newline at end of file
+    return {"status": "healthy", "service": "fields_service"}
+
+@app.get("/ready")
+def readiness_check():
+    """Sonda del balanceador: 503 con el pool de conexiones agotado para que desvíe tráfico"""
+    pools = pool_status()
+    if any(pool["exhausted"] for pool in pools):
+        return JSONResponse(
+            status_code=503,
+            content={"status": "exhausted", "service": "fields_service", "pools": pools},
+            headers={"Retry-After": "1"}
+        )
+    return {"status": "ready", "service": "fields_service", "pools": pools}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(pool_metrics_text(), media_type="text/plain; version=0.0.4")
@@ -1,9 +1,35 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, Text, Time
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, Date, Text, Time, Index, UniqueConstraint, ForeignKey, event
 from sqlalchemy.sql import func
 from app.database import Base
+from app.geo import grid_cell
+
+# Documento de búsqueda de texto completo (debe coincidir con el índice GIN)
+SEARCH_DOCUMENT_SQL = (
+    "to_tsvector('simple', coalesce(name, '') || ' ' || "
+    "coalesce(location, '') || ' ' || coalesce(description, ''))"
+)
+
+# DDL exclusivo de PostgreSQL que create_all no puede expresar
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS ix_fields_search_document ON fields USING gin (({SEARCH_DOCUMENT_SQL}))",
+    "CREATE INDEX IF NOT EXISTS ix_fields_name_trgm ON fields USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_fields_location_trgm ON fields USING gin (location gin_trgm_ops)",
+    # Columnas agregadas después de la creación inicial de la tabla
+    "ALTER TABLE fields ADD COLUMN IF NOT EXISTS latitude DOUBLE PRECISION",
+    "ALTER TABLE fields ADD COLUMN IF NOT EXISTS longitude DOUBLE PRECISION",
+    "ALTER TABLE fields ADD COLUMN IF NOT EXISTS grid_row INTEGER",
+    "ALTER TABLE fields ADD COLUMN IF NOT EXISTS grid_col INTEGER",
+    "CREATE INDEX IF NOT EXISTS ix_fields_grid ON fields (grid_row, grid_col)",
+    "ALTER TABLE fields ADD COLUMN IF NOT EXISTS schedule_version INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE fields ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1",
+]
 
 class Field(Base):
     __tablename__ = "fields"
+    __table_args__ = (
+        Index("ix_fields_grid", "grid_row", "grid_col"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False, index=True)
@@ -16,12 +42,26 @@ class Field(Base):
     # Horarios de funcionamiento
     opening_time = Column(Time, default="10:00:00")  
     closing_time = Column(Time, default="22:00:00")  
+
+    # Ubicación geográfica e índice de rejilla (se mantiene al escribir)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    grid_row = Column(Integer, nullable=True)
+    grid_col = Column(Integer, nullable=True)
+
+    # Se incrementa con cada cambio de horario (invalida las máscaras en caché)
+    schedule_version = Column(Integer, nullable=False, default=0)
     
     # Metadatos
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     created_by = Column(Integer, nullable=True)  
 
+    # Control de concurrencia optimista: cada UPDATE del ORM exige la versión leída y la incrementa
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
+    __mapper_args__ = {"version_id_col": version}
+
     def __repr__(self):
         return f"<Field(id={self.id}, name='{self.name}', location='{self.location}')>"
 
@@ -35,3 +75,44 @@ class Field(Base):
             check_time = check_time.time()
         
         return self.opening_time <= check_time <= self.closing_time
+
+
+class FieldWeeklyHours(Base):
+    """Plantilla semanal de horarios (weekday: 0 = lunes ... 6 = domingo)"""
+    __tablename__ = "field_weekly_hours"
+    __table_args__ = (
+        UniqueConstraint("field_id", "weekday", name="uq_field_weekly_hours_weekday"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    field_id = Column(Integer, ForeignKey("fields.id", ondelete="CASCADE"), nullable=False)
+    weekday = Column(Integer, nullable=False)
+    opening_time = Column(Time, nullable=True)
+    closing_time = Column(Time, nullable=True)
+    is_closed = Column(Boolean, default=False, nullable=False)
+
+class FieldScheduleException(Base):
+    """Excepción de horario para una fecha concreta (festivos, mantenimiento...)"""
+    __tablename__ = "field_schedule_exceptions"
+    __table_args__ = (
+        UniqueConstraint("field_id", "date", name="uq_field_schedule_exceptions_date"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    field_id = Column(Integer, ForeignKey("fields.id", ondelete="CASCADE"), nullable=False)
+    date = Column(Date, nullable=False)
+    opening_time = Column(Time, nullable=True)
+    closing_time = Column(Time, nullable=True)
+    is_closed = Column(Boolean, default=True, nullable=False)
+    reason = Column(String, nullable=True)
+    created_at = Column(DateTime, default=func.now())
+
+@event.listens_for(Field, "before_insert")
+@event.listens_for(Field, "before_update")
+def update_grid_cell(mapper, connection, target):
+    """Recalcular la celda de la rejilla cuando cambian las coordenadas"""
+    if target.latitude is None or target.longitude is None:
+        target.grid_row = None
+        target.grid_col = None
+    else:
+        target.grid_row, target.grid_col = grid_cell(target.latitude, target.longitude)
@@ -0,0 +1,184 @@
+import asyncio
+import os
+import time
+from datetime import date, datetime
+
+import httpx
+
+RESERVATIONS_SERVICE_URL = os.getenv("RESERVATIONS_SERVICE_URL")
+
+# Tiempos máximos de la llamada a reservations_service (segundos)
+RESERVATIONS_CONNECT_TIMEOUT = float(os.getenv("RESERVATIONS_CONNECT_TIMEOUT", "0.5"))
+RESERVATIONS_READ_TIMEOUT = float(os.getenv("RESERVATIONS_READ_TIMEOUT", "2.0"))
+RESERVATIONS_MAX_CONNECTIONS = int(os.getenv("RESERVATIONS_MAX_CONNECTIONS", "50"))
+
+# Circuit breaker: fallos consecutivos para abrir y segundos antes de reintentar
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("RESERVATIONS_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("RESERVATIONS_BREAKER_RESET_SECONDS", "30"))
+
+# Stale-while-revalidate de las horas reservadas por (cancha, fecha)
+BOOKED_FRESH_SECONDS = float(os.getenv("AVAILABILITY_FRESH_SECONDS", "5"))
+BOOKED_STALE_SECONDS = float(os.getenv("AVAILABILITY_STALE_SECONDS", "300"))
+BOOKED_CACHE_MAX_ENTRIES = int(os.getenv("AVAILABILITY_CACHE_MAX_ENTRIES", "10000"))
+
+# Estados de /reservations/field/{id}/date/{día} que ocupan el horario
+BUSY_STATUSES = ("confirmada", "retenida")
+
+
+class ReservationsUnavailable(Exception):
+    """reservations_service no respondió a tiempo o el circuito está abierto"""
+
+
+class CircuitBreaker:
+    """Circuit breaker simple (cerrado -> abierto -> semiabierto) para un servicio remoto"""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow_request(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_in_flight:
+            # Dejar pasar una sola petición de prueba
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_in_flight or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+    def release_trial(self):
+        # La petición terminó sin resultado (p. ej. cancelada): permitir otra prueba
+        self._trial_in_flight = False
+
+
+class ReservationsClient:
+    """Cliente asíncrono con pool de conexiones, timeouts, circuit breaker y caché SWR"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS)
+        self._client = None
+        self._cache = {}  # (field_id, fecha) -> (horas reservadas, instante de carga)
+        self._refreshing = set()
+        self._tasks = set()
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(RESERVATIONS_READ_TIMEOUT, connect=RESERVATIONS_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=RESERVATIONS_MAX_CONNECTIONS,
+                    max_keepalive_connections=RESERVATIONS_MAX_CONNECTIONS
+                )
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get_booked_hours(self, field_id: int, day: date) -> tuple[set, bool]:
+        """Devolver (horas reservadas, es_dato_antiguo) de una cancha en una fecha"""
+        key = (field_id, day)
+        cached = self._cache.get(key)
+        if cached is not None:
+            age = time.monotonic() - cached[1]
+            if age < BOOKED_FRESH_SECONDS:
+                return cached[0], False
+            if age < BOOKED_STALE_SECONDS:
+                # Servir el último dato conocido y revalidar en segundo plano
+                self._schedule_refresh(field_id, day)
+                return cached[0], True
+
+        # Sin dato utilizable: hay que consultar (o fallar rápido si el circuito está abierto)
+        return await self._fetch(field_id, day), False
+
+    def _schedule_refresh(self, field_id: int, day: date):
+        key = (field_id, day)
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        task = asyncio.create_task(self._refresh(field_id, day))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refresh(self, field_id: int, day: date):
+        try:
+            await self._fetch(field_id, day)
+        except ReservationsUnavailable:
+            pass
+        finally:
+            self._refreshing.discard((field_id, day))
+
+    async def _fetch(self, field_id: int, day: date) -> set:
+        if not self.breaker.allow_request():
+            raise ReservationsUnavailable("Circuito abierto hacia reservations_service")
+
+        # Toda salida debe cerrar la petición en el breaker; si no, una prueba
+        # semiabierta que no termina lo deja rechazando todo indefinidamente
+        try:
+            response = await self._get_client().get(
+                f"{self.base_url}/reservations/field/{field_id}/date/{day}"
+            )
+            if response.status_code != 200:
+                raise ReservationsUnavailable(f"Respuesta inesperada: {response.status_code}")
+
+            booked_hours = set()
+            for reservation in response.json():
+                # Las retenciones temporales ("retenida") también ocupan el horario
+                if reservation.get("status") in BUSY_STATUSES:
+                    start_hour = datetime.fromisoformat(reservation["start_time"]).hour
+                    booked_hours.update(range(start_hour, start_hour + reservation["duration_hours"]))
+        except ReservationsUnavailable:
+            self.breaker.record_failure()
+            raise
+        except httpx.HTTPError as e:
+            self.breaker.record_failure()
+            raise ReservationsUnavailable(str(e))
+        except Exception as e:
+            self.breaker.record_failure()
+            raise ReservationsUnavailable(f"Respuesta inválida: {e}")
+        except BaseException:
+            # Cancelada (cliente desconectado, apagado): no cuenta como fallo
+            self.breaker.release_trial()
+            raise
+
+        self.breaker.record_success()
+        self._store(field_id, day, booked_hours)
+        return booked_hours
+
+    def _store(self, field_id: int, day: date, booked_hours: set):
+        if len(self._cache) >= BOOKED_CACHE_MAX_ENTRIES:
+            # Descartar entradas que ya no se pueden servir ni como dato antiguo
+            now = time.monotonic()
+            for key in [k for k, (_, loaded_at) in self._cache.items() if now - loaded_at >= BOOKED_STALE_SECONDS]:
+                del self._cache[key]
+            if len(self._cache) >= BOOKED_CACHE_MAX_ENTRIES:
+                self._cache.pop(next(iter(self._cache)))
+        self._cache[(field_id, day)] = (booked_hours, time.monotonic())
+
+
+reservations_client = ReservationsClient(RESERVATIONS_SERVICE_URL)
@@ -1,20 +1,34 @@
-from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
+from sqlalchemy import func, literal_column, or_
 from typing import List, Optional
 from datetime import datetime, timedelta, time, date
+import asyncio
 import requests
 import os
+import re
 
-from app.database import get_db
-from app.models import Field
-from app.schemas import FieldCreate, FieldUpdate, FieldResponse, FieldListResponse, FieldAvailability
+from app.database import get_db, get_read_db
+from app.models import Field, FieldWeeklyHours, FieldScheduleException, SEARCH_DOCUMENT_SQL
+from app.schemas import (
+    FieldCreate, FieldUpdate, FieldResponse, FieldListResponse, FieldAvailability,
+    FieldSearchResult, FieldSearchResponse, FieldNearbyResult, FieldNearbyResponse,
+    WeeklyScheduleUpdate, ScheduleExceptionBase, ScheduleExceptionResponse,
+    FieldScheduleResponse, DayOpenMask, FieldScheduleMasksResponse
+)
+from app.search_index import FieldSearchIndex, search_index, tokenize
+from app.geo import bounding_cells, haversine_km
+from app.schedule import get_open_mask, get_open_masks, open_hours, bump_schedule_version
+from app.reservations_client import reservations_client
+from app.field_events import field_events
+from app.concurrency import check_if_match, set_version_etag
 
 fields_router = APIRouter()
 
 # URLs de otros servicios
 AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL")
 ROLES_SERVICE_URL = os.getenv("ROLES_SERVICE_URL")
-RESERVATIONS_SERVICE_URL = os.getenv("RESERVATIONS_SERVICE_URL")
 
 def verify_admin_permission(auth_header: str):
     """Verificar que el usuario tenga permisos de administrador"""
@@ -54,6 +68,7 @@ def verify_admin_permission(auth_header: str):
 @fields_router.post("/", response_model=FieldResponse)
 def create_field(
     field: FieldCreate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     request: Request = None 
 ):
@@ -77,6 +92,8 @@ def create_field(
         opening_time=field.opening_time,
         closing_time=field.closing_time,
         is_active=field.is_active,
+        latitude=field.latitude,
+        longitude=field.longitude,
         created_by=user_id
     )
     
@@ -84,6 +101,10 @@ def create_field(
         db.add(db_field)
         db.commit()
         db.refresh(db_field)
+        if search_index.loaded:
+            search_index.upsert(db_field)
+        field_events.publish(db_field)
+        background_tasks.add_task(field_events.flush)
         return db_field
     except Exception as e:
         db.rollback()
@@ -94,7 +115,7 @@ def list_fields(
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
     is_active: Optional[bool] = Query(None),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     query = db.query(Field)
     
@@ -111,19 +132,168 @@ def list_fields(
         size=limit
     )
 
+def search_fields_postgres(db: Session, terms: list[str], q: str, limit: int, is_active: Optional[bool]):
+    """Búsqueda con índices GIN (tsvector + trigramas) y orden por relevancia"""
+    document = literal_column(SEARCH_DOCUMENT_SQL)
+    # Cada término se busca como prefijo para autocompletar
+    ts_query = func.to_tsquery("simple", " & ".join(f"{term}:*" for term in terms))
+    score = (
+        func.ts_rank(document, ts_query)
+        + func.greatest(func.similarity(Field.name, q), func.similarity(Field.location, q))
+    ).label("score")
+
+    query = db.query(Field, score).filter(
+        or_(
+            document.op("@@")(ts_query),
+            Field.name.op("%")(q),
+            Field.location.op("%")(q)
+        )
+    )
+    if is_active is not None:
+        query = query.filter(Field.is_active == is_active)
+
+    return query.order_by(score.desc(), Field.id).limit(limit).all()
+
+def search_fields_in_memory(db: Session, q: str, limit: int, is_active: Optional[bool]):
+    """Búsqueda con el índice de n-gramas en memoria (bases de datos sin pg_trgm)"""
+    if is_active:
+        if not search_index.loaded:
+            search_index.load(db.query(Field).all())
+        index = search_index
+    else:
+        # El índice compartido solo tiene canchas activas: el resto se indexa en cada búsqueda
+        query = db.query(Field)
+        if is_active is not None:
+            query = query.filter(Field.is_active == is_active)
+        index = FieldSearchIndex(active_only=False)
+        index.load(query.all())
+
+    ranked = index.search(q, limit=limit)
+    if not ranked:
+        return []
+    fields_query = db.query(Field).filter(Field.id.in_([field_id for field_id, _ in ranked]))
+    if is_active is not None:
+        # Otro proceso pudo desactivar la cancha después de que este la indexara
+        fields_query = fields_query.filter(Field.is_active == is_active)
+    fields_by_id = {field.id: field for field in fields_query.all()}
+    return [(fields_by_id[field_id], score) for field_id, score in ranked if field_id in fields_by_id]
+
+@fields_router.get("/search", response_model=FieldSearchResponse)
+def search_fields(
+    q: str = Query(..., min_length=1, max_length=100, description="Texto a buscar en nombre, ubicación y descripción"),
+    limit: int = Query(10, ge=1, le=50),
+    is_active: Optional[bool] = Query(True),
+    db: Session = Depends(get_read_db)
+):
+    if not tokenize(q):
+        raise HTTPException(status_code=400, detail="La búsqueda debe contener al menos una palabra")
+
+    if db.bind.dialect.name == "postgresql":
+        terms = re.findall(r"\w+", q.lower())
+        rows = search_fields_postgres(db, terms, q.strip().lower(), limit, is_active)
+    else:
+        rows = search_fields_in_memory(db, q, limit, is_active)
+
+    results = [
+        FieldSearchResult(**FieldResponse.model_validate(field).model_dump(), score=round(float(score), 4))
+        for field, score in rows
+    ]
+    return FieldSearchResponse(query=q, fields=results, total=len(results))
+
+def find_fields_in_radius(db: Session, lat: float, lon: float, radius_km: float, max_results: Optional[int]):
+    """Canchas activas dentro del radio, ordenadas por distancia: [(distancia_km, cancha)]"""
+    # Podar candidatos por celdas de la rejilla usando el índice (grid_row, grid_col);
+    # cerca del antimeridiano las columnas forman dos intervalos
+    min_row, max_row, col_ranges = bounding_cells(lat, lon, radius_km)
+    candidates = db.query(Field.id, Field.latitude, Field.longitude).filter(
+        Field.is_active == True,
+        Field.grid_row.between(min_row, max_row),
+        or_(*[Field.grid_col.between(min_col, max_col) for min_col, max_col in col_ranges])
+    ).all()
+
+    # Distancia exacta solo para los candidatos, calculada en bloque
+    distances = haversine_km(lat, lon, [(c.latitude, c.longitude) for c in candidates])
+    in_radius = sorted(
+        (distance, candidate.id)
+        for candidate, distance in zip(candidates, distances)
+        if distance <= radius_km
+    )
+    if max_results is not None:
+        in_radius = in_radius[:max_results]
+    if not in_radius:
+        return []
+
+    fields_by_id = {
+        f.id: f for f in db.query(Field).filter(Field.id.in_([field_id for _, field_id in in_radius])).all()
+    }
+    return [(distance, fields_by_id[field_id]) for distance, field_id in in_radius if field_id in fields_by_id]
+
+@fields_router.get("/nearby", response_model=FieldNearbyResponse)
+async def get_nearby_fields(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(5.0, gt=0, le=100),
+    limit: int = Query(10, ge=1, le=50),
+    date: Optional[date] = Query(None, description="Si se indica, solo canchas con horas libres ese día (YYYY-MM-DD)"),
+    hour: Optional[int] = Query(None, ge=0, le=23, description="Hora que debe estar libre (requiere date)"),
+    db: Session = Depends(get_read_db)
+):
+    if hour is not None and date is None:
+        raise HTTPException(status_code=400, detail="El parámetro hour requiere date")
+    if date is not None and date > datetime.now().date() + timedelta(days=30):
+        raise HTTPException(status_code=400, detail="No se pueden hacer reservas con más de 30 días de anticipación")
+
+    # Sin filtro de disponibilidad solo hace falta cargar las `limit` más cercanas
+    nearby = await run_in_threadpool(find_fields_in_radius, db, lat, lon, radius_km, None if date else limit)
+
+    if date is None:
+        return FieldNearbyResponse(
+            fields=[
+                FieldNearbyResult(**FieldResponse.model_validate(field).model_dump(), distance_km=round(distance, 3))
+                for distance, field in nearby
+            ],
+            total=len(nearby)
+        )
+
+    masks = await run_in_threadpool(lambda: {field.id: get_open_mask(db, field, date) for _, field in nearby})
+
+    results = []
+    # Consultar la disponibilidad por lotes concurrentes, en orden de distancia
+    for batch_start in range(0, len(nearby), limit):
+        batch = nearby[batch_start:batch_start + limit]
+        booked = await asyncio.gather(*(
+            reservations_client.get_booked_hours(field.id, date) for _, field in batch
+        ))
+        for (distance, field), (booked_hours, _) in zip(batch, booked):
+            available_hours = free_hours(masks[field.id], booked_hours)
+            if not available_hours or (hour is not None and f"{hour:02d}:00" not in available_hours):
+                continue
+            results.append(FieldNearbyResult(
+                **FieldResponse.model_validate(field).model_dump(),
+                distance_km=round(distance, 3),
+                available_hours=available_hours
+            ))
+            if len(results) >= limit:
+                return FieldNearbyResponse(fields=results, total=len(results))
+
+    return FieldNearbyResponse(fields=results, total=len(results))
+
 @fields_router.get("/{field_id}", response_model=FieldResponse)
-def get_field(field_id: int, db: Session = Depends(get_db)):
+def get_field(field_id: int, db: Session = Depends(get_read_db), response: Response = None):
     field = db.query(Field).filter(Field.id == field_id).first()
     if not field:
         raise HTTPException(status_code=404, detail="Cancha no encontrada")
+    set_version_etag(response, field.version)
     return field
 
 @fields_router.patch("/{field_id}", response_model=FieldResponse)
 def update_field(
     field_id: int,
     field_update: FieldUpdate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
-    request: Request = None 
+    request: Request = None,
+    response: Response = None
 ):
     auth_header = None
     if request:
@@ -136,17 +306,33 @@ def update_field(
     if not field:
         raise HTTPException(status_code=404, detail="Cancha no encontrada")
     
+    # If-Match con el ETag leído: 409 si otro administrador la cambió desde entonces
+    check_if_match(request, field.version)
+    
     # Actualizar solo los campos proporcionados
-    for key, value in field_update.dict(exclude_unset=True).items():
+    update_data = field_update.dict(exclude_unset=True)
+    for key, value in update_data.items():
         setattr(field, key, value)
+
+    # El horario por defecto alimenta las máscaras de horas abiertas
+    if "opening_time" in update_data or "closing_time" in update_data:
+        bump_schedule_version(field)
     
     db.commit()
     db.refresh(field)
+    if not field.is_active:
+        search_index.remove(field.id)
+    elif search_index.loaded:
+        search_index.upsert(field)
+    field_events.publish(field)
+    background_tasks.add_task(field_events.flush)
+    set_version_etag(response, field.version)
     return field
 
 @fields_router.delete("/{field_id}")
 def delete_field(
     field_id: int,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     request: Request = None 
 ):
@@ -163,55 +349,187 @@ def delete_field(
     # Soft delete - marcar como inactiva
     field.is_active = False
     db.commit()
+    search_index.remove(field.id)
+    field_events.publish(field)
+    background_tasks.add_task(field_events.flush)
     
     return {"message": f"Cancha '{field.name}' eliminada exitosamente"}
 
+def free_hours(mask: int, booked_hours: set) -> list[str]:
+    """Horas abiertas según la máscara de horario que no están reservadas"""
+    return [f"{hour:02d}:00" for hour in open_hours(mask) if hour not in booked_hours]
+
+def load_active_field_mask(db: Session, field_id: int, date: date):
+    field = db.query(Field).filter(Field.id == field_id, Field.is_active == True).first()
+    if not field:
+        raise HTTPException(status_code=404, detail="Cancha no encontrada")
+    return field, get_open_mask(db, field, date)
+
 @fields_router.get("/{field_id}/availability", response_model=FieldAvailability)
-def get_field_availability(
+async def get_field_availability(
     field_id: int,
     date: date = Query(..., description="Fecha para verificar disponibilidad (YYYY-MM-DD)"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
-    field = db.query(Field).filter(Field.id == field_id, Field.is_active == True).first()
-    if not field:
-        raise HTTPException(status_code=404, detail="Cancha no encontrada")
-    
     # Verificar que la fecha no sea muy lejana (máximo 30 días)
     max_date = datetime.now().date() + timedelta(days=30)
     if date > max_date:
         raise HTTPException(status_code=400, detail="No se pueden hacer reservas con más de 30 días de anticipación")
     
-    # Generar horarios disponibles (de 10 AM a 10 PM, en bloques de 1 hora)
-    available_hours = []
-    current_hour = field.opening_time.hour
-    closing_hour = field.closing_time.hour
-    
-    try:
-        # Obtener reservas existentes para esa fecha
-        reservations_response = requests.get(
-            f"{RESERVATIONS_SERVICE_URL}/reservations/field/{field_id}/date/{date}"
-        )
-        reserved_hours = []
-        if reservations_response.status_code == 200:
-            reservations = reservations_response.json()
-            for reservation in reservations:
-                if reservation.get("status") == "confirmada":
-                    start_time = datetime.fromisoformat(reservation["start_time"]).hour
-                    duration = reservation["duration_hours"]
-                    for hour in range(start_time, start_time + duration):
-                        reserved_hours.append(hour)
-    except requests.exceptions.RequestException:
-        # Si el servicio de reservas no está disponible, asumir que no hay reservas
-        reserved_hours = []
+    # La base de datos es síncrona: no bloquear el event loop
+    field, mask = await run_in_threadpool(load_active_field_mask, db, field_id, date)
     
-    # Generar lista de horarios disponibles
-    while current_hour < closing_hour:
-        if current_hour not in reserved_hours:
-            available_hours.append(f"{current_hour:02d}:00")
-        current_hour += 1
+    booked_hours, is_stale = set(), False
+    if mask:
+        # Reservas existentes (con timeout, circuit breaker y último dato conocido)
+        booked_hours, is_stale = await reservations_client.get_booked_hours(field_id, date)
     
     return FieldAvailability(
         field_id=field_id,
         date=datetime.combine(date, datetime.min.time()), 
-        available_hours=available_hours
-    )
\ No newline at end of file
+        available_hours=free_hours(mask, booked_hours),
+        is_stale=is_stale
+    )
+
+def get_field_or_404(db: Session, field_id: int) -> Field:
+    field = db.query(Field).filter(Field.id == field_id).first()
+    if not field:
+        raise HTTPException(status_code=404, detail="Cancha no encontrada")
+    return field
+
+@fields_router.get("/{field_id}/schedule", response_model=FieldScheduleResponse)
+def get_field_schedule(
+    field_id: int,
+    db: Session = Depends(get_read_db)
+):
+    """Obtener la plantilla semanal y las excepciones futuras de una cancha"""
+    field = get_field_or_404(db, field_id)
+    weekly = db.query(FieldWeeklyHours).filter(
+        FieldWeeklyHours.field_id == field_id
+    ).order_by(FieldWeeklyHours.weekday).all()
+    exceptions = db.query(FieldScheduleException).filter(
+        FieldScheduleException.field_id == field_id,
+        FieldScheduleException.date >= datetime.now().date()
+    ).order_by(FieldScheduleException.date).all()
+
+    return FieldScheduleResponse(
+        field_id=field_id,
+        schedule_version=field.schedule_version or 0,
+        default_opening_time=field.opening_time,
+        default_closing_time=field.closing_time,
+        weekly=weekly,
+        exceptions=exceptions
+    )
+
+@fields_router.put("/{field_id}/schedule/weekly", response_model=FieldScheduleResponse)
+def update_field_weekly_schedule(
+    field_id: int,
+    schedule: WeeklyScheduleUpdate,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    request: Request = None
+):
+    """Reemplazar la plantilla semanal (los días omitidos usan el horario por defecto)"""
+    auth_header = None
+    if request:
+        auth_header = request.headers.get("authorization") or request.headers.get("Authorization")
+
+    verify_admin_permission(auth_header)
+
+    field = get_field_or_404(db, field_id)
+    db.query(FieldWeeklyHours).filter(FieldWeeklyHours.field_id == field_id).delete()
+    for entry in schedule.days:
+        db.add(FieldWeeklyHours(field_id=field_id, **entry.dict()))
+    bump_schedule_version(field)
+    db.commit()
+    field_events.publish(field)
+    background_tasks.add_task(field_events.flush)
+
+    return get_field_schedule(field_id, db)
+
+@fields_router.put("/{field_id}/schedule/exceptions/{exception_date}", response_model=ScheduleExceptionResponse)
+def upsert_field_schedule_exception(
+    field_id: int,
+    exception_date: date,
+    exception: ScheduleExceptionBase,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    request: Request = None
+):
+    """Crear o reemplazar el horario especial de una fecha (festivo, mantenimiento...)"""
+    auth_header = None
+    if request:
+        auth_header = request.headers.get("authorization") or request.headers.get("Authorization")
+
+    verify_admin_permission(auth_header)
+
+    field = get_field_or_404(db, field_id)
+    db_exception = db.query(FieldScheduleException).filter(
+        FieldScheduleException.field_id == field_id,
+        FieldScheduleException.date == exception_date
+    ).first()
+    if not db_exception:
+        db_exception = FieldScheduleException(field_id=field_id, date=exception_date)
+        db.add(db_exception)
+
+    for key, value in exception.dict().items():
+        setattr(db_exception, key, value)
+    bump_schedule_version(field)
+    db.commit()
+    db.refresh(db_exception)
+    field_events.publish(field)
+    background_tasks.add_task(field_events.flush)
+    return db_exception
+
+@fields_router.delete("/{field_id}/schedule/exceptions/{exception_date}")
+def delete_field_schedule_exception(
+    field_id: int,
+    exception_date: date,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    request: Request = None
+):
+    auth_header = None
+    if request:
+        auth_header = request.headers.get("authorization") or request.headers.get("Authorization")
+
+    verify_admin_permission(auth_header)
+
+    field = get_field_or_404(db, field_id)
+    deleted = db.query(FieldScheduleException).filter(
+        FieldScheduleException.field_id == field_id,
+        FieldScheduleException.date == exception_date
+    ).delete()
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Excepción de horario no encontrada")
+
+    bump_schedule_version(field)
+    db.commit()
+    field_events.publish(field)
+    background_tasks.add_task(field_events.flush)
+    return {"message": f"Excepción del {exception_date} eliminada exitosamente"}
+
+@fields_router.get("/{field_id}/schedule/masks", response_model=FieldScheduleMasksResponse)
+def get_field_schedule_masks(
+    field_id: int,
+    date_from: date = Query(..., alias="from"),
+    date_to: date = Query(..., alias="to"),
+    db: Session = Depends(get_read_db)
+):
+    """Máscaras de horas abiertas por día (usadas por reservations_service para validar reservas)"""
+    if date_to < date_from:
+        raise HTTPException(status_code=400, detail="El rango de fechas es inválido")
+    if (date_to - date_from).days > 366:
+        raise HTTPException(status_code=400, detail="El rango máximo es de 366 días")
+
+    field = get_field_or_404(db, field_id)
+    masks = get_open_masks(db, field, date_from, date_to)
+
+    return FieldScheduleMasksResponse(
+        field_id=field_id,
+        schedule_version=field.schedule_version or 0,
+        days=[
+            DayOpenMask(date=day, mask=mask, open_hours=[f"{hour:02d}:00" for hour in open_hours(mask)])
+            for day, mask in sorted(masks.items())
+        ]
+    )
@@ -0,0 +1,120 @@
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, time, timedelta
+
+from sqlalchemy.orm import Session
+
+from app.models import Field, FieldWeeklyHours, FieldScheduleException
+
+HOURS_PER_DAY = 24
+SCHEDULE_CACHE_SIZE = int(os.getenv("SCHEDULE_CACHE_SIZE", "20000"))
+
+
+def compile_open_mask(opening_time: time, closing_time: time) -> int:
+    """Máscara de bits con las horas completas abiertas: el bit h indica que [h:00, h+1:00) está abierto"""
+    if opening_time is None or closing_time is None:
+        return 0
+    opening_minutes = opening_time.hour * 60 + opening_time.minute
+    closing_minutes = closing_time.hour * 60 + closing_time.minute
+    mask = 0
+    for hour in range(HOURS_PER_DAY):
+        if opening_minutes <= hour * 60 and (hour + 1) * 60 <= closing_minutes:
+            mask |= 1 << hour
+    return mask
+
+
+def open_hours(mask: int) -> list[int]:
+    """Lista de horas abiertas de una máscara"""
+    return [hour for hour in range(HOURS_PER_DAY) if mask & (1 << hour)]
+
+
+class ScheduleCache:
+    """Caché LRU de máscaras por (cancha, versión de horario, fecha)"""
+
+    # La versión de horario forma parte de la clave: editar el horario invalida
+    # las entradas anteriores en todos los procesos sin coordinación adicional
+    def __init__(self, max_entries: int = SCHEDULE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            mask = self._entries.get(key)
+            if mask is not None:
+                self._entries.move_to_end(key)
+            return mask
+
+    def set(self, key, mask: int):
+        with self._lock:
+            self._entries[key] = mask
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_field(self, field_id: int):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == field_id]:
+                del self._entries[key]
+
+
+schedule_cache = ScheduleCache()
+
+
+def get_open_masks(db: Session, field: Field, start: date, end: date) -> dict[date, int]:
+    """Máscaras de horas abiertas de una cancha para cada día de [start, end]"""
+    days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    version = field.schedule_version or 0
+    masks = {}
+    missing = []
+    for day in days:
+        mask = schedule_cache.get((field.id, version, day))
+        if mask is None:
+            missing.append(day)
+        else:
+            masks[day] = mask
+
+    if missing:
+        # Una consulta para la plantilla semanal y otra para las excepciones del rango
+        weekly = {
+            row.weekday: row
+            for row in db.query(FieldWeeklyHours).filter(FieldWeeklyHours.field_id == field.id).all()
+        }
+        exceptions = {
+            row.date: row
+            for row in db.query(FieldScheduleException).filter(
+                FieldScheduleException.field_id == field.id,
+                FieldScheduleException.date >= missing[0],
+                FieldScheduleException.date <= missing[-1]
+            ).all()
+        }
+        for day in missing:
+            mask = compile_day_mask(field, weekly.get(day.weekday()), exceptions.get(day))
+            schedule_cache.set((field.id, version, day), mask)
+            masks[day] = mask
+
+    return masks
+
+
+def get_open_mask(db: Session, field: Field, day: date) -> int:
+    return get_open_masks(db, field, day, day)[day]
+
+
+def compile_day_mask(field: Field, weekly_row, exception_row) -> int:
+    """Aplicar excepción > plantilla semanal > horario por defecto de la cancha"""
+    if exception_row is not None:
+        if exception_row.is_closed:
+            return 0
+        return compile_open_mask(exception_row.opening_time, exception_row.closing_time)
+    if weekly_row is not None:
+        if weekly_row.is_closed:
+            return 0
+        return compile_open_mask(weekly_row.opening_time, weekly_row.closing_time)
+    return compile_open_mask(field.opening_time, field.closing_time)
+
+
+def bump_schedule_version(field: Field):
+    """Marcar el horario como modificado para invalidar las máscaras en caché"""
+    field.schedule_version = (field.schedule_version or 0) + 1
+    schedule_cache.invalidate_field(field.id)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, validator
-from datetime import datetime, time
+from datetime import datetime, date, time
 from typing import Optional
 
 class FieldBase(BaseModel):
@@ -11,6 +11,8 @@ class FieldBase(BaseModel):
     opening_time: Optional[time] = time(10, 0)  
     closing_time: Optional[time] = time(22, 0)  
     is_active: Optional[bool] = True
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
 
     @validator('capacity')
     def capacity_must_be_positive(cls, v):
@@ -24,6 +26,18 @@ class FieldBase(BaseModel):
             raise ValueError('El precio por hora debe ser mayor a 0')
         return v
 
+    @validator('latitude')
+    def latitude_must_be_valid(cls, v):
+        if v is not None and not -90 <= v <= 90:
+            raise ValueError('La latitud debe estar entre -90 y 90')
+        return v
+
+    @validator('longitude')
+    def longitude_must_be_valid(cls, v):
+        if v is not None and not -180 <= v <= 180:
+            raise ValueError('La longitud debe estar entre -180 y 180')
+        return v
+
     @validator('closing_time')
     def closing_time_after_opening(cls, v, values):
         if 'opening_time' in values and v <= values['opening_time']:
@@ -42,6 +56,8 @@ class FieldUpdate(BaseModel):
     opening_time: Optional[time] = None
     closing_time: Optional[time] = None
     is_active: Optional[bool] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
 
     @validator('capacity')
     def capacity_must_be_positive(cls, v):
@@ -55,11 +71,25 @@ class FieldUpdate(BaseModel):
             raise ValueError('El precio por hora debe ser mayor a 0')
         return v
 
+    @validator('latitude')
+    def latitude_must_be_valid(cls, v):
+        if v is not None and not -90 <= v <= 90:
+            raise ValueError('La latitud debe estar entre -90 y 90')
+        return v
+
+    @validator('longitude')
+    def longitude_must_be_valid(cls, v):
+        if v is not None and not -180 <= v <= 180:
+            raise ValueError('La longitud debe estar entre -180 y 180')
+        return v
+
 class FieldResponse(FieldBase):
     id: int
     created_at: datetime
     updated_at: datetime
     created_by: Optional[int] = None
+    schedule_version: int = 0
+    version: int = 1  # También en la cabecera ETag; se envía en If-Match al editar
 
     class Config:
         from_attributes = True
@@ -68,9 +98,102 @@ class FieldAvailability(BaseModel):
     field_id: int
     date: datetime
     available_hours: list[str] 
+    is_stale: bool = False  # True si las reservas provienen del último dato conocido
 
 class FieldListResponse(BaseModel):
     fields: list[FieldResponse]
     total: int
     page: int
     size: int
+
+class FieldSearchResult(FieldResponse):
+    score: float
+
+class FieldSearchResponse(BaseModel):
+    query: str
+    fields: list[FieldSearchResult]
+    total: int
+
+class FieldNearbyResult(FieldResponse):
+    distance_km: float
+    available_hours: Optional[list[str]] = None
+
+class FieldNearbyResponse(BaseModel):
+    fields: list[FieldNearbyResult]
+    total: int
+
+class WeeklyHoursEntry(BaseModel):
+    weekday: int
+    opening_time: Optional[time] = None
+    closing_time: Optional[time] = None
+    is_closed: bool = False
+
+    class Config:
+        from_attributes = True
+
+    @validator('weekday')
+    def weekday_must_be_valid(cls, v):
+        if not 0 <= v <= 6:
+            raise ValueError('El día de la semana debe estar entre 0 (lunes) y 6 (domingo)')
+        return v
+
+    @validator('is_closed', always=True)
+    def hours_required_when_open(cls, v, values):
+        if not v:
+            opening, closing = values.get('opening_time'), values.get('closing_time')
+            if opening is None or closing is None:
+                raise ValueError('Se requieren hora de apertura y cierre para un día abierto')
+            if closing <= opening:
+                raise ValueError('La hora de cierre debe ser posterior a la hora de apertura')
+        return v
+
+class WeeklyScheduleUpdate(BaseModel):
+    days: list[WeeklyHoursEntry]
+
+    @validator('days')
+    def weekdays_must_be_unique(cls, v):
+        weekdays = [entry.weekday for entry in v]
+        if len(weekdays) != len(set(weekdays)):
+            raise ValueError('Cada día de la semana solo puede aparecer una vez')
+        return v
+
+class ScheduleExceptionBase(BaseModel):
+    is_closed: bool = True
+    opening_time: Optional[time] = None
+    closing_time: Optional[time] = None
+    reason: Optional[str] = None
+
+    @validator('closing_time', always=True)
+    def hours_required_when_open(cls, v, values):
+        if not values.get('is_closed'):
+            opening = values.get('opening_time')
+            if opening is None or v is None:
+                raise ValueError('Se requieren hora de apertura y cierre si la cancha abre ese día')
+            if v <= opening:
+                raise ValueError('La hora de cierre debe ser posterior a la hora de apertura')
+        return v
+
+class ScheduleExceptionResponse(ScheduleExceptionBase):
+    field_id: int
+    date: date
+
+    class Config:
+        from_attributes = True
+
+class FieldScheduleResponse(BaseModel):
+    field_id: int
+    schedule_version: int
+    default_opening_time: Optional[time] = None
+    default_closing_time: Optional[time] = None
+    weekly: list[WeeklyHoursEntry]
+    exceptions: list[ScheduleExceptionResponse]
+
+class DayOpenMask(BaseModel):
+    date: date
+    mask: int
+    open_hours: list[str]
+
+class FieldScheduleMasksResponse(BaseModel):
+    field_id: int
+    schedule_version: int
+    days: list[DayOpenMask]
@@ -0,0 +1,137 @@
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+
+NGRAM_SIZE = 3
+
+# Peso de cada columna en la relevancia (el nombre pesa más que la descripción)
+COLUMN_WEIGHTS = {"name": 3.0, "location": 2.0, "description": 1.0}
+
+
+def normalize_text(value: str) -> str:
+    """Pasar a minúsculas y quitar tildes para comparar textos"""
+    if not value:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", value.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokenize(value: str) -> list[str]:
+    """Separar un texto normalizado en palabras"""
+    return re.findall(r"\w+", normalize_text(value))
+
+
+def ngrams(word: str) -> set[str]:
+    """Trigramas de una palabra, con relleno igual que pg_trgm"""
+    padded = f"  {word} "
+    return {padded[i:i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1)}
+
+
+class FieldSearchIndex:
+    """Índice invertido de n-gramas en memoria para búsquedas sin PostgreSQL (p. ej. SQLite en pruebas).
+
+    Vive en el proceso que lo cargó: con varios workers, cada uno ve únicamente las altas
+    y cambios que pasaron por él hasta que se reinicia. Sirve para desarrollo y pruebas
+    con un solo proceso; en producción se usa pg_trgm.
+    """
+
+    def __init__(self, active_only: bool = True):
+        self.active_only = active_only  # Las canchas desactivadas no se indexan
+        self._lock = threading.Lock()
+        self._postings = defaultdict(set)  # n-grama -> {field_id}
+        self._documents = {}  # field_id -> {columna: [palabras]}
+        self.loaded = False
+
+    def load(self, fields):
+        """Reconstruir el índice completo a partir de las canchas de la base de datos"""
+        with self._lock:
+            self._postings.clear()
+            self._documents.clear()
+            for field in fields:
+                if field.is_active or not self.active_only:
+                    self._add(field)
+            self.loaded = True
+
+    def upsert(self, field):
+        """Reindexar una cancha creada o modificada (las desactivadas salen del índice)"""
+        with self._lock:
+            self._remove(field.id)
+            if field.is_active or not self.active_only:
+                self._add(field)
+
+    def remove(self, field_id: int):
+        with self._lock:
+            self._remove(field_id)
+
+    def _add(self, field):
+        document = {column: tokenize(getattr(field, column) or "") for column in COLUMN_WEIGHTS}
+        self._documents[field.id] = document
+        for words in document.values():
+            for word in words:
+                for gram in ngrams(word):
+                    self._postings[gram].add(field.id)
+
+    def _remove(self, field_id: int):
+        document = self._documents.pop(field_id, None)
+        if not document:
+            return
+        for words in document.values():
+            for word in words:
+                for gram in ngrams(word):
+                    postings = self._postings.get(gram)
+                    if postings is not None:
+                        postings.discard(field_id)
+                        if not postings:
+                            del self._postings[gram]
+
+    def search(self, query: str, limit: int = 10) -> list[tuple[int, float]]:
+        """Devolver [(field_id, puntuación)] ordenados por relevancia"""
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        with self._lock:
+            # Candidatos: canchas que comparten al menos un n-grama con la consulta
+            candidate_hits = defaultdict(int)
+            query_grams = set()
+            for term in terms:
+                query_grams |= ngrams(term)
+            for gram in query_grams:
+                for field_id in self._postings.get(gram, ()):
+                    candidate_hits[field_id] += 1
+
+            results = []
+            for field_id, hits in candidate_hits.items():
+                score = self._score(self._documents[field_id], terms)
+                if score > 0:
+                    results.append((field_id, score))
+
+        results.sort(key=lambda item: (-item[1], item[0]))
+        return results[:limit]
+
+    @staticmethod
+    def _score(document: dict, terms: list[str]) -> float:
+        score = 0.0
+        for term in terms:
+            term_grams = ngrams(term)
+            best = 0.0
+            for column, weight in COLUMN_WEIGHTS.items():
+                for word in document[column]:
+                    if word.startswith(term):
+                        # Coincidencia de prefijo (autocompletado)
+                        similarity = 1.0 if word == term else 0.8
+                    else:
+                        word_grams = ngrams(word)
+                        similarity = len(term_grams & word_grams) / len(term_grams | word_grams)
+                        if similarity < 0.3:
+                            continue
+                    best = max(best, similarity * weight)
+            if best == 0.0:
+                # Todas las palabras de la consulta deben coincidir
+                return 0.0
+            score += best
+        return score / len(terms)
+
+
+search_index = FieldSearchIndex()
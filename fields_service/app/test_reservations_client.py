@@ -0,0 +1,110 @@
+import asyncio
+import time
+from datetime import date
+
+import httpx
+
+from app.reservations_client import CircuitBreaker, ReservationsClient, ReservationsUnavailable
+
+def expire_open_period(breaker: CircuitBreaker):
+    """Simular que ya pasó el tiempo de espera del circuito abierto"""
+    breaker.opened_at = time.monotonic() - breaker.reset_seconds - 1
+
+def test_breaker_state_transitions():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+    assert breaker.state == "closed"
+
+    # Cerrado -> abierto al alcanzar el umbral de fallos consecutivos
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow_request()
+
+    # Abierto -> semiabierto: una sola petición de prueba
+    expire_open_period(breaker)
+    assert breaker.state == "half_open"
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+    # Prueba fallida -> abierto de nuevo
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    # Prueba sin resultado -> se permite otra prueba
+    expire_open_period(breaker)
+    assert breaker.allow_request()
+    breaker.release_trial()
+    assert breaker.state == "half_open"
+    assert breaker.allow_request()
+
+    # Prueba correcta -> cerrado
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+    print("✅ Transiciones del circuit breaker correctas")
+
+def client_with_handler(handler) -> ReservationsClient:
+    """Cliente de reservas cuyo transporte HTTP responde con handler"""
+    client = ReservationsClient("http://reservations")
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+def test_cancelled_trial_does_not_stick_half_open():
+    async def hang(request):
+        await asyncio.sleep(60)
+
+    async def booked(request):
+        return httpx.Response(200, json=[
+            {"status": "confirmada", "start_time": "2026-10-20T18:00:00", "duration_hours": 2}
+        ])
+
+    async def scenario():
+        client = client_with_handler(hang)
+        client.breaker.opened_at = time.monotonic()
+        expire_open_period(client.breaker)
+
+        # La prueba semiabierta se cancela (cliente desconectado)
+        trial = asyncio.create_task(client._fetch(1, date(2026, 10, 20)))
+        await asyncio.sleep(0.05)
+        trial.cancel()
+        try:
+            await trial
+        except asyncio.CancelledError:
+            pass
+        assert client.breaker.state == "half_open"
+
+        # La siguiente petición puede hacer de prueba y cierra el circuito
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(booked))
+        assert await client._fetch(1, date(2026, 10, 20)) == {18, 19}
+        assert client.breaker.state == "closed"
+        await client.close()
+
+    asyncio.run(scenario())
+    print("✅ Una prueba cancelada no deja el circuito semiabierto")
+
+def test_invalid_response_counts_as_failure():
+    async def garbage(request):
+        return httpx.Response(200, content=b"no es json")
+
+    async def scenario():
+        client = client_with_handler(garbage)
+        client.breaker.opened_at = time.monotonic()
+        expire_open_period(client.breaker)
+        try:
+            await client._fetch(1, date(2026, 10, 20))
+            assert False, "Se esperaba ReservationsUnavailable"
+        except ReservationsUnavailable:
+            pass
+        assert client.breaker.state == "open"
+        await client.close()
+
+    asyncio.run(scenario())
+    print("✅ Una respuesta inválida reabre el circuito")
+
+if __name__ == "__main__":
+    test_breaker_state_transitions()
+    test_cancelled_trial_does_not_stick_half_open()
+    test_invalid_response_counts_as_failure()
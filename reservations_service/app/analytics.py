@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import and_, event, func, or_
+from sqlalchemy.orm import Session
+
+from app.models import OccupancyRollup, Reservation, ReservationStatus
+
+# Rangos más largos que esto se leen de occupancy_rollup (meses completos) en lugar de reservations
+HEATMAP_RAW_MAX_DAYS = int(os.getenv("HEATMAP_RAW_MAX_DAYS", "92"))
+
+# Caché por (cancha, rango): se invalida al escribir reservas de la cancha y caduca por si
+# la escritura ocurrió en otra réplica del servicio
+HEATMAP_CACHE_TTL_SECONDS = float(os.getenv("HEATMAP_CACHE_TTL_SECONDS", "300"))
+HEATMAP_CACHE_MAX_ENTRIES = int(os.getenv("HEATMAP_CACHE_MAX_ENTRIES", "1000"))
+
+_cache_lock = threading.Lock()
+_heatmap_cache = {}  # (field_id, date_from, date_to) -> (generación, instante, resultado)
+_generations = {}  # field_id (None = todas las canchas) -> escrituras vistas
+_epoch = 0  # Se incrementa al invalidar todos los mapas (recálculo completo)
+
+# Canchas cuyos mapas se invalidan cuando la sesión confirme la transacción
+PENDING_HEATMAP_INVALIDATIONS = "pending_heatmap_invalidations"
+
+
+def invalidate_heatmap(field_id: int = None):
+    """Invalidar los mapas de una cancha (y los de todas las canchas); None invalida todos"""
+    global _epoch
+    with _cache_lock:
+        if field_id is None:
+            _epoch += 1
+            _heatmap_cache.clear()
+            return
+        _generations[field_id] = _generations.get(field_id, 0) + 1
+        _generations[None] = _generations.get(None, 0) + 1
+
+
+def invalidate_heatmap_on_commit(db: Session, field_id: int = None):
+    """invalidate_heatmap tras el commit: antes, una lectura concurrente guardaría el mapa sin la escritura"""
+    db.info.setdefault(PENDING_HEATMAP_INVALIDATIONS, set()).add(field_id)
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_pending_heatmaps(session):
+    for field_id in session.info.pop(PENDING_HEATMAP_INVALIDATIONS, ()):
+        invalidate_heatmap(field_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_pending_heatmaps(session):
+    session.info.pop(PENDING_HEATMAP_INVALIDATIONS, None)
+
+
+def weekday_hour_columns(db: Session):
+    """Día de la semana (0 = domingo) y hora de inicio según el dialecto"""
+    if db.get_bind().dialect.name == "postgresql":
+        return func.extract("dow", Reservation.start_time), func.extract("hour", Reservation.start_time)
+    return func.strftime("%w", Reservation.start_time), func.strftime("%H", Reservation.start_time)
+
+
+def add_raw_occupancy(db: Session, matrix: list, field_id: int, ranges: list):
+    """Sumar al mapa las reservas confirmadas de los rangos [inicio, fin) con una sola consulta agrupada"""
+    if not ranges:
+        return
+    dow, hour = weekday_hour_columns(db)
+    query = db.query(
+        dow.label("dow"), hour.label("hour"), Reservation.duration_hours, func.count(Reservation.id).label("reservations")
+    ).filter(
+        Reservation.status == ReservationStatus.CONFIRMADA,
+        or_(*[and_(Reservation.start_time >= start, Reservation.start_time < end) for start, end in ranges])
+    )
+    if field_id is not None:
+        query = query.filter(Reservation.field_id == field_id)
+
+    for row in query.group_by(dow, hour, Reservation.duration_hours).all():
+        weekday = (int(row.dow) + 6) % 7
+        start_hour = int(row.hour)
+        # Una reserva de 2 horas ocupa su hora de inicio y la siguiente
+        for hour_index in range(start_hour, min(start_hour + row.duration_hours, 24)):
+            matrix[weekday][hour_index] += row.reservations
+
+
+def add_rollup_occupancy(db: Session, matrix: list, field_id: int, month_from: date, month_to: date):
+    """Sumar al mapa los meses [month_from, month_to) desde occupancy_rollup"""
+    query = db.query(
+        OccupancyRollup.weekday, OccupancyRollup.hour, func.sum(OccupancyRollup.booked_hours).label("booked_hours")
+    ).filter(OccupancyRollup.month >= month_from, OccupancyRollup.month < month_to)
+    if field_id is not None:
+        query = query.filter(OccupancyRollup.field_id == field_id)
+    for row in query.group_by(OccupancyRollup.weekday, OccupancyRollup.hour).all():
+        matrix[row.weekday][row.hour] += int(row.booked_hours or 0)
+
+
+def weekday_counts(date_from: date, date_to: date) -> list:
+    """Cuántas veces aparece cada día de la semana (0 = lunes) en el rango"""
+    full_weeks, remainder = divmod((date_to - date_from).days + 1, 7)
+    counts = [full_weeks] * 7
+    for offset in range(remainder):
+        counts[(date_from.weekday() + offset) % 7] += 1
+    return counts
+
+
+def compute_heatmap(db: Session, field_id: int, date_from: date, date_to: date) -> dict:
+    """Matriz densa 7 x 24 (lunes primero) de horas reservadas entre date_from y date_to"""
+    matrix = [[0] * 24 for _ in range(7)]
+    range_start = datetime.combine(date_from, datetime.min.time())
+    range_end = datetime.combine(date_to + timedelta(days=1), datetime.min.time())
+
+    if (date_to - date_from).days < HEATMAP_RAW_MAX_DAYS:
+        source = "reservations"
+        add_raw_occupancy(db, matrix, field_id, [(range_start, range_end)])
+    else:
+        # Meses completos desde el rollup; los extremos sueltos desde reservations
+        source = "occupancy_rollup"
+        first_month = date_from if date_from.day == 1 else (date_from.replace(day=1) + timedelta(days=32)).replace(day=1)
+        next_day = date_to + timedelta(days=1)
+        end_month = next_day if next_day.day == 1 else date_to.replace(day=1)
+        add_rollup_occupancy(db, matrix, field_id, first_month, end_month)
+        edges = [
+            (start, end) for start, end in (
+                (range_start, datetime.combine(first_month, datetime.min.time())),
+                (datetime.combine(end_month, datetime.min.time()), range_end),
+            ) if start < end
+        ]
+        add_raw_occupancy(db, matrix, field_id, edges)
+
+    return {
+        "field_id": field_id,
+        "date_from": date_from,
+        "date_to": date_to,
+        "source": source,
+        "booked_hours": matrix,
+        "weekday_days": weekday_counts(date_from, date_to),
+    }
+
+
+def get_heatmap(db: Session, field_id: int, date_from: date, date_to: date) -> dict:
+    """compute_heatmap con caché por (cancha, rango)"""
+    key = (field_id, date_from, date_to)
+    with _cache_lock:
+        # Tomada antes de calcular: una invalidación durante el cálculo deja obsoleto el resultado
+        generation = (_epoch, _generations.get(field_id, 0))
+        cached = _heatmap_cache.get(key)
+    if cached and cached[0] == generation and time.monotonic() - cached[1] < HEATMAP_CACHE_TTL_SECONDS:
+        return cached[2]
+
+    result = compute_heatmap(db, field_id, date_from, date_to)
+    with _cache_lock:
+        if len(_heatmap_cache) >= HEATMAP_CACHE_MAX_ENTRIES:
+            _heatmap_cache.pop(next(iter(_heatmap_cache)))
+        _heatmap_cache[key] = (generation, time.monotonic(), result)
+    return result
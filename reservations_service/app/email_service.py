@@ -12,18 +12,37 @@ class EmailService:
         self.email_password = os.getenv("EMAIL_PASSWORD")
         self.from_email = os.getenv("FROM_EMAIL", self.email_user)
 
+    def build_message(self, to_email: str, subject: str, body: str, is_html: bool = True):
+        """Construye el mensaje MIME de un email"""
+        msg = MIMEMultipart("alternative")
+        msg["Subject"] = subject
+        msg["From"] = self.from_email
+        msg["To"] = to_email
+
+        if is_html:
+            msg.attach(MIMEText(body, "html"))
+        else:
+            msg.attach(MIMEText(body, "plain"))
+        return msg
+
+    def render(self, kind: str, payload: dict):
+        """Asunto y cuerpo de un email de la outbox según su tipo"""
+        if kind == "create":
+            return self.render_reservation_confirmation(payload)
+        if kind == "cancel":
+            return self.render_reservation_cancellation(payload, payload.get("reason"))
+        if kind == "series":
+            return self.render_reservation_series_confirmation(payload)
+        if kind == "reminder":
+            return self.render_reservation_reminder(payload)
+        if kind == "waitlist_offer":
+            return self.render_waitlist_offer(payload)
+        raise ValueError(f"Tipo de email desconocido: {kind}")
+
     def send_email(self, to_email: str, subject: str, body: str, is_html: bool = True):
         """Envía un email"""
         try:
-            msg = MIMEMultipart("alternative")
-            msg["Subject"] = subject
-            msg["From"] = self.from_email
-            msg["To"] = to_email
-
-            if is_html:
-                msg.attach(MIMEText(body, "html"))
-            else:
-                msg.attach(MIMEText(body, "plain"))
+            msg = self.build_message(to_email, subject, body, is_html)
 
             with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
                 server.starttls()
@@ -35,8 +54,8 @@ class EmailService:
             print(f"Error enviando email: {e}")
             return False
 
-    def send_reservation_confirmation(self, user_email: str, reservation_data: dict):
-        """Envía email de confirmación de reserva"""
+    def render_reservation_confirmation(self, reservation_data: dict):
+        """Asunto y cuerpo del email de confirmación de reserva"""
         subject = "Confirmación de Reserva - AgendaGol"
         
         body = f"""
@@ -67,10 +86,10 @@ class EmailService:
         </html>
         """
         
-        return self.send_email(user_email, subject, body)
+        return subject, body
 
-    def send_reservation_cancellation(self, user_email: str, reservation_data: dict, reason: str = None):
-        """Envía email de cancelación de reserva"""
+    def render_reservation_cancellation(self, reservation_data: dict, reason: str = None):
+        """Asunto y cuerpo del email de cancelación de reserva"""
         subject = "Cancelación de Reserva - AgendaGol"
         
         reason_text = f"<p><strong>Motivo:</strong> {reason}</p>" if reason else ""
@@ -102,4 +121,116 @@ class EmailService:
         </html>
         """
         
-        return self.send_email(user_email, subject, body)
+        return subject, body
+
+    def render_reservation_series_confirmation(self, series_data: dict):
+        """Asunto y cuerpo del email de resumen de una serie de reservas recurrentes"""
+        subject = "Confirmación de Reservas Recurrentes - AgendaGol"
+        
+        dates_html = "".join(
+            f"<li>{start_time} (Reserva #{reservation_id})</li>"
+            for reservation_id, start_time in series_data.get('occurrences', [])
+        )
+        skipped_html = ""
+        if series_data.get('skipped'):
+            skipped_items = "".join(
+                f"<li>{start_time}: {reason}</li>" for start_time, reason in series_data['skipped']
+            )
+            skipped_html = f"<p><strong>Fechas no reservadas:</strong></p><ul>{skipped_items}</ul>"
+        
+        body = f"""
+        <html>
+            <body>
+                <h2>¡Reservas Recurrentes Confirmadas!</h2>
+                <p>Hola,</p>
+                <p>Tu serie de reservas ha sido confirmada con los siguientes detalles:</p>
+                
+                <div style="border: 1px solid #ddd; padding: 15px; margin: 15px 0; background-color: #f9f9f9;">
+                    <h3>Detalles de la Serie</h3>
+                    <p><strong>Cancha:</strong> {series_data.get('field_name')}</p>
+                    <p><strong>Ubicación:</strong> {series_data.get('field_location')}</p>
+                    <p><strong>Duración:</strong> {series_data.get('duration_hours')} hora(s) por reserva</p>
+                    <p><strong>Precio Total:</strong> ${series_data.get('total_price')}</p>
+                    <p><strong>Fechas reservadas:</strong></p>
+                    <ul>{dates_html}</ul>
+                    {skipped_html}
+                </div>
+                
+                <p>Por favor, llega 10 minutos antes de tu horario reservado.</p>
+                <p>Puedes cancelar cualquiera de las reservas desde nuestra plataforma.</p>
+                
+                <p>¡Gracias por elegir AgendaGol!</p>
+                
+                <hr>
+                <small>Este es un email automático, por favor no responder.</small>
+            </body>
+        </html>
+        """
+        
+        return subject, body
+
+    def render_reservation_reminder(self, reservation_data: dict):
+        """Asunto y cuerpo del recordatorio de una reserva próxima"""
+        subject = "Recordatorio de Reserva - AgendaGol"
+        
+        body = f"""
+        <html>
+            <body>
+                <h2>¡Tu partido se acerca!</h2>
+                <p>Hola,</p>
+                <p>Te recordamos que tienes una reserva próximamente:</p>
+                
+                <div style="border: 1px solid #ddd; padding: 15px; margin: 15px 0; background-color: #f9f9f9;">
+                    <h3>Detalles de la Reserva</h3>
+                    <p><strong>Cancha:</strong> {reservation_data.get('field_name')}</p>
+                    <p><strong>Ubicación:</strong> {reservation_data.get('field_location')}</p>
+                    <p><strong>Fecha y Hora:</strong> {reservation_data.get('start_time')}</p>
+                    <p><strong>Duración:</strong> {reservation_data.get('duration_hours')} hora(s)</p>
+                    <p><strong>ID de Reserva:</strong> #{reservation_data.get('id')}</p>
+                </div>
+                
+                <p>Por favor, llega 10 minutos antes de tu horario reservado.</p>
+                <p>Si no puedes asistir, cancela tu reserva desde nuestra plataforma para liberar la cancha.</p>
+                
+                <p>¡Gracias por elegir AgendaGol!</p>
+                
+                <hr>
+                <small>Este es un email automático, por favor no responder.</small>
+            </body>
+        </html>
+        """
+        
+        return subject, body
+
+    def render_waitlist_offer(self, offer_data: dict):
+        """Asunto y cuerpo del aviso de horario liberado para la lista de espera"""
+        subject = "¡Se liberó tu horario! - AgendaGol"
+        
+        body = f"""
+        <html>
+            <body>
+                <h2>¡El horario que esperabas está disponible!</h2>
+                <p>Hola,</p>
+                <p>Se canceló una reserva y te hemos guardado el horario de tu lista de espera:</p>
+                
+                <div style="border: 1px solid #ddd; padding: 15px; margin: 15px 0; background-color: #f2fff2;">
+                    <h3>Detalles del Horario</h3>
+                    <p><strong>Cancha:</strong> {offer_data.get('field_name')}</p>
+                    <p><strong>Ubicación:</strong> {offer_data.get('field_location')}</p>
+                    <p><strong>Fecha y Hora:</strong> {offer_data.get('start_time')}</p>
+                    <p><strong>Duración:</strong> {offer_data.get('duration_hours')} hora(s)</p>
+                    <p><strong>Precio Total:</strong> ${offer_data.get('total_price')}</p>
+                    <p><strong>Retención:</strong> #{offer_data.get('hold_id')}, válida hasta {offer_data.get('expires_at')}</p>
+                </div>
+                
+                <p>Confirma la reserva desde nuestra plataforma antes de que caduque la retención.</p>
+                
+                <p>¡Gracias por elegir AgendaGol!</p>
+                
+                <hr>
+                <small>Este es un email automático, por favor no responder.</small>
+            </body>
+        </html>
+        """
+        
+        return subject, body
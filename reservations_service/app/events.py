@@ -0,0 +1,167 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+# Canal de Redis para repartir los eventos entre réplicas; sin REDIS_URL solo se
+# notifica a los clientes conectados a este proceso
+REDIS_URL = os.getenv("REDIS_URL")
+SLOT_EVENTS_CHANNEL = os.getenv("SLOT_EVENTS_CHANNEL", "reservations:slots")
+
+# Eventos pendientes por cliente antes de cortar su conexión (cliente lento)
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "100"))
+SSE_MAX_SUBSCRIBERS = int(os.getenv("SSE_MAX_SUBSCRIBERS", "5000"))
+
+# Comentario periódico para que proxies y balanceadores no cierren conexiones inactivas
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+
+logger = logging.getLogger(__name__)
+
+SLOT_BOOKED = "slot_booked"
+SLOT_FREED = "slot_freed"
+SLOT_HELD = "slot_held"
+
+
+def slot_event(kind: str, field_id: int, start_time: datetime, end_time: datetime, expires_at: datetime = None) -> dict:
+    """Cambio de ocupación de un horario; sin datos del usuario"""
+    event = {
+        "type": kind,
+        "field_id": field_id,
+        "date": start_time.date().isoformat(),
+        "start_time": start_time.isoformat(),
+        "end_time": end_time.isoformat(),
+    }
+    if expires_at is not None:
+        event["expires_at"] = expires_at.isoformat()
+    return event
+
+
+class Subscription:
+    """Cliente SSE conectado con sus filtros de cancha y fecha"""
+
+    def __init__(self, field_ids: Optional[set], day: Optional[str]):
+        self.field_ids = field_ids
+        self.day = day
+        self.queue = asyncio.Queue(maxsize=SSE_QUEUE_SIZE)
+        self.dropped = False
+
+    def matches(self, event: dict) -> bool:
+        if self.field_ids is not None and event["field_id"] not in self.field_ids:
+            return False
+        return self.day is None or event["date"] == self.day
+
+
+class SlotBroadcaster:
+    """Reparte los eventos de horarios a los clientes SSE de este proceso y, con Redis, al resto de réplicas"""
+
+    def __init__(self, redis_url: str = None):
+        self.redis_url = redis_url
+        self.subscriptions = set()
+        self._loop = None
+        self._redis = None
+        self._listener = None
+        self._stopping = threading.Event()
+
+    def subscribe(self, field_ids: Optional[set], day: Optional[str]) -> Subscription:
+        if len(self.subscriptions) >= SSE_MAX_SUBSCRIBERS:
+            raise OverflowError("Demasiados clientes conectados")
+        # Las publicaciones llegan desde hilos (rutas síncronas y Redis): se entregan en este loop
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(field_ids, day)
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self.subscriptions.discard(subscription)
+
+    def _deliver(self, event: dict):
+        for subscription in list(self.subscriptions):
+            if not subscription.matches(event):
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Mejor cortar y que el cliente recargue que retener memoria sin límite
+                subscription.dropped = True
+
+    def deliver_local(self, event: dict):
+        """Entregar un evento a los clientes de este proceso desde cualquier hilo"""
+        loop = self._loop
+        if loop is None or loop.is_closed() or not self.subscriptions:
+            return
+        loop.call_soon_threadsafe(self._deliver, event)
+
+    def publish(self, *events: dict):
+        """Publicar eventos tras confirmar la transacción"""
+        if self._redis is not None:
+            try:
+                for event in events:
+                    self._redis.publish(SLOT_EVENTS_CHANNEL, json.dumps(event))
+                # El listener de cada réplica (también esta) los entrega a sus clientes
+                return
+            except Exception as e:
+                logger.warning(f"Error publicando en Redis, solo se notifica a este proceso: {e}")
+        for event in events:
+            self.deliver_local(event)
+
+    def _listen(self):
+        while not self._stopping.is_set():
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(SLOT_EVENTS_CHANNEL)
+                while not self._stopping.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is not None:
+                        self.deliver_local(json.loads(message["data"]))
+                pubsub.close()
+            except Exception as e:
+                logger.warning(f"Error escuchando eventos de Redis: {e}")
+                time.sleep(1)
+
+    def start(self):
+        """Conectar con Redis (opcional) y escuchar los eventos de las demás réplicas"""
+        if not self.redis_url:
+            return
+        try:
+            import redis
+        except ImportError:
+            logger.warning("Paquete redis no instalado: eventos solo para este proceso")
+            return
+        self._redis = redis.Redis.from_url(self.redis_url)
+        self._stopping.clear()
+        self._listener = threading.Thread(target=self._listen, name="slot-events", daemon=True)
+        self._listener.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._listener is not None:
+            self._listener.join(timeout=2)
+        if self._redis is not None:
+            self._redis.close()
+            self._redis = None
+
+
+slot_broadcaster = SlotBroadcaster(REDIS_URL)
+
+
+
+async def slot_event_stream(request, subscription: Subscription):
+    """Cuerpo text/event-stream de un cliente hasta que se desconecta o se queda atrás"""
+    try:
+        # Espera del navegador antes de reconectar tras un corte
+        yield "retry: 3000\n\n"
+        while not subscription.dropped:
+            if await request.is_disconnected():
+                break
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    finally:
+        slot_broadcaster.unsubscribe(subscription)
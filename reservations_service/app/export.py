@@ -0,0 +1,65 @@
+import csv
+import io
+import json
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import select
+
+from app.database import ReadSessionLocal
+from app.models import Reservation
+from app.partitions import serialize_value
+
+# Filas leídas por viaje al cursor del servidor y por bloque enviado al cliente
+EXPORT_CHUNK_ROWS = 1000
+
+EXPORT_COLUMNS = [
+    Reservation.id, Reservation.user_id, Reservation.field_id, Reservation.field_name,
+    Reservation.field_location, Reservation.start_time, Reservation.end_time,
+    Reservation.duration_hours, Reservation.total_price, Reservation.status,
+    Reservation.notes, Reservation.series_id, Reservation.created_at,
+    Reservation.cancelled_at, Reservation.cancelled_by
+]
+EXPORT_HEADER = [column.key for column in EXPORT_COLUMNS]
+
+
+def export_query(date_from: date = None, date_to: date = None, status=None):
+    """Consulta Core (sin objetos ORM) de las reservas a exportar, por día de juego"""
+    query = select(*EXPORT_COLUMNS).order_by(Reservation.start_time, Reservation.id)
+    if date_from is not None:
+        query = query.where(Reservation.start_time >= datetime.combine(date_from, time.min))
+    if date_to is not None:
+        query = query.where(Reservation.start_time < datetime.combine(date_to + timedelta(days=1), time.min))
+    if status is not None:
+        query = query.where(Reservation.status == status)
+    return query
+
+
+def stream_rows(query):
+    """Filas en bloques desde un cursor de servidor; la sesión propia vive lo que dura la respuesta"""
+    db = ReadSessionLocal()
+    try:
+        result = db.connection().execution_options(stream_results=True, yield_per=EXPORT_CHUNK_ROWS).execute(query)
+        for rows in result.partitions():
+            yield rows
+    finally:
+        db.close()
+
+
+def export_csv(query):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_HEADER)
+    for rows in stream_rows(query):
+        writer.writerows([serialize_value(value) for value in row] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_ndjson(query):
+    for rows in stream_rows(query):
+        yield "".join(
+            json.dumps(dict(zip(EXPORT_HEADER, (serialize_value(value) for value in row)))) + "\n"
+            for row in rows
+        )
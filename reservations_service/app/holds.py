@@ -0,0 +1,43 @@
+import os
+from datetime import datetime
+
+from sqlalchemy.orm import Session
+
+from app.models import ReservationHold, WaitlistEntry, WaitlistStatus
+
+# Duración de una retención y frecuencia del barrido de retenciones caducadas
+HOLD_TTL_SECONDS = int(os.getenv("HOLD_TTL_SECONDS", "300"))
+HOLD_SWEEP_INTERVAL_SECONDS = float(os.getenv("HOLD_SWEEP_INTERVAL_SECONDS", "60"))
+
+
+def active_holds_query(db: Session, field_id: int, start_time: datetime, end_time: datetime):
+    """Retenciones vigentes de una cancha que se solapan con [start_time, end_time)"""
+    return db.query(ReservationHold).filter(
+        ReservationHold.field_id == field_id,
+        ReservationHold.start_time < end_time,
+        ReservationHold.end_time > start_time,
+        ReservationHold.expires_at > datetime.now()
+    )
+
+
+def find_conflicting_hold(db: Session, field_id: int, start_time: datetime, end_time: datetime, user_id: int = None):
+    """Primera retención vigente de otro usuario que se solapa con el intervalo"""
+    query = active_holds_query(db, field_id, start_time, end_time)
+    if user_id is not None:
+        query = query.filter(ReservationHold.user_id != user_id)
+    return query.first()
+
+
+def purge_expired_holds(db: Session) -> str:
+    """Tarea periódica: borrar las retenciones caducadas (las consultas ya las ignoran)"""
+    # Las ofertas de la lista de espera las borra expire_waitlist_entries al pasar el horario al siguiente
+    offered = db.query(WaitlistEntry.id).filter(
+        WaitlistEntry.hold_id == ReservationHold.id,
+        WaitlistEntry.status == WaitlistStatus.OFRECIDA
+    ).exists()
+    deleted = db.query(ReservationHold).filter(
+        ReservationHold.expires_at <= datetime.now(),
+        ~offered
+    ).delete(synchronize_session=False)
+    db.commit()
+    return f"{deleted} retenciones caducadas borradas"
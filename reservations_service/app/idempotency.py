@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session
+
+from app.models import IdempotencyKey
+
+# Tiempo durante el que un reintento con la misma clave devuelve la respuesta guardada
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+
+def sha256_hex(*parts: str) -> str:
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+class IdempotentRequest:
+    """Petición con Idempotency-Key: la clave vale solo para el mismo token y la misma operación"""
+
+    def __init__(self, auth_header: str, operation: str, key: str, payload: dict):
+        # Solo se guardan hashes: ni el token ni la clave quedan en la base de datos
+        self.key_hash = sha256_hex(auth_header or "", operation, key)
+        self.request_hash = sha256_hex(json.dumps(payload, sort_keys=True, default=str))
+
+    def replay(self, db: Session) -> Optional[JSONResponse]:
+        """Respuesta guardada para esta clave, o None si hay que ejecutar la petición"""
+        stored = db.get(IdempotencyKey, self.key_hash)
+        if stored is None:
+            return None
+        if stored.expires_at <= datetime.now():
+            # Clave caducada: se libera para esta petición
+            db.delete(stored)
+            db.flush()
+            return None
+        if stored.request_hash != self.request_hash:
+            raise HTTPException(status_code=422, detail="La clave de idempotencia ya se usó con otra petición")
+        return JSONResponse(
+            status_code=stored.status_code,
+            content=stored.response,
+            headers={"Idempotent-Replayed": "true"}
+        )
+
+    def claim(self, db: Session):
+        """Reservar la clave en la transacción actual.
+
+        Si otra petición con la misma clave está en curso, el INSERT espera a que
+        termine y falla con IntegrityError si se confirmó: el llamador hace rollback
+        y devuelve su respuesta con replay().
+        """
+        self.record = IdempotencyKey(
+            key_hash=self.key_hash,
+            request_hash=self.request_hash,
+            expires_at=datetime.now() + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+        )
+        db.add(self.record)
+        db.flush()
+
+    def replay_after_conflict(self, db: Session) -> Optional[JSONResponse]:
+        """Tras un IntegrityError: respuesta de la petición concurrente con la misma clave, si la hubo"""
+        db.rollback()
+        return self.replay(db)
+
+    def store(self, response: dict, status_code: int = 200):
+        """Guardar la respuesta; se confirma junto con la operación"""
+        self.record.status_code = status_code
+        self.record.response = response
+
+
+def idempotent_request(request: Request, auth_header: str, operation: str, payload: dict) -> Optional[IdempotentRequest]:
+    """IdempotentRequest si la petición trae la cabecera Idempotency-Key"""
+    if request is None:
+        return None
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not key:
+        return None
+    if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(status_code=400, detail="Idempotency-Key demasiado larga")
+    return IdempotentRequest(auth_header, operation, key, payload)
+
+
+def purge_expired_idempotency_keys(db: Session) -> str:
+    """Tarea periódica: borrar las claves caducadas"""
+    deleted = db.query(IdempotencyKey).filter(
+        IdempotencyKey.expires_at <= datetime.now()
+    ).delete(synchronize_session=False)
+    db.commit()
+    return f"{deleted} claves de idempotencia caducadas borradas"
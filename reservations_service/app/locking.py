@@ -0,0 +1,36 @@
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# Código SQLSTATE de PostgreSQL para violaciones de restricciones EXCLUDE
+EXCLUSION_VIOLATION = "23P01"
+
+# Primer entero de pg_advisory_xact_lock(clave, field_id): separa estos locks de otros usos
+FIELD_LOCK_NAMESPACE = 7301
+
+_registry_lock = threading.Lock()
+_field_locks = defaultdict(threading.Lock)
+
+
+@contextmanager
+def field_booking_lock(db: Session, field_id: int):
+    """Serializar la verificación de solapamiento y la escritura de reservas y retenciones de una cancha"""
+    if db.get_bind().dialect.name == "postgresql":
+        # Lock por cancha hasta el fin de la transacción: las retenciones caducan con el
+        # tiempo y no pueden expresarse en una restricción EXCLUDE. La de reservations
+        # (reservations_no_overlap) sigue como última garantía para las reservas.
+        db.execute(
+            text("SELECT pg_advisory_xact_lock(:namespace, :field_id)"),
+            {"namespace": FIELD_LOCK_NAMESPACE, "field_id": field_id}
+        )
+        yield
+        return
+
+    # Alternativa para SQLite (un solo proceso): un lock por cancha
+    with _registry_lock:
+        lock = _field_locks[field_id]
+    with lock:
+        yield
@@ -1,7 +1,13 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy.orm.exc import StaleDataError
 from app.routes import reservations_router
 from app.database import init_db
+from app.db_common import pool_metrics_text, pool_status
+from app.service_clients import close_async_client
+from app.events import slot_broadcaster
+from app.concurrency import STALE_WRITE_DETAIL
 
 app = FastAPI(title="Reservations Management Service")
 
@@ -18,6 +24,36 @@ app.add_middleware(
 
 app.include_router(reservations_router, prefix="/reservations", tags=["Reservations"])
 
+@app.exception_handler(StaleDataError)
+async def stale_data_handler(request: Request, exc: StaleDataError):
+    # Otra petición confirmó antes una versión nueva de la fila: no se pisa su cambio
+    return JSONResponse(status_code=409, content={"detail": STALE_WRITE_DETAIL})
+
+@app.on_event("startup")
+def start_slot_events():
+    slot_broadcaster.start()
+
+@app.on_event("shutdown")
+async def shutdown_http_client():
+    await close_async_client()
+    slot_broadcaster.stop()
+
 @app.get("/health")
 def health_check():
-    return {"status": "healthy", "service": "reservations_service"}
\ No newline at end of file
+    return {"status": "healthy", "service": "reservations_service"}
+
+@app.get("/ready")
+def readiness_check():
+    """Sonda del balanceador: 503 con el pool de conexiones agotado para que desvíe tráfico"""
+    pools = pool_status()
+    if any(pool["exhausted"] for pool in pools):
+        return JSONResponse(
+            status_code=503,
+            content={"status": "exhausted", "service": "reservations_service", "pools": pools},
+            headers={"Retry-After": "1"}
+        )
+    return {"status": "ready", "service": "reservations_service", "pools": pools}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(pool_metrics_text(), media_type="text/plain; version=0.0.4")
@@ -1,14 +1,52 @@
-from sqlalchemy import Column, Integer, String, DateTime, Enum, Float, Text
+from sqlalchemy import Column, Integer, String, DateTime, Date, Enum, Float, Text, Boolean, Index, JSON
 from sqlalchemy.sql import func
 from app.database import Base
 import enum
 
+# DDL exclusivo de PostgreSQL que create_all no puede expresar. El enum se guarda
+# por nombre, de ahí 'CONFIRMADA' en la condición de la restricción.
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS btree_gist",
+    "ALTER TABLE reservations ADD COLUMN IF NOT EXISTS period tsrange "
+    "GENERATED ALWAYS AS (tsrange(start_time, end_time, '[)')) STORED",
+    # En la tabla particionada la restricción se crea en cada partición (app/partitions.py)
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'reservations_no_overlap')
+           AND (SELECT relkind FROM pg_class WHERE oid = 'reservations'::regclass) <> 'p' THEN
+            ALTER TABLE reservations ADD CONSTRAINT reservations_no_overlap
+                EXCLUDE USING gist (field_id WITH =, period WITH &&) WHERE (status = 'CONFIRMADA');
+        END IF;
+    END $$
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_reservations_field_status_start ON reservations (field_id, status, start_time)",
+    "ALTER TABLE reservations ADD COLUMN IF NOT EXISTS series_id VARCHAR",
+    "CREATE INDEX IF NOT EXISTS ix_reservations_series_id ON reservations (series_id)",
+    "CREATE INDEX IF NOT EXISTS ix_reservations_user_created ON reservations (user_id, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_reservations_created ON reservations (created_at, id)",
+    "ALTER TABLE reservations ADD COLUMN IF NOT EXISTS reminded_at TIMESTAMP",
+    "CREATE INDEX IF NOT EXISTS ix_reservations_status_start ON reservations (status, start_time)",
+    "ALTER TABLE reservations ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1",
+    "ALTER TABLE field_snapshots ADD COLUMN IF NOT EXISTS field_version INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE email_outbox ADD COLUMN IF NOT EXISTS leased_until TIMESTAMP",
+]
+
 class ReservationStatus(enum.Enum):
     CONFIRMADA = "confirmada"
     CANCELADA = "cancelada"
 
 class Reservation(Base):
     __tablename__ = "reservations"
+    __table_args__ = (
+        # Consultas de disponibilidad y solapamiento: cancha + estado + rango de inicio
+        Index("ix_reservations_field_status_start", "field_id", "status", "start_time"),
+        # Listados paginados por cursor (created_at, id), del usuario o de todos
+        Index("ix_reservations_user_created", "user_id", "created_at", "id"),
+        Index("ix_reservations_created", "created_at", "id"),
+        # Recordatorios: reservas confirmadas que empiezan en la próxima ventana
+        Index("ix_reservations_status_start", "status", "start_time"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, nullable=False, index=True)  # ID del usuario que hace la reserva
@@ -27,12 +65,19 @@ class Reservation(Base):
     # Estado y metadatos
     status = Column(Enum(ReservationStatus), default=ReservationStatus.CONFIRMADA, nullable=False)
     notes = Column(Text, nullable=True)
+    series_id = Column(String, nullable=True, index=True)  # Reservas recurrentes creadas juntas
     
     # Timestamps
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     cancelled_at = Column(DateTime, nullable=True)
     cancelled_by = Column(Integer, nullable=True)  # ID del usuario que canceló
+    reminded_at = Column(DateTime, nullable=True)  # Envío del recordatorio previo a la reserva
+
+    # Control de concurrencia optimista: cada UPDATE del ORM exige la versión leída y la incrementa
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
+    __mapper_args__ = {"version_id_col": version}
 
     def __repr__(self):
         return f"<Reservation(id={self.id}, user_id={self.user_id}, field_id={self.field_id}, status={self.status.value})>"
@@ -48,3 +93,161 @@ class Reservation(Base):
         """Verifica si la reserva puede ser cancelada (está confirmada y no ha empezado)"""
         from datetime import datetime
         return self.status == ReservationStatus.CONFIRMADA and self.start_time > datetime.now()
+
+
+class FieldSnapshot(Base):
+    """Copia local de los datos de una cancha, alimentada por los eventos de fields_service"""
+    __tablename__ = "field_snapshots"
+
+    field_id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    location = Column(String, nullable=False)
+    price_per_hour = Column(Float, nullable=False)
+    is_active = Column(Boolean, default=True, nullable=False)
+    schedule_version = Column(Integer, default=0, nullable=False)
+    field_version = Column(Integer, default=0, nullable=False)  # Columna version de la cancha en fields_service
+    refreshed_at = Column(DateTime, default=func.now(), nullable=False)
+
+    def to_field_info(self) -> dict:
+        """Mismo formato que la respuesta de GET /fields/{id}"""
+        return {
+            "id": self.field_id,
+            "name": self.name,
+            "location": self.location,
+            "price_per_hour": self.price_per_hour,
+            "is_active": self.is_active,
+        }
+
+
+class DailyRollup(Base):
+    """Totales diarios por cancha (día de juego), actualizados en la misma transacción que las reservas"""
+    __tablename__ = "daily_rollup"
+
+    field_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    bookings = Column(Integer, default=0, nullable=False)  # Reservas confirmadas
+    cancellations = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0, nullable=False)  # Ingresos de reservas confirmadas
+    booked_hours = Column(Integer, default=0, nullable=False)
+
+
+class OccupancyRollup(Base):
+    """Reservas confirmadas que ocupan cada hora, por cancha, mes y día de la semana (mapa de ocupación)"""
+    __tablename__ = "occupancy_rollup"
+
+    field_id = Column(Integer, primary_key=True)
+    month = Column(Date, primary_key=True)  # Primer día del mes
+    weekday = Column(Integer, primary_key=True)  # 0 = lunes
+    hour = Column(Integer, primary_key=True)
+    booked_hours = Column(Integer, default=0, nullable=False)
+
+
+class OutboxStatus(enum.Enum):
+    PENDIENTE = "pendiente"
+    ENVIADO = "enviado"
+    FALLIDO = "fallido"  # Sin más reintentos
+    DESCARTADO = "descartado"  # Anulado (p. ej. creación seguida de cancelación)
+
+
+class EmailOutbox(Base):
+    """Emails pendientes, escritos en la misma transacción que la reserva y enviados por outbox_worker"""
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        # El worker reclama los pendientes cuyo próximo intento ya venció
+        Index("ix_email_outbox_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # create, cancel, series, reminder, waitlist_offer
+    reservation_id = Column(Integer, nullable=True, index=True)
+    user_id = Column(Integer, nullable=False)
+    recipient = Column(String, nullable=True)  # Si falta, el worker lo consulta a auth_service
+    payload = Column(JSON, nullable=False)  # Datos para la plantilla del email
+
+    status = Column(Enum(OutboxStatus), default=OutboxStatus.PENDIENTE, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=func.now(), nullable=False)
+    leased_until = Column(DateTime, nullable=True)  # Lote reclamado por un worker hasta este instante
+    last_error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime, default=func.now())
+    sent_at = Column(DateTime, nullable=True)
+
+
+class ReservationArchive(Base):
+    """Resumen de un mes de reservas archivado en un fichero NDJSON comprimido"""
+    __tablename__ = "reservation_archives"
+
+    month = Column(Date, primary_key=True)  # Primer día del mes
+    row_count = Column(Integer, nullable=False)
+    confirmed_count = Column(Integer, nullable=False)
+    cancelled_count = Column(Integer, nullable=False)
+    revenue = Column(Float, nullable=False)  # Ingresos de reservas confirmadas
+    file_path = Column(String, nullable=False)
+    archived_at = Column(DateTime, default=func.now(), nullable=False)
+
+
+class IdempotencyKey(Base):
+    """Respuesta guardada de una petición con cabecera Idempotency-Key, para devolverla en los reintentos"""
+    __tablename__ = "idempotency_keys"
+
+    key_hash = Column(String(64), primary_key=True)  # sha256 de Authorization + operación + clave
+    request_hash = Column(String(64), nullable=False)  # Huella del cuerpo: la clave no se reutiliza con otro
+    status_code = Column(Integer, nullable=True)
+    response = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class ReservationHold(Base):
+    """Retención temporal de un horario mientras el usuario completa la reserva"""
+    __tablename__ = "reservation_holds"
+    __table_args__ = (
+        # Solapamiento con retenciones vigentes de una cancha
+        Index("ix_reservation_holds_field_start", "field_id", "start_time"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    field_id = Column(Integer, nullable=False)
+    start_time = Column(DateTime, nullable=False)
+    end_time = Column(DateTime, nullable=False)
+    duration_hours = Column(Integer, nullable=False)
+
+    # Datos de la cancha y precio al retener: confirmar no vuelve a consultar fields_service
+    field_name = Column(String, nullable=False)
+    field_location = Column(String, nullable=False)
+    total_price = Column(Float, nullable=False)
+    notes = Column(Text, nullable=True)
+
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)  # Barrido periódico por este índice
+
+
+class WaitlistStatus(enum.Enum):
+    ESPERANDO = "esperando"
+    OFRECIDA = "ofrecida"  # Se le retuvo el horario liberado (hold_id)
+    ATENDIDA = "atendida"  # Confirmó la retención ofrecida
+    CADUCADA = "caducada"  # La oferta o el horario ya pasaron
+
+
+class WaitlistEntry(Base):
+    """Usuario en espera de un horario ocupado; se le ofrece al cancelarse una reserva que lo cubre"""
+    __tablename__ = "reservation_waitlist"
+    __table_args__ = (
+        # Búsqueda del primer interesado en el horario liberado de una cancha
+        Index("ix_reservation_waitlist_field_start", "field_id", "start_time"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    field_id = Column(Integer, nullable=False)
+    start_time = Column(DateTime, nullable=False)
+    end_time = Column(DateTime, nullable=False)
+    duration_hours = Column(Integer, nullable=False)
+    notes = Column(Text, nullable=True)
+
+    status = Column(Enum(WaitlistStatus), default=WaitlistStatus.ESPERANDO, nullable=False)
+    hold_id = Column(Integer, nullable=True)  # Retención creada al ofrecer el horario
+    offer_expires_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=func.now(), nullable=False)
@@ -0,0 +1,60 @@
+from datetime import datetime
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.models import EmailOutbox, Reservation
+
+
+def reservation_email_data(reservation: Reservation) -> dict:
+    """Datos de la reserva que usan las plantillas de email"""
+    return {
+        "id": reservation.id,
+        "field_name": reservation.field_name,
+        "field_location": reservation.field_location,
+        "start_time": reservation.start_time.strftime("%d/%m/%Y %H:%M"),
+        "duration_hours": reservation.duration_hours,
+        "total_price": reservation.total_price
+    }
+
+
+def enqueue_email(db: Session, kind: str, user_id: int, recipient: str, payload: dict, reservation_id: int = None):
+    """Añadir un email a la outbox; se confirma con la transacción de la reserva"""
+    db.add(EmailOutbox(
+        kind=kind,
+        reservation_id=reservation_id,
+        user_id=user_id,
+        recipient=recipient,
+        payload=payload,
+        next_attempt_at=datetime.now()
+    ))
+
+
+def enqueue_reservation_email(db: Session, reservation: Reservation, kind: str, recipient: str, reason: str = None):
+    """Encolar el email de creación o cancelación de una reserva (requiere reservation.id)"""
+    payload = reservation_email_data(reservation)
+    if reason:
+        payload["reason"] = reason
+    enqueue_email(db, kind, reservation.user_id, recipient, payload, reservation.id)
+
+
+def enqueue_reservation_emails(db: Session, reservations: list, kind: str, reason: str = None) -> int:
+    """Encolar un email por reserva con un solo INSERT; el worker resuelve los destinatarios por lotes"""
+    now = datetime.now()
+    rows = []
+    for reservation in reservations:
+        payload = reservation_email_data(reservation)
+        if reason:
+            payload["reason"] = reason
+        rows.append({
+            "kind": kind,
+            "reservation_id": reservation.id,
+            "user_id": reservation.user_id,
+            "recipient": None,
+            "payload": payload,
+            "next_attempt_at": now,
+            "created_at": now,
+        })
+    if rows:
+        db.execute(insert(EmailOutbox), rows)
+    return len(rows)
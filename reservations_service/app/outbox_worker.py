@@ -0,0 +1,307 @@
+import logging
+import os
+import queue
+import smtplib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.email_service import EmailService
+from app.models import EmailOutbox, OutboxStatus
+from app.service_clients import lookup_user_emails
+
+# Tamaño de lote, sesiones SMTP simultáneas y espera cuando no hay trabajo (segundos)
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "2"))
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "4"))
+
+# Reintentos: espera base * 2^intentos, con tope, hasta OUTBOX_MAX_ATTEMPTS
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_BACKOFF_SECONDS", "30"))
+OUTBOX_BACKOFF_MAX_SECONDS = float(os.getenv("OUTBOX_BACKOFF_MAX_SECONDS", "3600"))
+
+# Un lote reclamado no se vuelve a tomar hasta pasado este tiempo (si el worker muere)
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "300"))
+
+# Sesiones SMTP: STARTTLS opcional (desactivar contra un servidor local de pruebas),
+# comprobación con NOOP tras estar inactivas y reconexión tras N mensajes
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+SMTP_TIMEOUT_SECONDS = float(os.getenv("SMTP_TIMEOUT_SECONDS", "10"))
+SMTP_MAX_IDLE_SECONDS = float(os.getenv("SMTP_MAX_IDLE_SECONDS", "30"))
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", "100"))
+
+# Pares que se anulan si siguen pendientes a la vez
+COALESCED_KINDS = ("create", "cancel")
+
+# Error definitivo: auth_service no conoce el usuario (o está inactivo)
+NO_RECIPIENT_ERROR = "Sin email de destino"
+
+logger = logging.getLogger(__name__)
+
+
+class PooledSMTP:
+    """Sesión SMTP autenticada con su uso y última actividad"""
+
+    def __init__(self, server: smtplib.SMTP):
+        self.server = server
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+    def close(self):
+        try:
+            self.server.quit()
+        except smtplib.SMTPException:
+            pass
+        except OSError:
+            pass
+
+
+class SMTPConnectionPool:
+    """Pool de sesiones SMTP reutilizables (STARTTLS y login una sola vez por sesión)"""
+
+    def __init__(self, email_service: EmailService, size: int = SMTP_POOL_SIZE):
+        self.email_service = email_service
+        self.size = size
+        self._idle = queue.LifoQueue()
+
+    def _connect(self) -> PooledSMTP:
+        server = smtplib.SMTP(
+            self.email_service.smtp_server, self.email_service.smtp_port, timeout=SMTP_TIMEOUT_SECONDS
+        )
+        if SMTP_STARTTLS:
+            server.starttls()
+        if self.email_service.email_user:
+            server.login(self.email_service.email_user, self.email_service.email_password)
+        return PooledSMTP(server)
+
+    def _is_usable(self, connection: PooledSMTP) -> bool:
+        if connection.sent >= SMTP_MAX_MESSAGES_PER_CONNECTION:
+            return False
+        if time.monotonic() - connection.last_used < SMTP_MAX_IDLE_SECONDS:
+            return True
+        try:
+            return connection.server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _acquire(self) -> PooledSMTP:
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if self._is_usable(connection):
+                return connection
+            connection.close()
+
+    @contextmanager
+    def connection(self):
+        """Sesión lista para enviar; se devuelve al pool salvo que falle"""
+        connection = self._acquire()
+        try:
+            yield connection
+        except Exception:
+            connection.close()
+            raise
+        connection.last_used = time.monotonic()
+        if self._idle.qsize() < self.size:
+            self._idle.put(connection)
+        else:
+            connection.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class OutboxWorker:
+    """Envía los emails pendientes de la outbox en lotes usando el pool SMTP"""
+
+    def __init__(self, session_factory, email_service: EmailService = None, pool: SMTPConnectionPool = None):
+        self.session_factory = session_factory
+        self.email_service = email_service or EmailService()
+        self.pool = pool or SMTPConnectionPool(self.email_service)
+        self._executor = ThreadPoolExecutor(max_workers=self.pool.size)
+
+    def claim_batch(self, db: Session) -> list:
+        """Reservar un lote de emails vencidos (SKIP LOCKED permite varios workers en PostgreSQL)"""
+        now = datetime.now()
+        batch = db.query(EmailOutbox).filter(
+            EmailOutbox.status == OutboxStatus.PENDIENTE,
+            EmailOutbox.next_attempt_at <= now
+        ).order_by(EmailOutbox.id).limit(OUTBOX_BATCH_SIZE).with_for_update(skip_locked=True).all()
+
+        lease_until = now + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+        for email in batch:
+            email.next_attempt_at = lease_until
+            email.leased_until = lease_until
+        db.commit()
+        return batch
+
+    def coalesce(self, db: Session, batch: list) -> list:
+        """Descartar los pares creación + cancelación pendientes de una misma reserva"""
+        reservation_ids = {e.reservation_id for e in batch if e.kind in COALESCED_KINDS and e.reservation_id}
+        if not reservation_ids:
+            return batch
+
+        # Los emails de otro lote con el lease vigente puede estar enviándolos otro worker
+        now = datetime.now()
+        pending = db.query(EmailOutbox).filter(
+            EmailOutbox.status == OutboxStatus.PENDIENTE,
+            EmailOutbox.kind.in_(COALESCED_KINDS),
+            EmailOutbox.reservation_id.in_(reservation_ids),
+            or_(
+                EmailOutbox.id.in_([e.id for e in batch]),
+                EmailOutbox.leased_until.is_(None),
+                EmailOutbox.leased_until <= now
+            )
+        ).with_for_update(skip_locked=True).all()
+        kinds_by_reservation = {}
+        for email in pending:
+            kinds_by_reservation.setdefault(email.reservation_id, set()).add(email.kind)
+        cancelled_before_sending = {
+            reservation_id for reservation_id, kinds in kinds_by_reservation.items()
+            if kinds >= set(COALESCED_KINDS)
+        }
+        if not cancelled_before_sending:
+            return batch
+
+        for email in pending:
+            if email.reservation_id in cancelled_before_sending:
+                email.status = OutboxStatus.DESCARTADO
+                email.leased_until = None
+                email.last_error = "Reserva creada y cancelada antes del envío"
+        db.commit()
+        return [e for e in batch if e.status == OutboxStatus.PENDIENTE]
+
+    def _send_chunk(self, chunk: list) -> dict:
+        """Enviar un grupo de mensajes por una misma sesión; devuelve {id: error o None}"""
+        results = {}
+        remaining = list(chunk)
+        while remaining:
+            sent_in_session = 0
+            try:
+                with self.pool.connection() as connection:
+                    while remaining:
+                        email_id, message = remaining[0]
+                        try:
+                            connection.server.send_message(message)
+                            connection.sent += 1
+                            results[email_id] = None
+                        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError, smtplib.SMTPSenderRefused) as e:
+                            # Error del mensaje, no de la sesión: seguir con el resto
+                            results[email_id] = str(e)
+                        remaining.pop(0)
+                        sent_in_session += 1
+            except (smtplib.SMTPException, OSError) as e:
+                if sent_in_session == 0:
+                    # No se pudo abrir (o usar) la sesión: reintentar todo el grupo más tarde
+                    results.update({email_id: str(e) for email_id, _ in remaining})
+                    break
+                # Sesión caída a mitad: el mensaje en curso se reintenta más tarde, el resto con otra sesión
+                email_id, _ = remaining.pop(0)
+                results[email_id] = str(e)
+        return results
+
+    def resolve_recipients(self, batch: list) -> dict:
+        """Completar los destinatarios que faltan con una sola consulta a auth_service"""
+        missing = [e for e in batch if not e.recipient]
+        if not missing:
+            return {}
+        try:
+            emails = lookup_user_emails(e.user_id for e in missing)
+        except httpx.HTTPError as e:
+            # Error temporal: se reintenta con el resto de fallos
+            return {email.id: f"Error consultando emails: {e}" for email in missing}
+        for email in missing:
+            email.recipient = emails.get(email.user_id)
+        return {}
+
+    def send_batch(self, batch: list) -> dict:
+        """Repartir el lote entre las sesiones del pool y enviarlo"""
+        results = self.resolve_recipients(batch)
+        messages = []
+        for email in batch:
+            if email.id in results:
+                continue
+            if not email.recipient:
+                results[email.id] = NO_RECIPIENT_ERROR
+                continue
+            try:
+                subject, body = self.email_service.render(email.kind, email.payload)
+            except (ValueError, KeyError) as e:
+                results[email.id] = str(e)
+                continue
+            messages.append((email.id, self.email_service.build_message(email.recipient, subject, body)))
+
+        chunks = [messages[i::self.pool.size] for i in range(self.pool.size) if messages[i::self.pool.size]]
+        for chunk_results in self._executor.map(self._send_chunk, chunks):
+            results.update(chunk_results)
+        return results
+
+    def record_results(self, db: Session, batch: list, results: dict):
+        """Marcar enviados y reprogramar los fallidos con espera exponencial"""
+        now = datetime.now()
+        for email in batch:
+            email.leased_until = None
+            error = results.get(email.id)
+            if error is None:
+                email.status = OutboxStatus.ENVIADO
+                email.sent_at = now
+                email.last_error = None
+                continue
+
+            email.attempts += 1
+            email.last_error = error
+            if email.attempts >= OUTBOX_MAX_ATTEMPTS or error == NO_RECIPIENT_ERROR:
+                email.status = OutboxStatus.FALLIDO
+            else:
+                delay = min(OUTBOX_BACKOFF_SECONDS * 2 ** (email.attempts - 1), OUTBOX_BACKOFF_MAX_SECONDS)
+                email.next_attempt_at = now + timedelta(seconds=delay)
+        db.commit()
+
+    def run_once(self) -> int:
+        """Procesar un lote; devuelve el número de emails tratados"""
+        db = self.session_factory()
+        try:
+            batch = self.claim_batch(db)
+            if not batch:
+                return 0
+            pending = self.coalesce(db, batch)
+            results = self.send_batch(pending)
+            self.record_results(db, pending, results)
+            return len(batch)
+        finally:
+            db.close()
+
+    def run_forever(self):
+        logger.info("📧 Worker de emails iniciado")
+        try:
+            while True:
+                try:
+                    processed = self.run_once()
+                except Exception as e:
+                    logger.exception(f"Error procesando la outbox de emails: {e}")
+                    processed = 0
+                # Vaciar la cola sin pausas mientras haya lotes completos
+                if processed < OUTBOX_BATCH_SIZE:
+                    time.sleep(OUTBOX_POLL_SECONDS)
+        finally:
+            self.pool.close()
+            self._executor.shutdown()
+
+
+if __name__ == "__main__":
+    from app.database import SessionLocal, init_db
+
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    OutboxWorker(SessionLocal).run_forever()
@@ -0,0 +1,69 @@
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import literal_column, tuple_
+from sqlalchemy.orm import Query
+
+from app.models import Reservation
+
+CURSOR_VERSION = 1
+
+
+def encode_cursor(reservation: Reservation) -> str:
+    """Cursor opaco con la posición (created_at, id) de la última reserva de la página"""
+    payload = {"v": CURSOR_VERSION, "c": reservation.created_at.isoformat(), "i": reservation.id}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Posición (created_at, id) de un cursor; 400 si no es válido"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if payload["v"] != CURSOR_VERSION:
+            raise ValueError("Versión de cursor no soportada")
+        return datetime.fromisoformat(payload["c"]), int(payload["i"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+def keyset_query(query: Query, cursor: str = None) -> Query:
+    """Reservas posteriores al cursor en orden (created_at, id) descendente"""
+    query = query.order_by(Reservation.created_at.desc(), Reservation.id.desc())
+    if cursor:
+        created_at, reservation_id = decode_cursor(cursor)
+        if query.session.get_bind().dialect.name == "sqlite":
+            # SQLite guarda func.now() como texto sin microsegundos: comparar en ese mismo formato
+            created_at = literal_column(f"'{created_at:%Y-%m-%d %H:%M:%S}'")
+        query = query.filter(tuple_(Reservation.created_at, Reservation.id) < tuple_(created_at, reservation_id))
+    return query
+
+
+def paginate_reservations(query: Query, limit: int, skip: int = 0, cursor: str = None, include_total: bool = True) -> dict:
+    """Página de reservas ordenada por (created_at, id) descendente.
+
+    Con cursor se usa keyset pagination (coste constante por página, usa los
+    índices (created_at, id) y (user_id, created_at, id)); sin él, offset/limit.
+    """
+    total = query.order_by(None).count() if include_total else None
+
+    if cursor:
+        query = keyset_query(query, cursor)
+    else:
+        query = query.order_by(Reservation.created_at.desc(), Reservation.id.desc()).offset(skip)
+
+    # Una fila extra indica si hay más páginas sin necesidad de contar
+    reservations = query.limit(limit + 1).all()
+    has_more = len(reservations) > limit
+    reservations = reservations[:limit]
+
+    return {
+        "reservations": reservations,
+        "total": total,
+        "page": skip // limit + 1,
+        "size": limit,
+        "next_cursor": encode_cursor(reservations[-1]) if has_more else None,
+    }
@@ -0,0 +1,217 @@
+import gzip
+import json
+import logging
+import os
+from datetime import date, datetime, time
+
+from sqlalchemy import func, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app.db_common import disable_statement_timeout
+from app.models import Reservation, ReservationArchive, ReservationStatus
+
+# Particiones mensuales por start_time (solo PostgreSQL). Se crean por adelantado
+# hasta cubrir el horizonte de las series de reservas (6 meses).
+RESERVATIONS_PARTITIONING = os.getenv("RESERVATIONS_PARTITIONING", "true").lower() == "true"
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "7"))
+
+# Meses completos que se mantienen en la base de datos antes de archivarse
+RESERVATION_RETENTION_MONTHS = int(os.getenv("RESERVATION_RETENTION_MONTHS", "12"))
+RESERVATION_ARCHIVE_DIR = os.getenv("RESERVATION_ARCHIVE_DIR", "archives")
+
+logger = logging.getLogger(__name__)
+
+
+def add_months(month: date, months: int) -> date:
+    """Primer día del mes desplazado n meses"""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"reservations_{month:%Y_%m}"
+
+
+def is_partitioned(conn: Connection) -> bool:
+    relkind = conn.execute(text(
+        "SELECT relkind FROM pg_class WHERE oid = to_regclass('reservations')"
+    )).scalar()
+    return relkind == "p"
+
+
+def partition_exists(conn: Connection, month: date) -> bool:
+    return conn.execute(
+        text("SELECT to_regclass(:name) IS NOT NULL"), {"name": partition_name(month)}
+    ).scalar()
+
+
+def create_partition(conn: Connection, month: date):
+    """Crear la partición de un mes con su restricción de no solapamiento"""
+    name = partition_name(month)
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF reservations "
+        f"FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"
+    ))
+    # Las reservas no cruzan la medianoche, así que el solapamiento nunca abarca dos particiones
+    conn.execute(text(f"""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = '{name}_no_overlap') THEN
+                ALTER TABLE {name} ADD CONSTRAINT {name}_no_overlap
+                    EXCLUDE USING gist (field_id WITH =, period WITH &&) WHERE (status = 'CONFIRMADA');
+            END IF;
+        END $$
+    """))
+
+
+def ensure_partitions(conn: Connection, months_ahead: int = PARTITION_MONTHS_AHEAD) -> int:
+    """Crear las particiones del mes actual y de los próximos meses que falten"""
+    current = date.today().replace(day=1)
+    created = 0
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if not partition_exists(conn, month):
+            create_partition(conn, month)
+            created += 1
+    return created
+
+
+def migrate_to_partitioned(conn: Connection):
+    """Convertir la tabla reservations en una tabla particionada por mes (una sola vez)"""
+    conn.execute(text("LOCK TABLE reservations IN ACCESS EXCLUSIVE MODE"))
+    if is_partitioned(conn):
+        return
+
+    conn.execute(text("ALTER TABLE reservations RENAME TO reservations_legacy"))
+    conn.execute(text(
+        "CREATE TABLE reservations (LIKE reservations_legacy INCLUDING DEFAULTS INCLUDING GENERATED) "
+        "PARTITION BY RANGE (start_time)"
+    ))
+    # La clave primaria de una tabla particionada debe incluir la columna de partición
+    conn.execute(text("ALTER TABLE reservations ADD PRIMARY KEY (id, start_time)"))
+
+    first_start = conn.execute(text("SELECT min(start_time) FROM reservations_legacy")).scalar()
+    month = (first_start.date() if first_start else date.today()).replace(day=1)
+    while month <= date.today():
+        create_partition(conn, month)
+        month = add_months(month, 1)
+    ensure_partitions(conn)
+
+    # La columna generada period no se copia: se recalcula en cada partición
+    columns = ", ".join(column.name for column in Reservation.__table__.columns)
+    conn.execute(text(f"INSERT INTO reservations ({columns}) SELECT {columns} FROM reservations_legacy"))
+    conn.execute(text("ALTER SEQUENCE reservations_id_seq OWNED BY reservations.id"))
+    conn.execute(text("DROP TABLE reservations_legacy"))
+
+    # Los índices del modelo se crean en la tabla padre y se propagan a cada partición
+    for index in Reservation.__table__.indexes:
+        index.create(conn, checkfirst=True)
+
+
+def setup_partitioning(conn: Connection):
+    """Particionar la tabla si aún no lo está y crear las particiones futuras"""
+    if not RESERVATIONS_PARTITIONING:
+        return
+    if not is_partitioned(conn):
+        migrate_to_partitioned(conn)
+    ensure_partitions(conn)
+
+
+def serialize_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, ReservationStatus):
+        return value.value
+    return value
+
+
+def write_archive_file(db: Session, month: date, path: str) -> int:
+    """Volcar las reservas de un mes a NDJSON comprimido leyendo con un cursor de servidor"""
+    month_from = datetime.combine(month, time.min)
+    month_to = datetime.combine(add_months(month, 1), time.min)
+    rows = db.connection().execution_options(stream_results=True, yield_per=1000).execute(
+        select(Reservation.__table__).where(
+            Reservation.start_time >= month_from,
+            Reservation.start_time < month_to
+        ).order_by(Reservation.start_time)
+    )
+
+    written = 0
+    temporary_path = f"{path}.tmp"
+    with gzip.open(temporary_path, "wt", encoding="utf-8") as archive:
+        for row in rows:
+            archive.write(json.dumps({key: serialize_value(value) for key, value in row._mapping.items()}))
+            archive.write("\n")
+            written += 1
+    os.replace(temporary_path, path)
+    return written
+
+
+def archive_month(db: Session, month: date, archive_dir: str = None) -> int:
+    """Archivar un mes completo: fichero, resumen para /stats y borrado de las filas"""
+    # Volcado, DETACH y borrado pueden superar el límite por sentencia de las peticiones
+    disable_statement_timeout(db.connection())
+    archive_dir = archive_dir or RESERVATION_ARCHIVE_DIR
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{partition_name(month)}.ndjson.gz")
+    row_count = write_archive_file(db, month, path)
+
+    month_from = datetime.combine(month, time.min)
+    month_to = datetime.combine(add_months(month, 1), time.min)
+    in_month = (Reservation.start_time >= month_from, Reservation.start_time < month_to)
+    confirmed = Reservation.status == ReservationStatus.CONFIRMADA
+    summary = db.query(
+        func.count(Reservation.id).filter(confirmed).label("confirmed"),
+        func.count(Reservation.id).filter(Reservation.status == ReservationStatus.CANCELADA).label("cancelled"),
+        func.sum(Reservation.total_price).filter(confirmed).label("revenue")
+    ).filter(*in_month).one()
+
+    db.add(ReservationArchive(
+        month=month,
+        row_count=row_count,
+        confirmed_count=summary.confirmed,
+        cancelled_count=summary.cancelled,
+        revenue=float(summary.revenue or 0),
+        file_path=path
+    ))
+
+    conn = db.connection()
+    if conn.dialect.name == "postgresql" and is_partitioned(conn) and partition_exists(conn, month):
+        # Soltar la partición entera: sin DELETE fila a fila ni tabla inflada
+        conn.execute(text(f"ALTER TABLE reservations DETACH PARTITION {partition_name(month)}"))
+        conn.execute(text(f"DROP TABLE {partition_name(month)}"))
+    else:
+        db.query(Reservation).filter(*in_month).delete(synchronize_session=False)
+    db.commit()
+    return row_count
+
+
+def archive_old_reservations(db: Session, retention_months: int = RESERVATION_RETENTION_MONTHS) -> int:
+    """Archivar los meses anteriores a la ventana de retención; devuelve las filas archivadas"""
+    cutoff = datetime.combine(add_months(date.today().replace(day=1), -retention_months), time.min)
+    archived = {month for (month,) in db.query(ReservationArchive.month).all()}
+    total = 0
+    while True:
+        # Saltar directamente al siguiente mes con reservas (los meses vacíos no se archivan)
+        first_start = db.query(func.min(Reservation.start_time)).filter(Reservation.start_time < cutoff).scalar()
+        if first_start is None:
+            return total
+        month = first_start.date().replace(day=1)
+        if month in archived:
+            # No debería pasar: las reservas nuevas siempre son futuras
+            logger.warning(f"Mes {month:%Y-%m} ya archivado y con reservas restantes")
+            return total
+        total += archive_month(db, month)
+
+
+def maintain_partitions(db: Session) -> str:
+    """Tarea periódica: particiones futuras y archivado de meses antiguos"""
+    created = 0
+    conn = db.connection()
+    if conn.dialect.name == "postgresql" and RESERVATIONS_PARTITIONING and is_partitioned(conn):
+        disable_statement_timeout(conn)
+        created = ensure_partitions(conn)
+        db.commit()
+    archived = archive_old_reservations(db)
+    return f"{created} particiones creadas, {archived} reservas archivadas"
@@ -0,0 +1,214 @@
+import argparse
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.analytics import invalidate_heatmap_on_commit
+from app.db_common import disable_statement_timeout
+from app.models import DailyRollup, OccupancyRollup, Reservation, ReservationArchive, ReservationStatus
+
+ROLLUP_COUNTERS = ("bookings", "cancellations", "revenue", "booked_hours")
+
+
+def apply_rollup_delta(db: Session, field_id: int, day: date, **deltas):
+    """Sumar deltas a los totales de (cancha, día) sin confirmar la transacción"""
+    values = {counter: deltas.get(counter, 0) for counter in ROLLUP_COUNTERS}
+    insert = postgresql_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    statement = insert(DailyRollup).values(field_id=field_id, day=day, **values)
+    # Incremento atómico: dos transacciones concurrentes no se pisan el total
+    statement = statement.on_conflict_do_update(
+        index_elements=[DailyRollup.field_id, DailyRollup.day],
+        set_={counter: getattr(DailyRollup, counter) + getattr(statement.excluded, counter) for counter in ROLLUP_COUNTERS}
+    )
+    db.execute(statement)
+
+
+def occupancy_cells(start_time: datetime, duration_hours: int):
+    """Celdas (mes, día de la semana, hora) que ocupa una reserva"""
+    month = start_time.date().replace(day=1)
+    return [(month, start_time.weekday(), hour) for hour in range(start_time.hour, min(start_time.hour + duration_hours, 24))]
+
+
+def apply_occupancy_deltas(db: Session, field_id: int, deltas: dict):
+    """Sumar deltas {(mes, día de la semana, hora): n} a occupancy_rollup en una sola sentencia"""
+    rows = [
+        {"field_id": field_id, "month": month, "weekday": weekday, "hour": hour, "booked_hours": delta}
+        for (month, weekday, hour), delta in deltas.items()
+    ]
+    if not rows:
+        return
+    insert = postgresql_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    statement = insert(OccupancyRollup).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=[OccupancyRollup.field_id, OccupancyRollup.month, OccupancyRollup.weekday, OccupancyRollup.hour],
+        set_={"booked_hours": OccupancyRollup.booked_hours + statement.excluded.booked_hours}
+    )
+    db.execute(statement)
+    invalidate_heatmap_on_commit(db, field_id)
+
+
+def apply_occupancy_delta(db: Session, field_id: int, start_time: datetime, duration_hours: int, sign: int = 1):
+    """Sumar (o restar) una reserva a cada hora que ocupa en occupancy_rollup"""
+    apply_occupancy_deltas(db, field_id, {cell: sign for cell in occupancy_cells(start_time, duration_hours)})
+
+
+def record_booking(db: Session, reservation: Reservation, sign: int = 1):
+    """Sumar (o restar con sign=-1) una reserva confirmada a los totales de su día"""
+    apply_rollup_delta(
+        db, reservation.field_id, reservation.start_time.date(),
+        bookings=sign,
+        revenue=sign * reservation.total_price,
+        booked_hours=sign * reservation.duration_hours
+    )
+    apply_occupancy_delta(db, reservation.field_id, reservation.start_time, reservation.duration_hours, sign)
+
+
+def record_cancellation(db: Session, reservation: Reservation):
+    """Pasar una reserva de confirmada a cancelada en los totales de su día"""
+    apply_rollup_delta(
+        db, reservation.field_id, reservation.start_time.date(),
+        bookings=-1,
+        cancellations=1,
+        revenue=-reservation.total_price,
+        booked_hours=-reservation.duration_hours
+    )
+    apply_occupancy_delta(db, reservation.field_id, reservation.start_time, reservation.duration_hours, -1)
+
+
+def record_bulk_cancellation(db: Session, field_id: int, reservations: list):
+    """Pasar a canceladas varias reservas de una cancha: una sentencia por día y una para la ocupación"""
+    days = {}
+    occupancy = {}
+    for reservation in reservations:
+        totals = days.setdefault(reservation.start_time.date(), {"count": 0, "revenue": 0.0, "hours": 0})
+        totals["count"] += 1
+        totals["revenue"] += reservation.total_price
+        totals["hours"] += reservation.duration_hours
+        for cell in occupancy_cells(reservation.start_time, reservation.duration_hours):
+            occupancy[cell] = occupancy.get(cell, 0) - 1
+
+    for day, totals in days.items():
+        apply_rollup_delta(
+            db, field_id, day,
+            bookings=-totals["count"],
+            cancellations=totals["count"],
+            revenue=-totals["revenue"],
+            booked_hours=-totals["hours"]
+        )
+    apply_occupancy_deltas(db, field_id, occupancy)
+
+
+def lock_rollup_tables(db: Session):
+    """Bloquear las escrituras en los totales hasta el fin de la transacción.
+
+    Las reservas suman sus deltas con INSERT ... ON CONFLICT, que espera a este lock:
+    ninguna reserva se confirma entre la lectura de reservations y la reescritura de
+    los totales. En SQLite lo consigue el DELETE del rango, que se hace antes de leer.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("LOCK TABLE daily_rollup, occupancy_rollup IN EXCLUSIVE MODE"))
+
+
+def backfill_rollups(db: Session, date_from: date = None, date_to: date = None) -> int:
+    """Recalcular los totales desde la tabla de reservas; devuelve las filas escritas"""
+    # Recorre rangos completos de reservas: sin el límite por sentencia de las peticiones
+    disable_statement_timeout(db.connection())
+    lock_rollup_tables(db)
+    # Los meses archivados ya no están en reservations: conservar sus totales
+    last_archived = db.query(func.max(ReservationArchive.month)).scalar()
+    if last_archived is not None:
+        first_live_day = (last_archived + timedelta(days=32)).replace(day=1)
+        date_from = max(date_from or first_live_day, first_live_day)
+
+    rollup_query = db.query(DailyRollup)
+    reservation_filters = []
+    if date_from is not None:
+        rollup_query = rollup_query.filter(DailyRollup.day >= date_from)
+        reservation_filters.append(Reservation.start_time >= datetime.combine(date_from, time.min))
+    if date_to is not None:
+        rollup_query = rollup_query.filter(DailyRollup.day <= date_to)
+        reservation_filters.append(Reservation.start_time < datetime.combine(date_to + timedelta(days=1), time.min))
+
+    # Reemplazar el rango completo en una sola transacción
+    rollup_query.delete(synchronize_session=False)
+
+    confirmed = Reservation.status == ReservationStatus.CONFIRMADA
+    day = func.date(Reservation.start_time)
+    rows = db.query(
+        Reservation.field_id,
+        day.label("day"),
+        func.count(Reservation.id).filter(confirmed).label("bookings"),
+        func.count(Reservation.id).filter(Reservation.status == ReservationStatus.CANCELADA).label("cancellations"),
+        func.coalesce(func.sum(Reservation.total_price).filter(confirmed), 0).label("revenue"),
+        func.coalesce(func.sum(Reservation.duration_hours).filter(confirmed), 0).label("booked_hours")
+    ).filter(*reservation_filters).group_by(Reservation.field_id, day).all()
+
+    db.bulk_insert_mappings(DailyRollup, [
+        {
+            "field_id": row.field_id,
+            # SQLite devuelve la fecha como texto
+            "day": row.day if isinstance(row.day, date) else date.fromisoformat(row.day),
+            "bookings": row.bookings,
+            "cancellations": row.cancellations,
+            "revenue": float(row.revenue),
+            "booked_hours": int(row.booked_hours),
+        }
+        for row in rows
+    ])
+    backfill_occupancy_rollup(db, date_from, date_to)
+    db.commit()
+    return len(rows)
+
+
+def backfill_occupancy_rollup(db: Session, date_from: date = None, date_to: date = None):
+    """Recalcular occupancy_rollup para los meses completos que cubren el rango (sin confirmar)"""
+    lock_rollup_tables(db)
+    month_from = date_from.replace(day=1) if date_from is not None else None
+    month_to = (date_to.replace(day=1) + timedelta(days=32)).replace(day=1) if date_to is not None else None
+
+    rollup_query = db.query(OccupancyRollup)
+    reservation_filters = [Reservation.status == ReservationStatus.CONFIRMADA]
+    if month_from is not None:
+        rollup_query = rollup_query.filter(OccupancyRollup.month >= month_from)
+        reservation_filters.append(Reservation.start_time >= datetime.combine(month_from, time.min))
+    if month_to is not None:
+        rollup_query = rollup_query.filter(OccupancyRollup.month < month_to)
+        reservation_filters.append(Reservation.start_time < datetime.combine(month_to, time.min))
+
+    rollup_query.delete(synchronize_session=False)
+
+    # Pocas columnas y sin objetos ORM: la expansión por horas se hace aquí
+    cells = {}
+    rows = db.query(Reservation.field_id, Reservation.start_time, Reservation.duration_hours).filter(
+        *reservation_filters
+    ).yield_per(1000)
+    for field_id, start_time, duration_hours in rows:
+        for month, weekday, hour in occupancy_cells(start_time, duration_hours):
+            key = (field_id, month, weekday, hour)
+            cells[key] = cells.get(key, 0) + 1
+
+    db.bulk_insert_mappings(OccupancyRollup, [
+        {"field_id": field_id, "month": month, "weekday": weekday, "hour": hour, "booked_hours": booked_hours}
+        for (field_id, month, weekday, hour), booked_hours in cells.items()
+    ])
+    invalidate_heatmap_on_commit(db, None)
+
+
+if __name__ == "__main__":
+    from app.database import SessionLocal, init_db
+
+    parser = argparse.ArgumentParser(description="Recalcular la tabla daily_rollup desde las reservas")
+    parser.add_argument("--from", dest="date_from", type=date.fromisoformat, help="Primer día (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="date_to", type=date.fromisoformat, help="Último día (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    try:
+        written = backfill_rollups(db, args.date_from, args.date_to)
+        print(f"✅ daily_rollup recalculada: {written} filas")
+    finally:
+        db.close()
@@ -1,18 +1,50 @@
-from fastapi import APIRouter, HTTPException, Depends, Query, BackgroundTasks, Request
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, func
+from sqlalchemy import and_, case, func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from collections import OrderedDict
 from typing import List, Optional
 from datetime import datetime, timedelta, date, time
+import asyncio
 import requests
+import threading
 import os
+import uuid
 
-from app.database import get_db
-from app.models import Reservation, ReservationStatus
+from app.database import get_db, get_read_db
+from app.models import (
+    Reservation, ReservationStatus, FieldSnapshot, DailyRollup, ReservationArchive, ReservationHold,
+    WaitlistEntry, WaitlistStatus
+)
 from app.schemas import (
     ReservationCreate, ReservationUpdate, ReservationResponse, 
-    ReservationListResponse, ReservationCancelRequest, ReservationStatsResponse
+    ReservationListResponse, ReservationCancelRequest, ReservationStatsResponse,
+    FieldEventsRequest, ReservationSeriesCreate, ReservationSeriesResponse, SkippedOccurrence,
+    SeriesFrequencyEnum, SeriesModeEnum, MAX_SERIES_OCCURRENCES,
+    RollupGroupByEnum, RollupBucket, RollupsResponse, ExportFormatEnum,
+    ReservationHoldCreate, ReservationHoldResponse, WaitlistCreate, WaitlistResponse, HeatmapResponse,
+    BulkCancelRequest, BulkCancelResponse
+)
+from app.locking import field_booking_lock, EXCLUSION_VIOLATION
+from app.rollups import (
+    apply_rollup_delta, apply_occupancy_delta, record_booking, record_cancellation, record_bulk_cancellation
+)
+from app.analytics import get_heatmap
+from app.events import (
+    slot_broadcaster, slot_event, slot_event_stream, SLOT_BOOKED, SLOT_FREED, SLOT_HELD
 )
-from app.email_service import EmailService
+from app.pagination import paginate_reservations
+from app.outbox import enqueue_email, enqueue_reservation_email, enqueue_reservation_emails
+from app.export import export_query, export_csv, export_ndjson
+from app.idempotency import IdempotentRequest, idempotent_request
+from app.holds import HOLD_TTL_SECONDS, active_holds_query, find_conflicting_hold
+from app.waitlist import offer_freed_slot, mark_offer_accepted, decline_offer
+from app.concurrency import check_if_match, set_version_etag
+from app.service_clients import get_current_user_async, fetch_field_info_async, fetch_field_open_masks_async
 
 reservations_router = APIRouter()
 
@@ -21,8 +53,6 @@ AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL")
 ROLES_SERVICE_URL = os.getenv("ROLES_SERVICE_URL")
 FIELDS_SERVICE_URL = os.getenv("FIELDS_SERVICE_URL")
 
-email_service = EmailService()
-
 def get_current_user(auth_header: str):
     """Obtener información del usuario actual"""
     if not auth_header:
@@ -72,10 +102,14 @@ def check_admin_permission(user_id: int, auth_header: str) -> bool:
         print(f"DEBUG - Request exception in check_admin_permission: {e}")
         return False
 
-def get_field_info(field_id: int):
-    """Obtener información de la cancha"""
+# Antigüedad máxima de la copia local de una cancha antes de volver a consultarla
+FIELD_SNAPSHOT_MAX_AGE_SECONDS = int(os.getenv("FIELD_SNAPSHOT_MAX_AGE_SECONDS", "3600"))
+INTERNAL_SERVICE_TOKEN = os.getenv("INTERNAL_SERVICE_TOKEN")
+
+def fetch_field_info(field_id: int):
+    """Obtener información de la cancha desde fields_service"""
     try:
-        field_response = requests.get(f"{FIELDS_SERVICE_URL}/fields/{field_id}")
+        field_response = requests.get(f"{FIELDS_SERVICE_URL}/fields/{field_id}", timeout=5)
         if field_response.status_code != 200:
             raise HTTPException(status_code=404, detail="Cancha no encontrada")
         
@@ -83,70 +117,242 @@ def get_field_info(field_id: int):
     except requests.exceptions.RequestException:
         raise HTTPException(status_code=503, detail="Error conectando con servicio de canchas")
 
-def get_user_email(user_id: int, auth_header: str):
-    """Obtener email del usuario"""
+def upsert_field_snapshot(db: Session, values: dict):
+    """Insertar o reemplazar la copia local de una cancha (seguro ante peticiones concurrentes)"""
+    insert = postgresql_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    statement = insert(FieldSnapshot).values(**values)
+    statement = statement.on_conflict_do_update(
+        index_elements=[FieldSnapshot.field_id],
+        set_={key: statement.excluded[key] for key in values if key != "field_id"},
+        # Un lote atrasado o reordenado no pisa una copia más reciente
+        where=FieldSnapshot.field_version <= statement.excluded.field_version
+    )
+    db.execute(statement)
+
+def get_field_snapshot(db: Session, field_id: int):
+    """Información de la cancha desde la copia local, o None si no existe o está vencida"""
+    snapshot = db.query(FieldSnapshot).filter(FieldSnapshot.field_id == field_id).first()
+    if snapshot and (datetime.now() - snapshot.refreshed_at).total_seconds() < FIELD_SNAPSHOT_MAX_AGE_SECONDS:
+        return snapshot.to_field_info()
+    return None
+
+def store_field_snapshot(db: Session, field_id: int, field_info: dict):
+    upsert_field_snapshot(db, {
+        "field_id": field_id,
+        "name": field_info.get("name"),
+        "location": field_info.get("location"),
+        "price_per_hour": field_info.get("price_per_hour", 0),
+        "is_active": bool(field_info.get("is_active")),
+        "schedule_version": field_info.get("schedule_version", 0),
+        "field_version": field_info.get("version", 0),
+        "refreshed_at": datetime.now(),
+    })
+
+def get_field_info(field_id: int, db: Session):
+    """Obtener información de la cancha, usando la copia local mantenida por eventos"""
+    field_info = get_field_snapshot(db, field_id)
+    if field_info is None:
+        # Sin copia (o demasiado antigua por si se perdió algún evento): consultar y guardar
+        field_info = fetch_field_info(field_id)
+        store_field_snapshot(db, field_id, field_info)
+    return field_info
+
+# Caché local de máscaras de horario: (field_id, fecha) -> (máscara, instante de carga)
+SCHEDULE_CACHE_TTL_SECONDS = int(os.getenv("SCHEDULE_CACHE_TTL_SECONDS", "60"))
+SCHEDULE_CACHE_MAX_ENTRIES = int(os.getenv("SCHEDULE_CACHE_MAX_ENTRIES", "10000"))
+schedule_mask_cache = OrderedDict()  # en orden de carga: la primera entrada es la más antigua
+schedule_mask_lock = threading.Lock()
+
+def store_schedule_mask(field_id: int, day: date, mask: int, loaded_at: datetime):
+    with schedule_mask_lock:
+        # Una recarga pasa al final; si la caché está llena se descarta la entrada más antigua
+        schedule_mask_cache.pop((field_id, day), None)
+        while len(schedule_mask_cache) >= SCHEDULE_CACHE_MAX_ENTRIES:
+            schedule_mask_cache.popitem(last=False)
+        schedule_mask_cache[(field_id, day)] = (mask, loaded_at)
+
+def invalidate_schedule_masks(field_id: int):
+    with schedule_mask_lock:
+        for key in [key for key in schedule_mask_cache if key[0] == field_id]:
+            del schedule_mask_cache[key]
+
+def cached_open_masks(field_id: int, date_from: date, date_to: date, now: datetime):
+    """Máscaras vigentes en la caché local y días que faltan por consultar"""
+    days = [date_from + timedelta(days=offset) for offset in range((date_to - date_from).days + 1)]
+    masks = {}
+    for day in days:
+        cached = schedule_mask_cache.get((field_id, day))
+        if cached and (now - cached[1]).total_seconds() < SCHEDULE_CACHE_TTL_SECONDS:
+            masks[day] = cached[0]
+    return masks, [day for day in days if day not in masks]
+
+def store_open_masks(field_id: int, entries: list, masks: dict, now: datetime) -> dict:
+    """Guardar en caché las máscaras recibidas de fields_service y añadirlas a masks"""
+    for entry in entries:
+        day = date.fromisoformat(entry["date"])
+        store_schedule_mask(field_id, day, entry["mask"], now)
+        masks[day] = entry["mask"]
+    return masks
+
+def get_field_open_masks(field_id: int, date_from: date, date_to: date) -> dict:
+    """Obtener las máscaras de horas abiertas de una cancha (bit h = hora h abierta)"""
+    now = datetime.now()
+    masks, missing = cached_open_masks(field_id, date_from, date_to, now)
+    if not missing:
+        return masks
+
     try:
-        user_response = requests.get(
-            f"{AUTH_SERVICE_URL}/auth/user/{user_id}",
-            headers={"Authorization": auth_header}
+        response = requests.get(
+            f"{FIELDS_SERVICE_URL}/fields/{field_id}/schedule/masks",
+            params={"from": missing[0].isoformat(), "to": missing[-1].isoformat()},
+            timeout=5
         )
-        if user_response.status_code == 200:
-            return user_response.json().get("email")
     except requests.exceptions.RequestException:
-        pass
-    return None
+        raise HTTPException(status_code=503, detail="Error conectando con servicio de canchas")
+    if response.status_code == 404:
+        raise HTTPException(status_code=404, detail="Cancha no encontrada")
+    if response.status_code != 200:
+        # Un fallo de fields_service no es una cancha inexistente
+        raise HTTPException(status_code=503, detail="Error conectando con servicio de canchas")
 
-def parse_time_field(time_value):
-    """Convert time field to datetime.time object"""
-    from datetime import time
-    
-    if time_value is None:
-        return None
-    
-    if isinstance(time_value, str):
-        try:
-            # Handle format "HH:MM" or "HH:MM:SS"
-            time_parts = time_value.split(":")
-            hour = int(time_parts[0])
-            minute = int(time_parts[1]) if len(time_parts) > 1 else 0
-            second = int(time_parts[2]) if len(time_parts) > 2 else 0
-            return time(hour, minute, second)
-        except (ValueError, IndexError):
-            return None
-    
-    # If it's already a time object, return it
-    if hasattr(time_value, 'hour'):
-        return time_value
-    
-    return None
+    return store_open_masks(field_id, response.json().get("days", []), masks, now)
+
+async def get_field_open_masks_async(field_id: int, date_from: date, date_to: date) -> dict:
+    """Versión asíncrona de get_field_open_masks (pool compartido de service_clients)"""
+    now = datetime.now()
+    masks, missing = cached_open_masks(field_id, date_from, date_to, now)
+    if not missing:
+        return masks
 
-def send_reservation_email(reservation: Reservation, action: str, auth_header: str, reason: str = None):
-    """Enviar email de notificación de reserva"""
+    entries = await fetch_field_open_masks_async(field_id, missing[0], missing[-1])
+    return store_open_masks(field_id, entries, masks, now)
+
+def is_within_schedule(mask: int, start_time: datetime, duration_hours: int) -> bool:
+    """Verificar que todas las horas de la reserva estén abiertas en la máscara del día"""
+    end_hour = start_time.hour + duration_hours
+    if end_hour > 24:
+        return False
+    return all(mask & (1 << hour) for hour in range(start_time.hour, end_hour))
+
+def describe_open_hours(mask: int) -> str:
+    """Texto con los tramos abiertos de una máscara, p. ej. '10:00-14:00, 16:00-22:00'"""
+    ranges = []
+    hour = 0
+    while hour < 24:
+        if mask & (1 << hour):
+            start = hour
+            while hour < 24 and mask & (1 << hour):
+                hour += 1
+            ranges.append(f"{start:02d}:00-{hour:02d}:00")
+        else:
+            hour += 1
+    return ", ".join(ranges) if ranges else "cerrada"
+
+def check_field_schedule(mask: int, start_time: datetime, duration_hours: int):
+    """Rechazar la reserva si cae fuera de la máscara de horas abiertas del día"""
+    if not is_within_schedule(mask, start_time, duration_hours):
+        raise HTTPException(
+            status_code=400,
+            detail=f"La reserva debe estar dentro del horario de la cancha ese día ({describe_open_hours(mask)})"
+        )
+
+def validate_field_schedule(field_id: int, start_time: datetime, duration_hours: int):
+    """Rechazar la reserva si cae fuera del horario de la cancha para ese día"""
+    day = start_time.date()
+    check_field_schedule(get_field_open_masks(field_id, day, day).get(day, 0), start_time, duration_hours)
+
+async def validate_field_schedule_async(field_id: int, start_time: datetime, duration_hours: int):
+    """Versión asíncrona de validate_field_schedule"""
+    day = start_time.date()
+    masks = await get_field_open_masks_async(field_id, day, day)
+    check_field_schedule(masks.get(day, 0), start_time, duration_hours)
+
+def commit_booking(db: Session, after_flush=None):
+    """Confirmar la transacción traduciendo la violación de la restricción de solapamiento a un 400.
+
+    after_flush se ejecuta con los ids ya asignados, dentro de la misma transacción.
+    """
     try:
-        user_email = get_user_email(reservation.user_id, auth_header)
-        if not user_email:
-            return
+        if after_flush is not None:
+            db.flush()
+            after_flush()
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        if getattr(e.orig, "pgcode", None) == EXCLUSION_VIOLATION:
+            raise HTTPException(status_code=400, detail="Ya existe una reserva confirmada en ese horario")
+        raise
+
+def find_conflicting_reservation(db: Session, field_id: int, start_time: datetime, end_time: datetime, exclude_id: int = None):
+    """Primera reserva confirmada de la cancha que se solapa con [start_time, end_time)"""
+    query = db.query(Reservation).filter(
+        and_(
+            Reservation.field_id == field_id,
+            Reservation.status == ReservationStatus.CONFIRMADA,
+            Reservation.start_time < end_time,
+            Reservation.end_time > start_time
+        )
+    )
+    if exclude_id is not None:
+        query = query.filter(Reservation.id != exclude_id)
+    return query.first()
+
+async def get_field_info_and_conflict(db: Session, field_id: int, start_time: datetime, end_time: datetime):
+    """Cancha (copia local o fields_service) y posible reserva en conflicto"""
+    def load():
+        return get_field_snapshot(db, field_id), find_conflicting_reservation(db, field_id, start_time, end_time)
+    
+    field_info, conflicting_reservation = await run_in_threadpool(load)
+    if field_info is None:
+        field_info = await fetch_field_info_async(field_id)
+        await run_in_threadpool(store_field_snapshot, db, field_id, field_info)
+    return field_info, conflicting_reservation
+
+HOLD_CONFLICT_DETAIL = "El horario está retenido temporalmente por otro usuario"
+
+def insert_reservation(
+    db: Session, db_reservation: Reservation, user_email: str = None,
+    idempotency: IdempotentRequest = None, hold: ReservationHold = None
+):
+    """Insertar la reserva y su email de confirmación bajo el lock de la cancha (la restricción EXCLUDE cubre PostgreSQL)"""
+    if idempotency:
+        idempotency.claim(db)
+    
+    def after_flush():
+        enqueue_reservation_email(db, db_reservation, "create", user_email)
+        if idempotency:
+            idempotency.store(ReservationResponse.model_validate(db_reservation).model_dump(mode="json"))
+    
+    with field_booking_lock(db, db_reservation.field_id):
+        if hold is not None:
+            # Consumir la retención bajo el lock: si ya caducó, el horario pudo ocuparse
+            consumed = db.query(ReservationHold).filter(
+                ReservationHold.id == hold.id,
+                ReservationHold.expires_at > datetime.now()
+            ).delete(synchronize_session=False)
+            if not consumed:
+                raise HTTPException(status_code=400, detail="La retención ha caducado")
         
-        reservation_data = {
-            "id": reservation.id,
-            "field_name": reservation.field_name,
-            "field_location": reservation.field_location,
-            "start_time": reservation.start_time.strftime("%d/%m/%Y %H:%M"),
-            "duration_hours": reservation.duration_hours,
-            "total_price": reservation.total_price
-        }
+        if find_conflicting_reservation(db, db_reservation.field_id, db_reservation.start_time, db_reservation.end_time):
+            raise HTTPException(
+                status_code=400, 
+                detail="Ya existe una reserva confirmada en ese horario"
+            )
+        if find_conflicting_hold(db, db_reservation.field_id, db_reservation.start_time, db_reservation.end_time, db_reservation.user_id):
+            raise HTTPException(status_code=400, detail=HOLD_CONFLICT_DETAIL)
         
-        if action == "create":
-            email_service.send_reservation_confirmation(user_email, reservation_data)
-        elif action == "cancel":
-            email_service.send_reservation_cancellation(user_email, reservation_data, reason)
-    except Exception as e:
-        print(f"Error enviando email: {e}")
+        db.add(db_reservation)
+        record_booking(db, db_reservation)
+        commit_booking(db, after_flush)
+    db.refresh(db_reservation)
+    slot_broadcaster.publish(
+        slot_event(SLOT_BOOKED, db_reservation.field_id, db_reservation.start_time, db_reservation.end_time)
+    )
+    return db_reservation
 
 @reservations_router.post("/", response_model=ReservationResponse)
-def create_reservation(
+async def create_reservation(
     reservation: ReservationCreate,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     request: Request = None
 ):
@@ -154,48 +360,46 @@ def create_reservation(
     if request:
         auth_header = request.headers.get("authorization") or request.headers.get("Authorization")
     
-    user_data = get_current_user(auth_header)
-    user_id = user_data.get("user_id")
+    # Reintento de una petición ya completada: misma respuesta sin volver a consultar
+    # auth, fields ni conflictos
+    idempotency = idempotent_request(request, auth_header, "create_reservation", reservation.model_dump(mode="json"))
+    if idempotency:
+        replay = await run_in_threadpool(idempotency.replay, db)
+        if replay:
+            return replay
+    
+    # Calcular hora de fin
+    end_time = reservation.start_time + timedelta(hours=reservation.duration_hours)
     
-    # Obtener información de la cancha
-    field_info = get_field_info(reservation.field_id)
+    # Verificar el token antes de tocar la base de datos o fields_service
+    user_result = await get_current_user_async(auth_header)
+    
+    # Cancha + conflictos y horario de la cancha en paralelo:
+    # la latencia es la del más lento en lugar de la suma
+    field_result, schedule_result = await asyncio.gather(
+        get_field_info_and_conflict(db, reservation.field_id, reservation.start_time, end_time),
+        validate_field_schedule_async(reservation.field_id, reservation.start_time, reservation.duration_hours),
+        return_exceptions=True
+    )
+    # Respetar el orden de los errores: cancha y luego horario
+    for result in (field_result, schedule_result):
+        if isinstance(result, BaseException):
+            raise result
+    
+    user_id = user_result.get("user_id")
+    field_info, existing_reservation = field_result
     
     # Verificar que la cancha esté activa
     if not field_info.get("is_active"):
         raise HTTPException(status_code=400, detail="La cancha no está disponible")
     
-    # Calcular hora de fin
-    end_time = reservation.start_time + timedelta(hours=reservation.duration_hours)
-    
     # Verificar que no haya conflictos de horario
-    existing_reservation = db.query(Reservation).filter(
-        and_(
-            Reservation.field_id == reservation.field_id,
-            Reservation.status == ReservationStatus.CONFIRMADA,
-            Reservation.start_time < end_time,
-            Reservation.end_time > reservation.start_time
-        )
-    ).first()
-    
     if existing_reservation:
         raise HTTPException(
             status_code=400, 
             detail="Ya existe una reserva confirmada en ese horario"
         )
     
-    # Verificar que la hora esté dentro del horario de la cancha
-    opening_time = parse_time_field(field_info.get("opening_time")) or time(10, 0)
-    closing_time = parse_time_field(field_info.get("closing_time")) or time(22, 0)
-    
-    field_opening = datetime.combine(reservation.start_time.date(), opening_time)
-    field_closing = datetime.combine(reservation.start_time.date(), closing_time)
-    
-    if reservation.start_time < field_opening or end_time > field_closing:
-        raise HTTPException(
-            status_code=400,
-            detail=f"La reserva debe estar entre {opening_time.strftime('%H:%M')} y {closing_time.strftime('%H:%M')}"
-        )
-    
     # Calcular precio total
     total_price = field_info.get("price_per_hour", 0) * reservation.duration_hours
     
@@ -212,15 +416,400 @@ def create_reservation(
         notes=reservation.notes,
         status=ReservationStatus.CONFIRMADA
     )
+    # El email de confirmación queda en la outbox en la misma transacción
+    try:
+        await run_in_threadpool(insert_reservation, db, db_reservation, user_result.get("email"), idempotency)
+    except IntegrityError:
+        # Otra petición con la misma Idempotency-Key se confirmó mientras tanto
+        replay = await run_in_threadpool(idempotency.replay_after_conflict, db) if idempotency else None
+        if replay is None:
+            raise
+        return replay
     
-    db.add(db_reservation)
+    return db_reservation
+
+# Horizonte máximo de una serie de reservas recurrentes (días desde hoy)
+SERIES_MAX_DAYS_AHEAD = int(os.getenv("SERIES_MAX_DAYS_AHEAD", "182"))
+SERIES_INTERVAL_DAYS = {SeriesFrequencyEnum.WEEKLY: 7, SeriesFrequencyEnum.BIWEEKLY: 14}
+
+def series_occurrences(series: ReservationSeriesCreate) -> List[datetime]:
+    """Fechas de inicio de cada reserva de la serie"""
+    interval = timedelta(days=SERIES_INTERVAL_DAYS[series.frequency])
+    horizon = datetime.now() + timedelta(days=SERIES_MAX_DAYS_AHEAD)
+    occurrences = []
+    start_time = series.start_time
+    while len(occurrences) < MAX_SERIES_OCCURRENCES:
+        if series.count is not None and len(occurrences) >= series.count:
+            break
+        if series.until is not None and start_time.date() > series.until:
+            break
+        if start_time > horizon:
+            raise HTTPException(
+                status_code=400,
+                detail=f"La serie no puede extenderse más de {SERIES_MAX_DAYS_AHEAD} días"
+            )
+        occurrences.append(start_time)
+        start_time += interval
+    return occurrences
+
+def insert_reservation_series(
+    db: Session, field_id: int, candidates: List[Reservation], all_or_nothing: bool,
+    skipped: List[SkippedOccurrence], user_email: str = None
+):
+    """Insertar la serie y su email de resumen en una sola transacción; devuelve (insertadas, omitidas)"""
+    with field_booking_lock(db, field_id):
+        # Una sola consulta por rango para toda la serie en lugar de una por fecha
+        existing = db.query(Reservation.start_time, Reservation.end_time).filter(
+            and_(
+                Reservation.field_id == field_id,
+                Reservation.status == ReservationStatus.CONFIRMADA,
+                Reservation.start_time < candidates[-1].end_time,
+                Reservation.end_time > candidates[0].start_time
+            )
+        ).all()
+        # Retenciones vigentes de otros usuarios en el mismo rango
+        held = active_holds_query(db, field_id, candidates[0].start_time, candidates[-1].end_time).filter(
+            ReservationHold.user_id != candidates[0].user_id
+        ).with_entities(ReservationHold.start_time, ReservationHold.end_time).all()
+        
+        free, conflicts, reasons = [], [], {}
+        for candidate in candidates:
+            if any(start < candidate.end_time and end > candidate.start_time for start, end in existing):
+                reasons[candidate.start_time] = "Ya existe una reserva confirmada en ese horario"
+            elif any(start < candidate.end_time and end > candidate.start_time for start, end in held):
+                reasons[candidate.start_time] = HOLD_CONFLICT_DETAIL
+            else:
+                free.append(candidate)
+                continue
+            conflicts.append(candidate)
+        
+        if conflicts and all_or_nothing:
+            dates = ", ".join(c.start_time.strftime("%d/%m/%Y %H:%M") for c in conflicts)
+            raise HTTPException(
+                status_code=400,
+                detail=f"Ya existen reservas confirmadas en: {dates}"
+            )
+        if not free:
+            raise HTTPException(status_code=400, detail="Ninguna fecha de la serie está disponible")
+        
+        skipped = sorted(
+            skipped + [
+                SkippedOccurrence(start_time=c.start_time, reason=reasons[c.start_time])
+                for c in conflicts
+            ],
+            key=lambda s: s.start_time
+        )
+        
+        db.add_all(free)
+        for reservation in free:
+            record_booking(db, reservation)
+        # Un solo email con el resumen de la serie
+        commit_booking(db, lambda: enqueue_series_email(db, free, skipped, user_email))
+    for reservation in free:
+        db.refresh(reservation)
+    slot_broadcaster.publish(*[slot_event(SLOT_BOOKED, field_id, r.start_time, r.end_time) for r in free])
+    return free, skipped
+
+def enqueue_series_email(db: Session, reservations: List[Reservation], skipped: List[SkippedOccurrence], user_email: str):
+    """Encolar el email de resumen de una serie (requiere los ids de las reservas)"""
+    first = reservations[0]
+    series_data = {
+        "series_id": first.series_id,
+        "field_name": first.field_name,
+        "field_location": first.field_location,
+        "duration_hours": first.duration_hours,
+        "total_price": sum(r.total_price for r in reservations),
+        "occurrences": [(r.id, r.start_time.strftime("%d/%m/%Y %H:%M")) for r in reservations],
+        "skipped": [(s.start_time.strftime("%d/%m/%Y %H:%M"), s.reason) for s in skipped]
+    }
+    enqueue_email(db, "series", first.user_id, user_email, series_data)
+
+@reservations_router.post("/series", response_model=ReservationSeriesResponse)
+async def create_reservation_series(
+    series: ReservationSeriesCreate,
+    db: Session = Depends(get_db),
+    request: Request = None
+):
+    auth_header = None
+    if request:
+        auth_header = request.headers.get("authorization") or request.headers.get("Authorization")
+    
+    occurrences = series_occurrences(series)
+    first_day, last_day = occurrences[0].date(), occurrences[-1].date()
+    
+    # Token primero; después cancha y máscaras de horario de todo el rango en paralelo
+    user_result = await get_current_user_async(auth_header)
+    field_result, masks_result = await asyncio.gather(
+        run_in_threadpool(get_field_info, series.field_id, db),
+        get_field_open_masks_async(series.field_id, first_day, last_day),
+        return_exceptions=True
+    )
+    for result in (field_result, masks_result):
+        if isinstance(result, BaseException):
+            raise result
+    
+    user_id = user_result.get("user_id")
+    field_info = field_result
+    
+    if not field_info.get("is_active"):
+        raise HTTPException(status_code=400, detail="La cancha no está disponible")
+    
+    all_or_nothing = series.mode == SeriesModeEnum.ALL_OR_NOTHING
+    total_price = field_info.get("price_per_hour", 0) * series.duration_hours
+    
+    skipped = []
+    candidates = []
+    for start_time in occurrences:
+        mask = masks_result.get(start_time.date(), 0)
+        if not is_within_schedule(mask, start_time, series.duration_hours):
+            if all_or_nothing:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"La reserva del {start_time.strftime('%d/%m/%Y %H:%M')} está fuera del horario de la cancha ({describe_open_hours(mask)})"
+                )
+            skipped.append(SkippedOccurrence(start_time=start_time, reason="Fuera del horario de la cancha"))
+            continue
+        
+        candidates.append(Reservation(
+            user_id=user_id,
+            field_id=series.field_id,
+            start_time=start_time,
+            end_time=start_time + timedelta(hours=series.duration_hours),
+            duration_hours=series.duration_hours,
+            field_name=field_info.get("name"),
+            field_location=field_info.get("location"),
+            total_price=total_price,
+            notes=series.notes,
+            status=ReservationStatus.CONFIRMADA
+        ))
+    
+    if not candidates:
+        raise HTTPException(status_code=400, detail="Ninguna fecha de la serie está disponible")
+    
+    series_id = str(uuid.uuid4())
+    for candidate in candidates:
+        candidate.series_id = series_id
+    
+    created, skipped = await run_in_threadpool(
+        insert_reservation_series, db, series.field_id, candidates, all_or_nothing,
+        skipped, user_result.get("email")
+    )
+    
+    return ReservationSeriesResponse(series_id=series_id, created=created, skipped=skipped)
+
+def insert_hold(db: Session, hold: ReservationHold):
+    """Crear la retención bajo el lock de la cancha con las mismas reglas de solapamiento que las reservas"""
+    with field_booking_lock(db, hold.field_id):
+        if find_conflicting_reservation(db, hold.field_id, hold.start_time, hold.end_time):
+            raise HTTPException(status_code=400, detail="Ya existe una reserva confirmada en ese horario")
+        if find_conflicting_hold(db, hold.field_id, hold.start_time, hold.end_time, hold.user_id):
+            raise HTTPException(status_code=400, detail=HOLD_CONFLICT_DETAIL)
+        
+        # La nueva retención sustituye a las del mismo usuario que se solapan
+        active_holds_query(db, hold.field_id, hold.start_time, hold.end_time).filter(
+            ReservationHold.user_id == hold.user_id
+        ).delete(synchronize_session=False)
+        db.add(hold)
+        db.commit()
+    db.refresh(hold)
+    slot_broadcaster.publish(slot_event(SLOT_HELD, hold.field_id, hold.start_time, hold.end_time, hold.expires_at))
+    return hold
+
+@reservations_router.post("/holds", response_model=ReservationHoldResponse)
+async def create_reservation_hold(
+    hold_request: ReservationHoldCreate,
+    db: Session = Depends(get_db),
+    request: Request = None
+):
+    """Retener un horario durante HOLD_TTL_SECONDS mientras se completa la reserva"""
+    auth_header = None
+    if request:
+        auth_header = request.headers.get("authorization") or request.headers.get("Authorization")
+    
+    end_time = hold_request.start_time + timedelta(hours=hold_request.duration_hours)
+    
+    # Las mismas validaciones que al crear la reserva: token primero, el resto en paralelo
+    user_result = await get_current_user_async(auth_header)
+    field_result, schedule_result = await asyncio.gather(
+        get_field_info_and_conflict(db, hold_request.field_id, hold_request.start_time, end_time),
+        validate_field_schedule_async(hold_request.field_id, hold_request.start_time, hold_request.duration_hours),
+        return_exceptions=True
+    )
+    for result in (field_result, schedule_result):
+        if isinstance(result, BaseException):
+            raise result
+    
+    field_info, existing_reservation = field_result
+    if not field_info.get("is_active"):
+        raise HTTPException(status_code=400, detail="La cancha no está disponible")
+    if existing_reservation:
+        raise HTTPException(status_code=400, detail="Ya existe una reserva confirmada en ese horario")
+    
+    hold = ReservationHold(
+        user_id=user_result.get("user_id"),
+        field_id=hold_request.field_id,
+        start_time=hold_request.start_time,
+        end_time=end_time,
+        duration_hours=hold_request.duration_hours,
+        field_name=field_info.get("name"),
+        field_location=field_info.get("location"),
+        total_price=field_info.get("price_per_hour", 0) * hold_request.duration_hours,
+        notes=hold_request.notes,
+        expires_at=datetime.now() + timedelta(seconds=HOLD_TTL_SECONDS)
+    )
+    await run_in_threadpool(insert_hold, db, hold)
+    
+    return hold
+
+def get_user_hold(db: Session, hold_id: int, user_id: int) -> ReservationHold:
+    """Retención vigente del usuario; 404 si no existe, es de otro usuario o caducó"""
+    hold = db.query(ReservationHold).filter(
+        ReservationHold.id == hold_id,
+        ReservationHold.user_id == user_id,
+        ReservationHold.expires_at > datetime.now()
+    ).first()
+    if not hold:
+        raise HTTPException(status_code=404, detail="Retención no encontrada o caducada")
+    return hold
+
+@reservations_router.post("/holds/{hold_id}/confirm", response_model=ReservationResponse)
+def confirm_reservation_hold(
+    hold_id: int,
+    db: Session = Depends(get_db),
+    request: Request = None
+):
+    """Convertir una retención en reserva confirmada sin volver a consultar fields_service"""
+    auth_header = None
+    if request:
+        auth_header = request.headers.get("authorization") or request.headers.get("Authorization")
+    
+    user_data = get_current_user(auth_header)
+    hold = get_user_hold(db, hold_id, user_data.get("user_id"))
+    
+    db_reservation = Reservation(
+        user_id=hold.user_id,
+        field_id=hold.field_id,
+        start_time=hold.start_time,
+        end_time=hold.end_time,
+        duration_hours=hold.duration_hours,
+        field_name=hold.field_name,
+        field_location=hold.field_location,
+        total_price=hold.total_price,
+        notes=hold.notes,
+        status=ReservationStatus.CONFIRMADA
+    )
+    # Si la retención venía de la lista de espera, la entrada queda atendida con la reserva
+    mark_offer_accepted(db, hold.id)
+    return insert_reservation(db, db_reservation, user_data.get("email"), hold=hold)
+
+@reservations_router.delete("/holds/{hold_id}")
+def release_reservation_hold(
+    hold_id: int,
+    db: Session = Depends(get_db),
+    request: Request = None
+):
+    """Liberar una retención antes de que caduque"""
+    auth_header = None
+    if request:
+        auth_header = request.headers.get("authorization") or request.headers.get("Authorization")
+    
+    user_data = get_current_user(auth_header)
+    hold = get_user_hold(db, hold_id, user_data.get("user_id"))
+    with field_booking_lock(db, hold.field_id):
+        # Si era una oferta de la lista de espera, se rechaza y el horario pasa al siguiente
+        decline_offer(db, hold.id)
+        db.delete(hold)
+        offer = offer_freed_slot(db, hold)
+        db.commit()
+    events = [slot_event(SLOT_FREED, hold.field_id, hold.start_time, hold.end_time)]
+    if offer:
+        events.append(slot_event(SLOT_HELD, offer.field_id, offer.start_time, offer.end_time, offer.offer_expires_at))
+    slot_broadcaster.publish(*events)
+    
+    return {"message": "Retención liberada"}
+
+@reservations_router.post("/waitlist", response_model=WaitlistResponse)
+def join_waitlist(
+    waitlist_request: WaitlistCreate,
+    db: Session = Depends(get_db),
+    request: Request = None
+):
+    """Apuntarse a un horario ocupado; se ofrece al cancelarse la reserva que lo ocupa"""
+    auth_header = None
+    if request:
+        auth_header = request.headers.get("authorization") or request.headers.get("Authorization")
+    
+    user_data = get_current_user(auth_header)
+    current_user_id = user_data.get("user_id")
+    end_time = waitlist_request.start_time + timedelta(hours=waitlist_request.duration_hours)
+    
+    if not (
+        find_conflicting_reservation(db, waitlist_request.field_id, waitlist_request.start_time, end_time)
+        or find_conflicting_hold(db, waitlist_request.field_id, waitlist_request.start_time, end_time, current_user_id)
+    ):
+        raise HTTPException(status_code=400, detail="El horario está disponible, puedes reservarlo directamente")
+    
+    already_waiting = db.query(WaitlistEntry.id).filter(
+        WaitlistEntry.field_id == waitlist_request.field_id,
+        WaitlistEntry.start_time == waitlist_request.start_time,
+        WaitlistEntry.user_id == current_user_id,
+        WaitlistEntry.status == WaitlistStatus.ESPERANDO
+    ).first()
+    if already_waiting:
+        raise HTTPException(status_code=400, detail="Ya estás en la lista de espera de ese horario")
+    
+    entry = WaitlistEntry(
+        user_id=current_user_id,
+        field_id=waitlist_request.field_id,
+        start_time=waitlist_request.start_time,
+        end_time=end_time,
+        duration_hours=waitlist_request.duration_hours,
+        notes=waitlist_request.notes
+    )
+    db.add(entry)
     db.commit()
-    db.refresh(db_reservation)
+    db.refresh(entry)
     
-    # Enviar email de confirmación en background
-    background_tasks.add_task(send_reservation_email, db_reservation, "create", auth_header)
+    return entry
+
+@reservations_router.get("/waitlist/my", response_model=List[WaitlistResponse])
+def get_my_waitlist(
+    db: Session = Depends(get_read_db),
+    request: Request = None
+):
+    """Entradas de lista de espera del usuario actual, con las ofertas pendientes de confirmar"""
+    auth_header = None
+    if request:
+        auth_header = request.headers.get("authorization") or request.headers.get("Authorization")
     
-    return db_reservation
+    user_data = get_current_user(auth_header)
+    return db.query(WaitlistEntry).filter(
+        WaitlistEntry.user_id == user_data.get("user_id"),
+        WaitlistEntry.status.in_([WaitlistStatus.ESPERANDO, WaitlistStatus.OFRECIDA])
+    ).order_by(WaitlistEntry.start_time).all()
+
+@reservations_router.delete("/waitlist/{entry_id}")
+def leave_waitlist(
+    entry_id: int,
+    db: Session = Depends(get_db),
+    request: Request = None
+):
+    """Salir de la lista de espera de un horario"""
+    auth_header = None
+    if request:
+        auth_header = request.headers.get("authorization") or request.headers.get("Authorization")
+    
+    user_data = get_current_user(auth_header)
+    entry = db.query(WaitlistEntry).filter(
+        WaitlistEntry.id == entry_id,
+        WaitlistEntry.user_id == user_data.get("user_id")
+    ).first()
+    if not entry:
+        raise HTTPException(status_code=404, detail="Entrada de lista de espera no encontrada")
+    db.delete(entry)
+    db.commit()
+    
+    return {"message": "Has salido de la lista de espera"}
 
 @reservations_router.get("/", response_model=ReservationListResponse)
 def list_reservations(
@@ -229,7 +818,9 @@ def list_reservations(
     status: Optional[str] = Query(None),
     field_id: Optional[int] = Query(None),
     user_id: Optional[int] = Query(None),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="next_cursor de la página anterior (ignora skip)"),
+    include_total: bool = Query(True, description="Contar el total exacto de reservas"),
+    db: Session = Depends(get_read_db),
     request: Request = None
 ):
     auth_header = None
@@ -245,20 +836,11 @@ def list_reservations(
     # Si roles service falla, usar el is_admin del auth service
     is_admin = is_admin_from_roles or is_admin_from_auth
     
-    # DEBUG: Agregar logging
-    print(f"DEBUG - User ID: {current_user_id}")
-    print(f"DEBUG - Is Admin: {is_admin}")
-    print(f"DEBUG - Status filter: {status}")
-    print(f"DEBUG - Field ID filter: {field_id}")
-    
     query = db.query(Reservation)
     
     if not is_admin:
         # Usuario normal solo ve sus reservas
         query = query.filter(Reservation.user_id == current_user_id)
-        print(f"DEBUG - Non-admin user, filtering by user_id: {current_user_id}")
-    else:
-        print("DEBUG - Admin user, showing all reservations")
     
     if status:
         try:
@@ -271,24 +853,49 @@ def list_reservations(
         query = query.filter(Reservation.field_id == field_id)
     
     # Ordenar por fecha de creación descendente
-    query = query.order_by(Reservation.created_at.desc())
-    
-    total = query.count()
-    reservations = query.offset(skip).limit(limit).all()
-    
-    print(f"DEBUG - Total reservations found: {total}")
-    print(f"DEBUG - Reservations returned: {len(reservations)}")
+    return ReservationListResponse(**paginate_reservations(query, limit, skip, cursor, include_total))
+
+# Caché de estadísticas (0 desactiva la caché)
+STATS_CACHE_TTL_SECONDS = int(os.getenv("STATS_CACHE_TTL_SECONDS", "30"))
+stats_cache = {}  # "snapshot" -> ReservationStatsResponse
+
+def compute_reservation_stats(db: Session) -> ReservationStatsResponse:
+    """Calcular todas las estadísticas con una sola consulta agregada"""
+    now = datetime.now()
+    today_start = datetime.combine(now.date(), time.min)
+    tomorrow_start = today_start + timedelta(days=1)
+    
+    # Meses archivados fuera de la tabla: sus totales vienen de reservation_archives
+    def archived_total(column):
+        return select(func.coalesce(func.sum(column), 0)).scalar_subquery()
+    
+    confirmed = Reservation.status == ReservationStatus.CONFIRMADA
+    row = db.query(
+        func.count(Reservation.id).label("total"),
+        func.count(Reservation.id).filter(and_(confirmed, Reservation.start_time > now)).label("active"),
+        func.count(Reservation.id).filter(Reservation.status == ReservationStatus.CANCELADA).label("cancelled"),
+        func.count(Reservation.id).filter(
+            and_(Reservation.start_time >= today_start, Reservation.start_time < tomorrow_start)
+        ).label("today"),
+        func.sum(Reservation.total_price).filter(confirmed).label("revenue"),
+        archived_total(ReservationArchive.row_count).label("archived_total"),
+        archived_total(ReservationArchive.cancelled_count).label("archived_cancelled"),
+        archived_total(ReservationArchive.revenue).label("archived_revenue")
+    ).one()
     
-    return ReservationListResponse(
-        reservations=reservations,
-        total=total,
-        page=skip // limit + 1,
-        size=limit
+    return ReservationStatsResponse(
+        total_reservations=row.total + row.archived_total,
+        active_reservations=row.active,
+        cancelled_reservations=row.cancelled + row.archived_cancelled,
+        reservations_today=row.today,
+        total_revenue=float(row.revenue or 0) + float(row.archived_revenue),
+        as_of=now
     )
 
 @reservations_router.get("/stats", response_model=ReservationStatsResponse)
 def get_reservation_stats(
-    db: Session = Depends(get_db),
+    as_of: Optional[datetime] = Query(None, description="Aceptar una foto en caché tomada en este instante o después"),
+    db: Session = Depends(get_read_db),
     request: Request = None
 ):
     auth_header = None
@@ -307,50 +914,200 @@ def get_reservation_stats(
     if not is_admin:
         raise HTTPException(status_code=403, detail="Permisos insuficientes")
     
-    now = datetime.now()
-    today_start = datetime.combine(now.date(), datetime.min.time())
-    today_end = datetime.combine(now.date(), datetime.max.time())
+    # Las fotos se guardan en hora local sin zona: normalizar un as_of con zona horaria
+    if as_of is not None and as_of.tzinfo is not None:
+        as_of = as_of.astimezone().replace(tzinfo=None)
+    
+    # Reutilizar la última foto si sigue vigente o si el cliente acepta su antigüedad
+    cached = stats_cache.get("snapshot")
+    if cached is not None:
+        if as_of is not None and cached.as_of >= as_of:
+            return cached
+        if as_of is None and (datetime.now() - cached.as_of).total_seconds() < STATS_CACHE_TTL_SECONDS:
+            return cached
+    
+    stats = compute_reservation_stats(db)
+    if STATS_CACHE_TTL_SECONDS > 0:
+        stats_cache["snapshot"] = stats
+    return stats
+
+# Rango máximo de /rollups (días)
+ROLLUPS_MAX_DAYS = int(os.getenv("ROLLUPS_MAX_DAYS", "1100"))
+
+def rollup_period(day: date, group_by: RollupGroupByEnum) -> date:
+    """Inicio del periodo al que pertenece un día"""
+    if group_by == RollupGroupByEnum.WEEK:
+        return day - timedelta(days=day.weekday())
+    if group_by == RollupGroupByEnum.MONTH:
+        return day.replace(day=1)
+    return day
+
+@reservations_router.get("/rollups", response_model=RollupsResponse)
+def get_reservation_rollups(
+    date_from: Optional[date] = Query(None, alias="from", description="Primer día de juego (por defecto hace 30 días)"),
+    date_to: Optional[date] = Query(None, alias="to", description="Último día de juego (por defecto hoy)"),
+    group_by: RollupGroupByEnum = Query(RollupGroupByEnum.DAY),
+    field_id: Optional[int] = Query(None, description="Filtrar por cancha"),
+    db: Session = Depends(get_read_db),
+    request: Request = None
+):
+    """Ingresos y ocupación agregados desde la tabla daily_rollup"""
+    auth_header = None
+    if request:
+        auth_header = request.headers.get("authorization") or request.headers.get("Authorization")
+    
+    user_data = get_current_user(auth_header)
+    current_user_id = user_data.get("user_id")
+    
+    is_admin_from_auth = user_data.get("is_admin", False)
+    is_admin_from_roles = check_admin_permission(current_user_id, auth_header)
+    
+    # Si roles service falla, usar el is_admin del auth service
+    is_admin = is_admin_from_roles or is_admin_from_auth
+
+    if not is_admin:
+        raise HTTPException(status_code=403, detail="Permisos insuficientes")
     
+    date_to = date_to or date.today()
+    date_from = date_from or date_to - timedelta(days=30)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="La fecha inicial debe ser anterior a la final")
+    if (date_to - date_from).days > ROLLUPS_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"El rango no puede superar {ROLLUPS_MAX_DAYS} días")
+    
+    key = DailyRollup.field_id if group_by == RollupGroupByEnum.FIELD else DailyRollup.day
+    query = db.query(
+        key.label("key"),
+        func.sum(DailyRollup.bookings).label("bookings"),
+        func.sum(DailyRollup.cancellations).label("cancellations"),
+        func.sum(DailyRollup.revenue).label("revenue"),
+        func.sum(DailyRollup.booked_hours).label("booked_hours")
+    ).filter(DailyRollup.day >= date_from, DailyRollup.day <= date_to)
+    if field_id is not None:
+        query = query.filter(DailyRollup.field_id == field_id)
+    rows = query.group_by(key).order_by(key).all()
+    
+    # Como mucho una fila por día: semanas y meses se agrupan aquí
+    buckets = {}
+    for row in rows:
+        if group_by == RollupGroupByEnum.FIELD:
+            bucket_key = row.key
+            bucket = buckets.setdefault(bucket_key, RollupBucket(field_id=row.key, bookings=0, cancellations=0, revenue=0, booked_hours=0))
+        else:
+            bucket_key = rollup_period(row.key, group_by)
+            bucket = buckets.setdefault(bucket_key, RollupBucket(period=bucket_key, field_id=field_id, bookings=0, cancellations=0, revenue=0, booked_hours=0))
+        bucket.bookings += row.bookings
+        bucket.cancellations += row.cancellations
+        bucket.revenue += float(row.revenue or 0)
+        bucket.booked_hours += row.booked_hours
+    
+    return RollupsResponse(date_from=date_from, date_to=date_to, group_by=group_by, buckets=list(buckets.values()))
 
+@reservations_router.get("/analytics/heatmap", response_model=HeatmapResponse)
+def get_occupancy_heatmap(
+    date_from: Optional[date] = Query(None, alias="from", description="Primer día de juego (por defecto hace 90 días)"),
+    date_to: Optional[date] = Query(None, alias="to", description="Último día de juego (por defecto hoy)"),
+    field_id: Optional[int] = Query(None, description="Filtrar por cancha"),
+    db: Session = Depends(get_read_db),
+    request: Request = None
+):
+    """Horas reservadas por día de la semana y hora del día"""
+    auth_header = None
+    if request:
+        auth_header = request.headers.get("authorization") or request.headers.get("Authorization")
     
-    # Estadísticas básicas
-    total_reservations = db.query(Reservation).count()
-    print(f"DEBUG - Total reservations: {total_reservations}")
+    user_data = get_current_user(auth_header)
+    current_user_id = user_data.get("user_id")
     
-    active_reservations = db.query(Reservation).filter(
-        and_(
-            Reservation.status == ReservationStatus.CONFIRMADA,
-            Reservation.start_time > now
-        )
-    ).count()
-    print(f"DEBUG - Active reservations: {active_reservations}")
+    is_admin_from_auth = user_data.get("is_admin", False)
+    is_admin_from_roles = check_admin_permission(current_user_id, auth_header)
     
-    cancelled_reservations = db.query(Reservation).filter(
-        Reservation.status == ReservationStatus.CANCELADA
-    ).count()
-    print(f"DEBUG - Cancelled reservations: {cancelled_reservations}")
+    # Si roles service falla, usar el is_admin del auth service
+    is_admin = is_admin_from_roles or is_admin_from_auth
+
+    if not is_admin:
+        raise HTTPException(status_code=403, detail="Permisos insuficientes")
     
-    reservations_today = db.query(Reservation).filter(
-        and_(
-            Reservation.start_time >= today_start,
-            Reservation.start_time <= today_end
-        )
-    ).count()
-    print(f"DEBUG - Reservations today: {reservations_today}")
+    date_to = date_to or date.today()
+    date_from = date_from or date_to - timedelta(days=90)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="La fecha inicial debe ser anterior a la final")
+    if (date_to - date_from).days > ROLLUPS_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"El rango no puede superar {ROLLUPS_MAX_DAYS} días")
     
-    # Calcular ingresos totales de reservas confirmadas
-    total_revenue_result = db.query(func.sum(Reservation.total_price)).filter(
-        Reservation.status == ReservationStatus.CONFIRMADA
-    ).scalar()
-    total_revenue = float(total_revenue_result or 0)
-    print(f"DEBUG - Total revenue: {total_revenue}")
+    return get_heatmap(db, field_id, date_from, date_to)
+
+@reservations_router.get("/stream")
+async def stream_slot_changes(
+    request: Request,
+    field_ids: Optional[str] = Query(None, description="IDs de cancha separados por comas (por defecto todas)"),
+    day: Optional[date] = Query(None, alias="date", description="Solo cambios de este día de juego"),
+):
+    """Cambios de ocupación de horarios en tiempo real (Server-Sent Events)"""
+    try:
+        field_id_filter = {int(value) for value in field_ids.split(",") if value.strip()} if field_ids else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="field_ids debe ser una lista de números separados por comas")
     
-    return ReservationStatsResponse(
-        total_reservations=total_reservations,
-        active_reservations=active_reservations,
-        cancelled_reservations=cancelled_reservations,
-        reservations_today=reservations_today,
-        total_revenue=total_revenue
+    try:
+        subscription = slot_broadcaster.subscribe(field_id_filter, day.isoformat() if day else None)
+    except OverflowError:
+        raise HTTPException(status_code=503, detail="Demasiados clientes conectados, inténtalo más tarde")
+    
+    return StreamingResponse(
+        slot_event_stream(request, subscription),
+        media_type="text/event-stream",
+        # Sin buffer en NGINX para que cada evento llegue en cuanto se publica
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+EXPORT_MEDIA_TYPES = {
+    ExportFormatEnum.CSV: "text/csv",
+    ExportFormatEnum.NDJSON: "application/x-ndjson",
+}
+
+@reservations_router.get("/export")
+def export_reservations(
+    date_from: Optional[date] = Query(None, alias="from", description="Primer día de juego"),
+    date_to: Optional[date] = Query(None, alias="to", description="Último día de juego"),
+    format: ExportFormatEnum = Query(ExportFormatEnum.CSV),
+    status: Optional[str] = Query(None),
+    request: Request = None
+):
+    """Exportar reservas en streaming (memoria constante) para contabilidad"""
+    auth_header = None
+    if request:
+        auth_header = request.headers.get("authorization") or request.headers.get("Authorization")
+    
+    user_data = get_current_user(auth_header)
+    current_user_id = user_data.get("user_id")
+    
+    is_admin_from_auth = user_data.get("is_admin", False)
+    is_admin_from_roles = check_admin_permission(current_user_id, auth_header)
+    
+    # Si roles service falla, usar el is_admin del auth service
+    is_admin = is_admin_from_roles or is_admin_from_auth
+
+    if not is_admin:
+        raise HTTPException(status_code=403, detail="Permisos insuficientes")
+    
+    if date_from and date_to and date_from > date_to:
+        raise HTTPException(status_code=400, detail="La fecha inicial debe ser anterior a la final")
+    
+    status_enum = None
+    if status:
+        try:
+            status_enum = ReservationStatus(status)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Estado de reserva inválido")
+    
+    query = export_query(date_from, date_to, status_enum)
+    content = export_csv(query) if format == ExportFormatEnum.CSV else export_ndjson(query)
+    filename = f"reservas_{date_from or 'inicio'}_{date_to or 'hoy'}.{format.value}"
+    return StreamingResponse(
+        content,
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
     )
 
 @reservations_router.get("/my", response_model=ReservationListResponse)
@@ -358,7 +1115,9 @@ def get_my_reservations(
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
     status: Optional[str] = Query(None),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="next_cursor de la página anterior (ignora skip)"),
+    include_total: bool = Query(True, description="Contar el total exacto de reservas"),
+    db: Session = Depends(get_read_db),
     request: Request = None
 ):
     auth_header = None
@@ -377,23 +1136,14 @@ def get_my_reservations(
         except ValueError:
             raise HTTPException(status_code=400, detail="Estado de reserva inválido")
     
-    query = query.order_by(Reservation.created_at.desc())
-    
-    total = query.count()
-    reservations = query.offset(skip).limit(limit).all()
-    
-    return ReservationListResponse(
-        reservations=reservations,
-        total=total,
-        page=skip // limit + 1,
-        size=limit
-    )
+    return ReservationListResponse(**paginate_reservations(query, limit, skip, cursor, include_total))
 
 @reservations_router.get("/{reservation_id}", response_model=ReservationResponse)
 def get_reservation(
     reservation_id: int,
-    db: Session = Depends(get_db),
-    request: Request = None
+    db: Session = Depends(get_read_db),
+    request: Request = None,
+    response: Response = None
 ):
     auth_header = None
     if request:
@@ -415,6 +1165,7 @@ def get_reservation(
     if not is_admin and reservation.user_id != current_user_id:
         raise HTTPException(status_code=403, detail="No tienes permisos para ver esta reserva")
     
+    set_version_etag(response, reservation.version)
     return reservation
 
 @reservations_router.put("/{reservation_id}", response_model=ReservationResponse)
@@ -422,7 +1173,8 @@ def update_reservation(
     reservation_id: int,
     reservation_update: ReservationUpdate,
     db: Session = Depends(get_db),
-    request: Request = None
+    request: Request = None,
+    response: Response = None
 ):
     auth_header = None
     if request:
@@ -443,8 +1195,17 @@ def update_reservation(
     if not reservation.can_be_cancelled:
         raise HTTPException(status_code=400, detail="Esta reserva no puede ser modificada")
     
+    # If-Match con el ETag leído: 409 si otra petición la cambió desde entonces.
+    # Sin cabecera, version_id_col sigue rechazando el UPDATE si cambia entre la lectura y el commit
+    check_if_match(request, reservation.version)
+    
     # Actualizar campos
     update_data = reservation_update.dict(exclude_unset=True)
+    previous_day = reservation.start_time.date()
+    previous_price = reservation.total_price
+    previous_hours = reservation.duration_hours
+    previous_start = reservation.start_time
+    previous_end = reservation.end_time
     
     if "start_time" in update_data or "duration_hours" in update_data:
         # Si se cambia la hora o duración, recalcular
@@ -452,43 +1213,58 @@ def update_reservation(
         new_duration = update_data.get("duration_hours", reservation.duration_hours)
         new_end_time = new_start_time + timedelta(hours=new_duration)
         
-        # Verificar conflictos (excluyendo la reserva actual)
-        conflicting_reservation = db.query(Reservation).filter(
-            and_(
-                Reservation.field_id == reservation.field_id,
-                Reservation.status == ReservationStatus.CONFIRMADA,
-                Reservation.id != reservation_id,
-                Reservation.start_time < new_end_time,
-                Reservation.end_time > new_start_time
-            )
-        ).first()
-        
-        if conflicting_reservation:
-            raise HTTPException(
-                status_code=400,
-                detail="Ya existe una reserva confirmada en ese horario"
-            )
+        validate_field_schedule(reservation.field_id, new_start_time, new_duration)
         
         # Obtener info de cancha y recalcular precio si cambió la duración
         if "duration_hours" in update_data:
-            field_info = get_field_info(reservation.field_id)
+            field_info = get_field_info(reservation.field_id, db)
             reservation.total_price = field_info.get("price_per_hour", 0) * new_duration
         
         reservation.end_time = new_end_time
+        # El recordatorio enviado era para la hora anterior: el scheduler avisará de la nueva
+        if new_start_time != reservation.start_time:
+            reservation.reminded_at = None
     
     for key, value in update_data.items():
         setattr(reservation, key, value)
     
-    db.commit()
+    with field_booking_lock(db, reservation.field_id):
+        # Verificar conflictos (excluyendo la reserva actual)
+        if "start_time" in update_data or "duration_hours" in update_data:
+            conflicting_reservation = find_conflicting_reservation(
+                db, reservation.field_id, reservation.start_time, reservation.end_time, exclude_id=reservation_id
+            )
+            if conflicting_reservation:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Ya existe una reserva confirmada en ese horario"
+                )
+            if find_conflicting_hold(db, reservation.field_id, reservation.start_time, reservation.end_time, current_user_id):
+                raise HTTPException(status_code=400, detail=HOLD_CONFLICT_DETAIL)
+            
+            # Mover la reserva en los totales diarios (puede cambiar de día y de precio)
+            apply_rollup_delta(
+                db, reservation.field_id, previous_day,
+                bookings=-1, revenue=-previous_price, booked_hours=-previous_hours
+            )
+            apply_occupancy_delta(db, reservation.field_id, previous_start, previous_hours, -1)
+            record_booking(db, reservation)
+        
+        commit_booking(db)
     db.refresh(reservation)
+    if "start_time" in update_data or "duration_hours" in update_data:
+        slot_broadcaster.publish(
+            slot_event(SLOT_FREED, reservation.field_id, previous_start, previous_end),
+            slot_event(SLOT_BOOKED, reservation.field_id, reservation.start_time, reservation.end_time)
+        )
     
+    set_version_etag(response, reservation.version)
     return reservation
 
 @reservations_router.post("/{reservation_id}/cancel")
 def cancel_reservation(
     reservation_id: int,
     cancel_request: ReservationCancelRequest,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     request: Request = None
 ):
@@ -496,9 +1272,26 @@ def cancel_reservation(
     if request:
         auth_header = request.headers.get("authorization") or request.headers.get("Authorization")
     
+    idempotency = idempotent_request(
+        request, auth_header, "cancel_reservation", {"reservation_id": reservation_id, **cancel_request.model_dump()}
+    )
+    if idempotency:
+        replay = idempotency.replay(db)
+        if replay:
+            return replay
+    
     user_data = get_current_user(auth_header)
     current_user_id = user_data.get("user_id")
     
+    if idempotency:
+        try:
+            idempotency.claim(db)
+        except IntegrityError:
+            replay = idempotency.replay_after_conflict(db)
+            if replay is None:
+                raise
+            return replay
+    
     reservation = db.query(Reservation).filter(Reservation.id == reservation_id).first()
     if not reservation:
         raise HTTPException(status_code=404, detail="Reserva no encontrada")
@@ -523,35 +1316,127 @@ def cancel_reservation(
     if cancel_request.reason:
         reservation.notes = f"{reservation.notes or ''}\nCancelación: {cancel_request.reason}".strip()
     
-    db.commit()
+    # Si cancela un admin, el worker de emails consulta el email del dueño
+    user_email = user_data.get("email") if reservation.user_id == current_user_id else None
+    
+    record_cancellation(db, reservation)
+    enqueue_reservation_email(db, reservation, "cancel", user_email, cancel_request.reason)
+    response = {"message": "Reserva cancelada exitosamente"}
+    if idempotency:
+        idempotency.store(response)
+    
+    with field_booking_lock(db, reservation.field_id):
+        # El horario liberado se retiene para el primero de la lista de espera, en la misma transacción
+        offer = offer_freed_slot(db, reservation)
+        db.commit()
     db.refresh(reservation)
     
-    # Enviar email de cancelación en background
-    background_tasks.add_task(
-        send_reservation_email, 
-        reservation, 
-        "cancel", 
-        auth_header, 
-        cancel_request.reason
-    )
+    events = [slot_event(SLOT_FREED, reservation.field_id, reservation.start_time, reservation.end_time)]
+    if offer:
+        events.append(slot_event(SLOT_HELD, offer.field_id, offer.start_time, offer.end_time, offer.offer_expires_at))
+    slot_broadcaster.publish(*events)
     
-    return {"message": "Reserva cancelada exitosamente"}
+    return response
+
+@reservations_router.post("/bulk-cancel", response_model=BulkCancelResponse)
+def bulk_cancel_reservations(
+    bulk_request: BulkCancelRequest,
+    db: Session = Depends(get_db),
+    request: Request = None
+):
+    """Cancelar todas las reservas confirmadas de una cancha en un rango (cierre por lluvia o mantenimiento)"""
+    auth_header = None
+    if request:
+        auth_header = request.headers.get("authorization") or request.headers.get("Authorization")
+    
+    user_data = get_current_user(auth_header)
+    current_user_id = user_data.get("user_id")
+    
+    is_admin_from_auth = user_data.get("is_admin", False)
+    is_admin_from_roles = check_admin_permission(current_user_id, auth_header)
+    
+    # Si roles service falla, usar el is_admin del auth service
+    is_admin = is_admin_from_roles or is_admin_from_auth
+
+    if not is_admin:
+        raise HTTPException(status_code=403, detail="Permisos insuficientes")
+    
+    now = datetime.now()
+    values = {
+        Reservation.status: ReservationStatus.CANCELADA,
+        Reservation.cancelled_at: now,
+        Reservation.cancelled_by: current_user_id,
+        Reservation.updated_at: now,
+        # Los UPDATE masivos no pasan por el ORM: la versión se incrementa a mano
+        Reservation.version: Reservation.version + 1,
+    }
+    if bulk_request.reason:
+        cancellation_note = f"Cancelación: {bulk_request.reason}"
+        values[Reservation.notes] = case(
+            (func.coalesce(Reservation.notes, "") == "", cancellation_note),
+            else_=Reservation.notes + f"\n{cancellation_note}"
+        )
+    
+    with field_booking_lock(db, bulk_request.field_id):
+        # Un solo UPDATE ... RETURNING sobre ix_reservations_field_status_start; solo reservas que no han empezado
+        cancelled = db.execute(
+            update(Reservation).where(
+                Reservation.field_id == bulk_request.field_id,
+                Reservation.status == ReservationStatus.CONFIRMADA,
+                Reservation.start_time < bulk_request.end_time,
+                Reservation.end_time > bulk_request.start_time,
+                Reservation.start_time > now
+            ).values(values).returning(
+                Reservation.id, Reservation.user_id, Reservation.field_name, Reservation.field_location,
+                Reservation.start_time, Reservation.end_time, Reservation.duration_hours, Reservation.total_price
+            ).execution_options(synchronize_session=False)
+        ).all()
+        
+        # La cancha cierra: las retenciones del rango se liberan y el horario no se ofrece a la lista de espera
+        holds_released = active_holds_query(
+            db, bulk_request.field_id, bulk_request.start_time, bulk_request.end_time
+        ).delete(synchronize_session=False)
+        
+        record_bulk_cancellation(db, bulk_request.field_id, cancelled)
+        # Los avisos salen por lotes desde el worker de emails (destinatarios consultados en bloque)
+        emails_queued = enqueue_reservation_emails(db, cancelled, "cancel", bulk_request.reason)
+        db.commit()
+    
+    slot_broadcaster.publish(*[
+        slot_event(SLOT_FREED, bulk_request.field_id, r.start_time, r.end_time) for r in cancelled
+    ])
+    
+    return BulkCancelResponse(
+        cancelled=len(cancelled),
+        emails_queued=emails_queued,
+        holds_released=holds_released,
+        reservation_ids=[r.id for r in cancelled]
+    )
 
 # Endpoints para el dashboard y estadísticas
 
+def field_reservations_on_date_query(db: Session, field_id: int, day: date):
+    """Reservas confirmadas de una cancha que empiezan en un día (rango semiabierto, usa el índice compuesto)"""
+    day_start = datetime.combine(day, time.min)
+    return db.query(Reservation).filter(
+        Reservation.field_id == field_id,
+        Reservation.status == ReservationStatus.CONFIRMADA,
+        Reservation.start_time >= day_start,
+        Reservation.start_time < day_start + timedelta(days=1)
+    )
+
 @reservations_router.get("/field/{field_id}/date/{date}")
 def get_field_reservations_by_date(
     field_id: int,
     date: date,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Obtener reservas de una cancha en una fecha específica (para verificar disponibilidad)"""
-    reservations = db.query(Reservation).filter(
-        and_(
-            Reservation.field_id == field_id,
-            Reservation.status == ReservationStatus.CONFIRMADA,
-            func.date(Reservation.start_time) == date
-        )
+    reservations = field_reservations_on_date_query(db, field_id, date).all()
+    # Las retenciones vigentes también ocupan el horario
+    day_start = datetime.combine(date, time.min)
+    holds = active_holds_query(db, field_id, day_start, day_start + timedelta(days=1)).filter(
+        ReservationHold.start_time >= day_start
     ).all()
     
     return [
@@ -563,5 +1448,68 @@ def get_field_reservations_by_date(
             "status": r.status.value
         }
         for r in reservations
+    ] + [
+        {
+            "id": h.id,
+            "start_time": h.start_time.isoformat(),
+            "end_time": h.end_time.isoformat(),
+            "duration_hours": h.duration_hours,
+            "status": "retenida",
+            "expires_at": h.expires_at.isoformat()
+        }
+        for h in holds
     ]
 
+@reservations_router.post("/internal/field-events")
+def receive_field_events(
+    payload: FieldEventsRequest,
+    db: Session = Depends(get_db),
+    request: Request = None
+):
+    """Actualizar la copia local de canchas y las reservas futuras a partir de eventos de fields_service"""
+    # Sin token configurado no se aceptan eventos: cambian precios y nombres de reservas
+    token = request.headers.get("X-Internal-Token") if request else None
+    if not INTERNAL_SERVICE_TOKEN or token != INTERNAL_SERVICE_TOKEN:
+        raise HTTPException(status_code=401, detail="Token interno inválido")
+    
+    field_ids = [event.field_id for event in payload.events]
+    previous = {
+        snapshot.field_id: (snapshot.name, snapshot.location, snapshot.schedule_version, snapshot.field_version)
+        for snapshot in db.query(FieldSnapshot).filter(FieldSnapshot.field_id.in_(field_ids)).all()
+    }
+    
+    now = datetime.now()
+    updated_reservations = 0
+    stale_events = 0
+    for event in sorted(payload.events, key=lambda e: e.version):
+        name, location, schedule_version, field_version = previous.get(event.field_id, (None, None, None, None))
+        if field_version is not None and event.version < field_version:
+            stale_events += 1
+            continue
+        previous[event.field_id] = (event.name, event.location, event.schedule_version, event.version)
+        if schedule_version != event.schedule_version:
+            invalidate_schedule_masks(event.field_id)
+        
+        values = event.dict(exclude={"version"})
+        upsert_field_snapshot(db, {**values, "field_version": event.version, "refreshed_at": now})
+        
+        if (name, location) != (event.name, event.location):
+            # Una sola actualización por cancha para todas sus reservas futuras
+            updated_reservations += db.query(Reservation).filter(
+                Reservation.field_id == event.field_id,
+                Reservation.start_time > now
+            ).update(
+                {
+                    Reservation.field_name: event.name,
+                    Reservation.field_location: event.location,
+                    Reservation.version: Reservation.version + 1
+                },
+                synchronize_session=False
+            )
+    
+    db.commit()
+    return {
+        "processed_events": len(payload.events) - stale_events,
+        "stale_events": stale_events,
+        "updated_reservations": updated_reservations
+    }
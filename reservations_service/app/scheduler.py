@@ -0,0 +1,125 @@
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import Session
+
+from app.models import Reservation, ReservationStatus
+from app.holds import HOLD_SWEEP_INTERVAL_SECONDS, purge_expired_holds
+from app.idempotency import purge_expired_idempotency_keys
+from app.outbox import enqueue_reservation_emails
+from app.partitions import maintain_partitions
+from app.waitlist import WAITLIST_EXPIRY_INTERVAL_SECONDS, expire_waitlist_entries
+
+# Recordatorios: horas de antelación, frecuencia de la tarea y reservas por lote
+REMINDER_HOURS_AHEAD = float(os.getenv("REMINDER_HOURS_AHEAD", "24"))
+REMINDER_INTERVAL_SECONDS = float(os.getenv("REMINDER_INTERVAL_SECONDS", "300"))
+REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", "1000"))
+
+# Particiones futuras y archivado de meses antiguos
+PARTITION_MAINTENANCE_INTERVAL_SECONDS = float(os.getenv("PARTITION_MAINTENANCE_INTERVAL_SECONDS", "86400"))
+
+# Limpieza de claves de idempotencia caducadas
+IDEMPOTENCY_PURGE_INTERVAL_SECONDS = float(os.getenv("IDEMPOTENCY_PURGE_INTERVAL_SECONDS", "3600"))
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicJob:
+    """Tarea que se ejecuta cada interval_seconds con su propia sesión de base de datos"""
+
+    def __init__(self, name: str, interval_seconds: float, func):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.func = func
+        self.next_run = 0.0
+
+
+class Scheduler:
+    """Ejecuta tareas periódicas de reservations_service en un único proceso"""
+
+    def __init__(self, session_factory, jobs: list):
+        self.session_factory = session_factory
+        self.jobs = jobs
+
+    def run_job(self, job: PeriodicJob):
+        db = self.session_factory()
+        try:
+            result = job.func(db)
+            logger.info(f"⏱️ {job.name}: {result}")
+        except Exception as e:
+            db.rollback()
+            logger.exception(f"Error en la tarea {job.name}: {e}")
+        finally:
+            db.close()
+
+    def run_pending(self) -> float:
+        """Ejecutar las tareas vencidas; devuelve los segundos hasta la próxima"""
+        now = time.monotonic()
+        for job in self.jobs:
+            if job.next_run <= now:
+                self.run_job(job)
+                job.next_run = time.monotonic() + job.interval_seconds
+        return max(0.0, min(job.next_run for job in self.jobs) - time.monotonic())
+
+    def run_forever(self):
+        logger.info(f"⏱️ Scheduler iniciado: {', '.join(job.name for job in self.jobs)}")
+        while True:
+            time.sleep(self.run_pending())
+
+
+def send_reminders(db: Session) -> int:
+    """Encolar recordatorios de las reservas confirmadas que empiezan en la próxima ventana"""
+    now = datetime.now()
+    window_end = now + timedelta(hours=REMINDER_HOURS_AHEAD)
+    queued = 0
+
+    while True:
+        # Rango sobre ix_reservations_status_start; SKIP LOCKED evita duplicados entre schedulers
+        reservations = db.query(
+            Reservation.id, Reservation.user_id, Reservation.field_name, Reservation.field_location,
+            Reservation.start_time, Reservation.duration_hours, Reservation.total_price
+        ).filter(
+            Reservation.status == ReservationStatus.CONFIRMADA,
+            Reservation.start_time >= now,
+            Reservation.start_time < window_end,
+            Reservation.reminded_at.is_(None)
+        ).order_by(Reservation.start_time).limit(REMINDER_BATCH_SIZE).with_for_update(skip_locked=True).all()
+        if not reservations:
+            break
+
+        # Sin destinatario: el worker consulta los emails a auth_service por lotes, así
+        # ninguna llamada HTTP se hace con las filas del lote bloqueadas
+        batch_queued = enqueue_reservation_emails(db, reservations, "reminder")
+
+        # Marcar el lote completo con un solo UPDATE
+        db.query(Reservation).filter(
+            Reservation.start_time >= now,
+            Reservation.start_time < window_end,
+            Reservation.id.in_([r.id for r in reservations])
+        ).update({Reservation.reminded_at: now}, synchronize_session=False)
+        db.commit()
+
+        queued += batch_queued
+        if len(reservations) < REMINDER_BATCH_SIZE:
+            break
+
+    return queued
+
+
+JOBS = [
+    PeriodicJob("recordatorios", REMINDER_INTERVAL_SECONDS, send_reminders),
+    PeriodicJob("particiones", PARTITION_MAINTENANCE_INTERVAL_SECONDS, maintain_partitions),
+    PeriodicJob("retenciones", HOLD_SWEEP_INTERVAL_SECONDS, purge_expired_holds),
+    PeriodicJob("lista de espera", WAITLIST_EXPIRY_INTERVAL_SECONDS, expire_waitlist_entries),
+    PeriodicJob("idempotencia", IDEMPOTENCY_PURGE_INTERVAL_SECONDS, purge_expired_idempotency_keys),
+]
+
+
+if __name__ == "__main__":
+    from app.database import SessionLocal, init_db
+
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    Scheduler(SessionLocal, JOBS).run_forever()
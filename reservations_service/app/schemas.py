@@ -1,5 +1,5 @@
 from pydantic import BaseModel, validator, Field
-from datetime import datetime
+from datetime import datetime, date
 from typing import Optional
 from enum import Enum
 
@@ -19,6 +19,8 @@ class ReservationBase(BaseModel):
             raise ValueError('La duración debe ser de 1 o 2 horas')
         return v
 
+class ReservationCreate(ReservationBase):
+    # Solo al crear: las respuestas incluyen reservas pasadas y ocurrencias de series más allá de 30 días
     @validator('start_time')
     def start_time_validation(cls, v):
         # Verificar que no sea en el pasado
@@ -31,10 +33,8 @@ class ReservationBase(BaseModel):
         if v > max_date:
             raise ValueError('No se pueden hacer reservas con más de 30 días de anticipación')
         
-        # Verificar que esté en horario válido (10 AM - 10 PM)
-        hour = v.hour
-        if hour < 10 or hour >= 22:
-            raise ValueError('Las reservas solo pueden ser entre 10:00 AM y 10:00 PM')
+        # El horario de apertura depende de la cancha y del día: se valida
+        # contra la máscara de horario de fields_service al crear la reserva
         
         # Verificar que sea en punto (exactamente en la hora)
         if v.minute != 0 or v.second != 0:
@@ -42,9 +42,85 @@ class ReservationBase(BaseModel):
         
         return v
 
-class ReservationCreate(ReservationBase):
+class SeriesFrequencyEnum(str, Enum):
+    WEEKLY = "weekly"
+    BIWEEKLY = "biweekly"
+
+class SeriesModeEnum(str, Enum):
+    ALL_OR_NOTHING = "all_or_nothing"
+    BEST_EFFORT = "best_effort"
+
+MAX_SERIES_OCCURRENCES = 52
+
+class ReservationSeriesCreate(ReservationCreate):
+    frequency: SeriesFrequencyEnum = SeriesFrequencyEnum.WEEKLY
+    count: Optional[int] = None
+    until: Optional[date] = None
+    mode: SeriesModeEnum = SeriesModeEnum.ALL_OR_NOTHING
+
+    @validator('count')
+    def count_must_be_valid(cls, v):
+        if v is not None and not 1 <= v <= MAX_SERIES_OCCURRENCES:
+            raise ValueError(f'La serie debe tener entre 1 y {MAX_SERIES_OCCURRENCES} reservas')
+        return v
+
+    @validator('until', always=True)
+    def count_or_until_required(cls, v, values):
+        if (v is None) == (values.get('count') is None):
+            raise ValueError('Indica el número de reservas (count) o la fecha final (until), no ambos')
+        start_time = values.get('start_time')
+        if v is not None and start_time is not None and v < start_time.date():
+            raise ValueError('La fecha final debe ser posterior al inicio de la serie')
+        return v
+
+class ReservationHoldCreate(ReservationCreate):
+    pass
+
+class ReservationHoldResponse(BaseModel):
+    id: int
+    field_id: int
+    field_name: str
+    field_location: str
+    start_time: datetime
+    end_time: datetime
+    duration_hours: int
+    total_price: float
+    notes: Optional[str] = None
+    expires_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class WaitlistStatusEnum(str, Enum):
+    ESPERANDO = "esperando"
+    OFRECIDA = "ofrecida"
+    ATENDIDA = "atendida"
+    CADUCADA = "caducada"
+
+class WaitlistCreate(ReservationCreate):
     pass
 
+class WaitlistResponse(BaseModel):
+    id: int
+    field_id: int
+    start_time: datetime
+    end_time: datetime
+    duration_hours: int
+    notes: Optional[str] = None
+    status: WaitlistStatusEnum
+    hold_id: Optional[int] = None  # Retención a confirmar cuando status es ofrecida
+    offer_expires_at: Optional[datetime] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+    @validator('status', pre=True)
+    def convert_status_enum(cls, v):
+        if hasattr(v, 'value'):  
+            return v.value
+        return v
+
 class ReservationUpdate(BaseModel):
     start_time: Optional[datetime] = None
     duration_hours: Optional[int] = None
@@ -68,6 +144,8 @@ class ReservationResponse(ReservationBase):
     updated_at: datetime
     cancelled_at: Optional[datetime] = None
     cancelled_by: Optional[int] = None
+    series_id: Optional[str] = None
+    version: int = 1  # También en la cabecera ETag; se envía en If-Match al editar
 
     class Config:
         from_attributes = True
@@ -80,16 +158,95 @@ class ReservationResponse(ReservationBase):
 
 class ReservationListResponse(BaseModel):
     reservations: list[ReservationResponse]
-    total: int
+    total: Optional[int] = None  # None con include_total=false
     page: int
     size: int
+    next_cursor: Optional[str] = None  # Cursor de la página siguiente, None si no hay más
 
 class ReservationCancelRequest(BaseModel):
     reason: Optional[str] = None
 
+BULK_CANCEL_MAX_DAYS = 31
+
+class BulkCancelRequest(BaseModel):
+    field_id: int
+    start_time: datetime
+    end_time: datetime
+    reason: Optional[str] = None
+
+    @validator('end_time')
+    def range_must_be_valid(cls, v, values):
+        start_time = values.get('start_time')
+        if start_time is not None:
+            if v <= start_time:
+                raise ValueError('El fin del cierre debe ser posterior al inicio')
+            if (v - start_time).days > BULK_CANCEL_MAX_DAYS:
+                raise ValueError(f'El cierre no puede superar {BULK_CANCEL_MAX_DAYS} días')
+        return v
+
+class BulkCancelResponse(BaseModel):
+    cancelled: int
+    emails_queued: int
+    holds_released: int
+    reservation_ids: list[int]
+
 class ReservationStatsResponse(BaseModel):
     total_reservations: int
     active_reservations: int
     cancelled_reservations: int
     reservations_today: int
     total_revenue: float
+    as_of: Optional[datetime] = None  # Instante en que se calcularon las estadísticas
+
+class FieldChangedEvent(BaseModel):
+    field_id: int
+    name: str
+    location: str
+    price_per_hour: float
+    is_active: bool
+    schedule_version: int = 0
+    version: int = 0  # Versión de la fila en fields_service: los eventos más antiguos se ignoran
+
+class FieldEventsRequest(BaseModel):
+    events: list[FieldChangedEvent]
+
+class SkippedOccurrence(BaseModel):
+    start_time: datetime
+    reason: str
+
+class ReservationSeriesResponse(BaseModel):
+    series_id: str
+    created: list[ReservationResponse]
+    skipped: list[SkippedOccurrence]
+
+class RollupGroupByEnum(str, Enum):
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+    FIELD = "field"
+
+class RollupBucket(BaseModel):
+    period: Optional[date] = None  # Inicio del día, semana o mes
+    field_id: Optional[int] = None
+    bookings: int
+    cancellations: int
+    revenue: float
+    booked_hours: int
+
+class RollupsResponse(BaseModel):
+    date_from: date
+    date_to: date
+    group_by: RollupGroupByEnum
+    buckets: list[RollupBucket]
+
+class ExportFormatEnum(str, Enum):
+    CSV = "csv"
+    NDJSON = "ndjson"
+
+class HeatmapResponse(BaseModel):
+    field_id: Optional[int] = None  # None: todas las canchas
+    date_from: date
+    date_to: date
+    source: str  # reservations o occupancy_rollup (rangos largos)
+    booked_hours: list[list[int]]  # 7 filas (lunes primero) x 24 horas
+    weekday_days: list[int]  # Veces que aparece cada día de la semana en el rango
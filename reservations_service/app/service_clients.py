@@ -0,0 +1,105 @@
+import os
+from datetime import date
+
+import httpx
+from fastapi import HTTPException
+
+AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL")
+FIELDS_SERVICE_URL = os.getenv("FIELDS_SERVICE_URL")
+INTERNAL_SERVICE_TOKEN = os.getenv("INTERNAL_SERVICE_TOKEN")
+
+# Máximo de usuarios por petición a POST /auth/users/lookup
+USER_LOOKUP_CHUNK_SIZE = 1000
+
+# Tiempos máximos y tamaño del pool para las llamadas a otros servicios (segundos)
+SERVICE_CONNECT_TIMEOUT = float(os.getenv("SERVICE_CONNECT_TIMEOUT", "1.0"))
+SERVICE_READ_TIMEOUT = float(os.getenv("SERVICE_READ_TIMEOUT", "5.0"))
+SERVICE_MAX_CONNECTIONS = int(os.getenv("SERVICE_MAX_CONNECTIONS", "100"))
+
+_client = None
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Cliente HTTP asíncrono compartido (reutiliza conexiones entre peticiones)"""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(SERVICE_READ_TIMEOUT, connect=SERVICE_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=SERVICE_MAX_CONNECTIONS,
+                max_keepalive_connections=SERVICE_MAX_CONNECTIONS
+            )
+        )
+    return _client
+
+
+async def close_async_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def get_current_user_async(auth_header: str) -> dict:
+    """Versión asíncrona de get_current_user"""
+    if not auth_header:
+        raise HTTPException(status_code=401, detail="Authorization header required")
+
+    try:
+        auth_response = await get_async_client().get(
+            f"{AUTH_SERVICE_URL}/auth/verify",
+            headers={"Authorization": auth_header}
+        )
+    except httpx.HTTPError:
+        raise HTTPException(status_code=503, detail="Error conectando con servicio de autenticación")
+
+    if auth_response.status_code != 200:
+        raise HTTPException(status_code=401, detail="Token inválido")
+    return auth_response.json()
+
+
+async def fetch_field_info_async(field_id: int) -> dict:
+    """Versión asíncrona de fetch_field_info"""
+    try:
+        field_response = await get_async_client().get(f"{FIELDS_SERVICE_URL}/fields/{field_id}")
+    except httpx.HTTPError:
+        raise HTTPException(status_code=503, detail="Error conectando con servicio de canchas")
+
+    if field_response.status_code != 200:
+        raise HTTPException(status_code=404, detail="Cancha no encontrada")
+    return field_response.json()
+
+
+async def fetch_field_open_masks_async(field_id: int, date_from: date, date_to: date) -> list:
+    """Máscaras de horas abiertas de una cancha por día desde fields_service"""
+    try:
+        response = await get_async_client().get(
+            f"{FIELDS_SERVICE_URL}/fields/{field_id}/schedule/masks",
+            params={"from": date_from.isoformat(), "to": date_to.isoformat()}
+        )
+    except httpx.HTTPError:
+        raise HTTPException(status_code=503, detail="Error conectando con servicio de canchas")
+
+    if response.status_code == 404:
+        raise HTTPException(status_code=404, detail="Cancha no encontrada")
+    if response.status_code != 200:
+        # Un fallo de fields_service no es una cancha inexistente
+        raise HTTPException(status_code=503, detail="Error conectando con servicio de canchas")
+    return response.json().get("days", [])
+
+
+def lookup_user_emails(user_ids) -> dict:
+    """Emails de varios usuarios con una petición por cada 1000 (procesos sin token de usuario)"""
+    user_ids = sorted(set(user_ids))
+    headers = {"X-Internal-Token": INTERNAL_SERVICE_TOKEN} if INTERNAL_SERVICE_TOKEN else {}
+    emails = {}
+    for i in range(0, len(user_ids), USER_LOOKUP_CHUNK_SIZE):
+        response = httpx.post(
+            f"{AUTH_SERVICE_URL}/auth/users/lookup",
+            json={"user_ids": user_ids[i:i + USER_LOOKUP_CHUNK_SIZE]},
+            headers=headers,
+            timeout=httpx.Timeout(SERVICE_READ_TIMEOUT, connect=SERVICE_CONNECT_TIMEOUT)
+        )
+        response.raise_for_status()
+        emails.update({user["id"]: user["email"] for user in response.json()["users"]})
+    return emails
@@ -0,0 +1,137 @@
+import uuid
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from unittest import mock
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from app.main import app
+from app import routes
+from app.database import SessionLocal
+from app.models import Reservation, ReservationHold, ReservationStatus
+
+ALICE = {"user_id": 11, "email": "alice@example.com", "is_admin": False}
+BOB = {"user_id": 12, "email": "bob@example.com", "is_admin": False}
+AUTH = {"Authorization": "Bearer test"}
+
+def as_user(user: dict, field_id: int) -> ExitStack:
+    """Simular el usuario autenticado y una cancha abierta sin llamar a otros servicios"""
+    field = {"id": field_id, "name": "Cancha de prueba", "location": "Norte", "price_per_hour": 50.0, "is_active": True}
+    stack = ExitStack()
+    stack.enter_context(mock.patch.object(routes, "get_current_user", return_value=user))
+    stack.enter_context(mock.patch.object(routes, "get_current_user_async", new=mock.AsyncMock(return_value=user)))
+    stack.enter_context(mock.patch.object(routes, "check_admin_permission", return_value=user["is_admin"]))
+    stack.enter_context(mock.patch.object(routes, "fetch_field_info_async", new=mock.AsyncMock(return_value=field)))
+    stack.enter_context(mock.patch.object(routes, "validate_field_schedule_async", new=mock.AsyncMock(return_value=None)))
+    return stack
+
+def new_field_id() -> int:
+    """Cancha distinta en cada prueba para no depender de los datos de otras"""
+    return uuid.uuid4().int % 1_000_000_000
+
+def slot_body(field_id: int, hour: int = 18) -> dict:
+    start_time = (datetime.now() + timedelta(days=2)).replace(hour=hour, minute=0, second=0, microsecond=0)
+    return {"field_id": field_id, "start_time": start_time.isoformat(), "duration_hours": 1}
+
+def expire_hold(hold_id: int):
+    db = SessionLocal()
+    try:
+        db.query(ReservationHold).filter(ReservationHold.id == hold_id).update(
+            {ReservationHold.expires_at: datetime.now() - timedelta(seconds=1)}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+def test_hold_blocks_other_users_only():
+    client = TestClient(app)
+    field_id = new_field_id()
+
+    with as_user(ALICE, field_id):
+        hold = client.post("/reservations/holds", json=slot_body(field_id), headers=AUTH)
+    assert hold.status_code == 200, hold.text
+
+    with as_user(BOB, field_id):
+        blocked = client.post("/reservations/", json=slot_body(field_id), headers=AUTH)
+        other_hold = client.post("/reservations/holds", json=slot_body(field_id), headers=AUTH)
+    assert blocked.status_code == 400
+    assert blocked.json()["detail"] == routes.HOLD_CONFLICT_DETAIL
+    assert other_hold.status_code == 400
+
+    # El dueño de la retención sí puede reservar el horario
+    with as_user(ALICE, field_id):
+        own = client.post("/reservations/", json=slot_body(field_id), headers=AUTH)
+    assert own.status_code == 200, own.text
+    print("✅ La retención bloquea el horario solo a los demás usuarios")
+
+def test_confirm_consumes_hold_once():
+    client = TestClient(app)
+    field_id = new_field_id()
+
+    with as_user(ALICE, field_id):
+        hold_id = client.post("/reservations/holds", json=slot_body(field_id), headers=AUTH).json()["id"]
+        confirmed = client.post(f"/reservations/holds/{hold_id}/confirm", headers=AUTH)
+        again = client.post(f"/reservations/holds/{hold_id}/confirm", headers=AUTH)
+
+    assert confirmed.status_code == 200, confirmed.text
+    assert confirmed.json()["status"] == "confirmada"
+    assert again.status_code == 404
+
+    db = SessionLocal()
+    try:
+        assert db.get(ReservationHold, hold_id) is None
+        assert db.query(Reservation).filter(Reservation.field_id == field_id).count() == 1
+    finally:
+        db.close()
+    print("✅ Confirmar una retención la consume y crea una sola reserva")
+
+def test_expired_hold_frees_the_slot():
+    client = TestClient(app)
+    field_id = new_field_id()
+
+    with as_user(ALICE, field_id):
+        hold_id = client.post("/reservations/holds", json=slot_body(field_id), headers=AUTH).json()["id"]
+    expire_hold(hold_id)
+
+    with as_user(BOB, field_id):
+        booked = client.post("/reservations/", json=slot_body(field_id), headers=AUTH)
+    assert booked.status_code == 200, booked.text
+
+    with as_user(ALICE, field_id):
+        late = client.post(f"/reservations/holds/{hold_id}/confirm", headers=AUTH)
+    assert late.status_code == 404
+    print("✅ Una retención caducada libera el horario y ya no se puede confirmar")
+
+def test_hold_expiring_before_the_lock_is_rejected():
+    client = TestClient(app)
+    field_id = new_field_id()
+
+    with as_user(ALICE, field_id):
+        hold_id = client.post("/reservations/holds", json=slot_body(field_id), headers=AUTH).json()["id"]
+
+    # La retención caduca entre la comprobación de confirm y el lock de la cancha
+    db = SessionLocal()
+    try:
+        hold = db.get(ReservationHold, hold_id)
+        expire_hold(hold_id)
+        reservation = Reservation(
+            user_id=hold.user_id, field_id=hold.field_id, start_time=hold.start_time, end_time=hold.end_time,
+            duration_hours=hold.duration_hours, field_name=hold.field_name, field_location=hold.field_location,
+            total_price=hold.total_price, status=ReservationStatus.CONFIRMADA
+        )
+        try:
+            routes.insert_reservation(db, reservation, ALICE["email"], hold=hold)
+            assert False, "Se esperaba HTTPException"
+        except HTTPException as e:
+            assert e.status_code == 400
+            assert e.detail == "La retención ha caducado"
+        db.rollback()
+        assert db.query(Reservation).filter(Reservation.field_id == field_id).count() == 0
+    finally:
+        db.close()
+    print("✅ Una retención caducada bajo el lock no se convierte en reserva")
+
+if __name__ == "__main__":
+    test_hold_blocks_other_users_only()
+    test_confirm_consumes_hold_once()
+    test_expired_hold_frees_the_slot()
+    test_hold_expiring_before_the_lock_is_rejected()
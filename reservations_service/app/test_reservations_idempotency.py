@@ -0,0 +1,104 @@
+import uuid
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from unittest import mock
+from fastapi.testclient import TestClient
+from app.main import app
+from app import routes
+from app.database import SessionLocal
+from app.idempotency import IdempotentRequest
+from app.models import Reservation
+
+USER = {"user_id": 7, "email": "user@example.com", "is_admin": False}
+AUTH = {"Authorization": "Bearer test"}
+
+def as_user(user: dict, field_id: int) -> ExitStack:
+    """Simular el usuario autenticado y una cancha abierta sin llamar a otros servicios"""
+    field = {"id": field_id, "name": "Cancha de prueba", "location": "Norte", "price_per_hour": 50.0, "is_active": True}
+    stack = ExitStack()
+    stack.enter_context(mock.patch.object(routes, "get_current_user", return_value=user))
+    stack.enter_context(mock.patch.object(routes, "get_current_user_async", new=mock.AsyncMock(return_value=user)))
+    stack.enter_context(mock.patch.object(routes, "check_admin_permission", return_value=user["is_admin"]))
+    stack.enter_context(mock.patch.object(routes, "fetch_field_info_async", new=mock.AsyncMock(return_value=field)))
+    stack.enter_context(mock.patch.object(routes, "validate_field_schedule_async", new=mock.AsyncMock(return_value=None)))
+    return stack
+
+def new_field_id() -> int:
+    """Cancha distinta en cada prueba para no depender de los datos de otras"""
+    return uuid.uuid4().int % 1_000_000_000
+
+def reservation_body(field_id: int, hour: int = 18, duration_hours: int = 1) -> dict:
+    start_time = (datetime.now() + timedelta(days=2)).replace(hour=hour, minute=0, second=0, microsecond=0)
+    return {"field_id": field_id, "start_time": start_time.isoformat(), "duration_hours": duration_hours}
+
+def count_reservations(field_id: int) -> int:
+    db = SessionLocal()
+    try:
+        return db.query(Reservation).filter(Reservation.field_id == field_id).count()
+    finally:
+        db.close()
+
+def test_same_key_creates_one_reservation():
+    client = TestClient(app)
+    field_id = new_field_id()
+    headers = {**AUTH, "Idempotency-Key": str(uuid.uuid4())}
+
+    with as_user(USER, field_id):
+        first = client.post("/reservations/", json=reservation_body(field_id), headers=headers)
+        retry = client.post("/reservations/", json=reservation_body(field_id), headers=headers)
+
+    assert first.status_code == 200, first.text
+    assert retry.status_code == 200, retry.text
+    assert retry.json() == first.json()
+    assert retry.headers.get("Idempotent-Replayed") == "true"
+    assert count_reservations(field_id) == 1
+    print("✅ Dos creaciones con la misma clave dejan una sola reserva")
+
+def test_same_key_with_another_body_is_rejected():
+    client = TestClient(app)
+    field_id = new_field_id()
+    headers = {**AUTH, "Idempotency-Key": str(uuid.uuid4())}
+
+    with as_user(USER, field_id):
+        first = client.post("/reservations/", json=reservation_body(field_id), headers=headers)
+        reused = client.post("/reservations/", json=reservation_body(field_id, duration_hours=2), headers=headers)
+
+    assert first.status_code == 200, first.text
+    assert reused.status_code == 422, reused.text
+    assert count_reservations(field_id) == 1
+    print("✅ Reutilizar la clave con otra petición devuelve 422")
+
+def test_concurrent_retry_replays_after_integrity_error():
+    client = TestClient(app)
+    field_id = new_field_id()
+    headers = {**AUTH, "Idempotency-Key": str(uuid.uuid4())}
+
+    with as_user(USER, field_id):
+        # Otra reserva en la cancha deja guardada su copia local antes de la carrera
+        warmup = client.post("/reservations/", json=reservation_body(field_id, hour=10), headers=AUTH)
+        assert warmup.status_code == 200, warmup.text
+
+        # La otra petición con la misma clave se confirma justo antes de que esta reserve la clave:
+        # el INSERT de la clave falla y se devuelve la respuesta guardada
+        claim = IdempotentRequest.claim
+        concurrent = []
+        def racing_claim(self, db):
+            if not concurrent:
+                with mock.patch.object(IdempotentRequest, "claim", claim):
+                    concurrent.append(client.post("/reservations/", json=reservation_body(field_id), headers=headers))
+            claim(self, db)
+
+        with mock.patch.object(IdempotentRequest, "claim", racing_claim):
+            retry = client.post("/reservations/", json=reservation_body(field_id), headers=headers)
+
+    assert concurrent[0].status_code == 200, concurrent[0].text
+    assert retry.status_code == 200, retry.text
+    assert retry.json() == concurrent[0].json()
+    assert retry.headers.get("Idempotent-Replayed") == "true"
+    assert count_reservations(field_id) == 2
+    print("✅ Un reintento concurrente devuelve la respuesta de la primera petición")
+
+if __name__ == "__main__":
+    test_same_key_creates_one_reservation()
+    test_same_key_with_another_body_is_rejected()
+    test_concurrent_retry_replays_after_integrity_error()
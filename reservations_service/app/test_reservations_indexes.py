@@ -0,0 +1,76 @@
+import re
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from app.database import SessionLocal, init_db
+from app.models import Reservation
+from app.pagination import keyset_query, encode_cursor
+from app.partitions import RESERVATIONS_PARTITIONING, is_partitioned
+from app.routes import field_reservations_on_date_query
+
+INDEX_NAME = "ix_reservations_field_status_start"
+INDEX_COLUMNS = ("field_id", "status", "start_time")
+USER_CREATED_INDEX = "ix_reservations_user_created"
+USER_CREATED_COLUMNS = ("user_id", "created_at", "id")
+
+def check_partitioned(db):
+    """En PostgreSQL la tabla debe estar particionada por mes, como en producción"""
+    if db.get_bind().dialect.name == "postgresql" and RESERVATIONS_PARTITIONING:
+        assert is_partitioned(db.connection()), "La tabla reservations no está particionada"
+
+def uses_index(plan: str, index_name: str, columns: tuple) -> bool:
+    """El plan usa el índice o su copia en una partición mensual.
+
+    PostgreSQL nombra el índice de cada partición a partir de sus columnas,
+    p. ej. reservations_2026_10_field_id_status_start_time_idx.
+    """
+    partition_index = re.compile(rf"reservations_\d{{4}}_\d{{2}}_{'_'.join(columns)}_idx")
+    return index_name in plan or partition_index.search(plan) is not None
+
+def explain(db, query):
+    """Plan de ejecución de una consulta ORM según el motor de base de datos"""
+    dialect = db.get_bind().dialect
+    sql = str(query.statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+    if dialect.name == "postgresql":
+        # Con pocas filas el planificador prefiere un seq scan: forzar el uso de índices
+        db.execute(text("SET LOCAL enable_seqscan = off"))
+        rows = db.execute(text(f"EXPLAIN {sql}")).fetchall()
+        return "\n".join(row[0] for row in rows)
+    rows = db.execute(text(f"EXPLAIN QUERY PLAN {sql}")).fetchall()
+    return "\n".join(str(row[-1]) for row in rows)
+
+def test_field_date_query_uses_composite_index():
+    init_db()
+    db = SessionLocal()
+
+    try:
+        check_partitioned(db)
+        day = (datetime.now() + timedelta(days=1)).date()
+        plan = explain(db, field_reservations_on_date_query(db, 1, day))
+        print(f"📋 Plan de /reservations/field/{{id}}/date/{{date}}:\n{plan}")
+
+        assert uses_index(plan, INDEX_NAME, INDEX_COLUMNS), f"La consulta no usa {INDEX_NAME}"
+        print(f"✅ La consulta usa {INDEX_NAME}")
+    finally:
+        db.rollback()
+        db.close()
+
+def test_my_reservations_cursor_uses_composite_index():
+    init_db()
+    db = SessionLocal()
+
+    try:
+        check_partitioned(db)
+        cursor = encode_cursor(Reservation(id=100, created_at=datetime.now()))
+        query = keyset_query(db.query(Reservation).filter(Reservation.user_id == 1), cursor).limit(11)
+        plan = explain(db, query)
+        print(f"📋 Plan de /reservations/my con cursor:\n{plan}")
+
+        assert uses_index(plan, USER_CREATED_INDEX, USER_CREATED_COLUMNS), f"La consulta no usa {USER_CREATED_INDEX}"
+        print(f"✅ La consulta usa {USER_CREATED_INDEX}")
+    finally:
+        db.rollback()
+        db.close()
+
+if __name__ == "__main__":
+    test_field_date_query_uses_composite_index()
+    test_my_reservations_cursor_uses_composite_index()
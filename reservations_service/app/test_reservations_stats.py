@@ -0,0 +1,44 @@
+from datetime import datetime, timezone
+from unittest import mock
+from fastapi.testclient import TestClient
+from app.main import app
+from app import routes
+
+ADMIN = {"user_id": 1, "email": "admin@example.com", "is_admin": True}
+AUTH = {"Authorization": "Bearer test"}
+
+def as_admin():
+    """Simular un administrador sin consultar auth_service ni roles_service"""
+    return [
+        mock.patch.object(routes, "get_current_user", return_value=ADMIN),
+        mock.patch.object(routes, "check_admin_permission", return_value=True)
+    ]
+
+def test_stats_accepts_naive_and_aware_as_of():
+    client = TestClient(app)
+    patches = as_admin()
+    for patch in patches:
+        patch.start()
+
+    try:
+        routes.stats_cache.clear()
+        response = client.get("/reservations/stats", headers=AUTH)
+        assert response.status_code == 200, response.text
+
+        # Sin zona horaria: hora local, como las fotos guardadas
+        naive = datetime.now().replace(microsecond=0).isoformat()
+        response = client.get("/reservations/stats", params={"as_of": naive}, headers=AUTH)
+        assert response.status_code == 200, response.text
+
+        # Con zona horaria (UTC): se convierte a hora local antes de comparar
+        aware = datetime.now(timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")
+        response = client.get("/reservations/stats", params={"as_of": aware}, headers=AUTH)
+        assert response.status_code == 200, response.text
+        print("✅ /reservations/stats acepta as_of con y sin zona horaria")
+    finally:
+        for patch in patches:
+            patch.stop()
+        routes.stats_cache.clear()
+
+if __name__ == "__main__":
+    test_stats_accepts_naive_and_aware_as_of()
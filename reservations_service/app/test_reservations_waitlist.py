@@ -0,0 +1,141 @@
+import uuid
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from unittest import mock
+from fastapi.testclient import TestClient
+from app.main import app
+from app import routes
+from app.database import SessionLocal
+from app.models import ReservationHold, WaitlistEntry, WaitlistStatus
+from app.waitlist import expire_waitlist_entries
+
+OWNER = {"user_id": 21, "email": "owner@example.com", "is_admin": False}
+FIRST = {"user_id": 22, "email": "first@example.com", "is_admin": False}
+SECOND = {"user_id": 23, "email": "second@example.com", "is_admin": False}
+AUTH = {"Authorization": "Bearer test"}
+
+def as_user(user: dict, field_id: int) -> ExitStack:
+    """Simular el usuario autenticado y una cancha abierta sin llamar a otros servicios"""
+    field = {"id": field_id, "name": "Cancha de prueba", "location": "Norte", "price_per_hour": 50.0, "is_active": True}
+    stack = ExitStack()
+    stack.enter_context(mock.patch.object(routes, "get_current_user", return_value=user))
+    stack.enter_context(mock.patch.object(routes, "get_current_user_async", new=mock.AsyncMock(return_value=user)))
+    stack.enter_context(mock.patch.object(routes, "check_admin_permission", return_value=user["is_admin"]))
+    stack.enter_context(mock.patch.object(routes, "fetch_field_info_async", new=mock.AsyncMock(return_value=field)))
+    stack.enter_context(mock.patch.object(routes, "validate_field_schedule_async", new=mock.AsyncMock(return_value=None)))
+    return stack
+
+def new_field_id() -> int:
+    """Cancha distinta en cada prueba para no depender de los datos de otras"""
+    return uuid.uuid4().int % 1_000_000_000
+
+def slot_body(field_id: int, hour: int = 18) -> dict:
+    start_time = (datetime.now() + timedelta(days=2)).replace(hour=hour, minute=0, second=0, microsecond=0)
+    return {"field_id": field_id, "start_time": start_time.isoformat(), "duration_hours": 1}
+
+def book_and_queue(client: TestClient, field_id: int) -> tuple:
+    """OWNER reserva el horario; FIRST y SECOND se apuntan a la lista de espera en ese orden"""
+    with as_user(OWNER, field_id):
+        reservation = client.post("/reservations/", json=slot_body(field_id), headers=AUTH)
+    assert reservation.status_code == 200, reservation.text
+
+    entries = []
+    for user in (FIRST, SECOND):
+        with as_user(user, field_id):
+            entry = client.post("/reservations/waitlist", json=slot_body(field_id), headers=AUTH)
+        assert entry.status_code == 200, entry.text
+        entries.append(entry.json()["id"])
+    return reservation.json()["id"], entries
+
+def load_entries(entry_ids: list) -> list:
+    db = SessionLocal()
+    try:
+        return [db.get(WaitlistEntry, entry_id) for entry_id in entry_ids]
+    finally:
+        db.close()
+
+def test_cancellation_offers_slot_to_earliest_waiter():
+    client = TestClient(app)
+    field_id = new_field_id()
+    reservation_id, entry_ids = book_and_queue(client, field_id)
+
+    with as_user(OWNER, field_id):
+        cancelled = client.post(f"/reservations/{reservation_id}/cancel", json={}, headers=AUTH)
+    assert cancelled.status_code == 200, cancelled.text
+
+    first, second = load_entries(entry_ids)
+    assert first.status == WaitlistStatus.OFRECIDA
+    assert first.hold_id is not None
+    assert second.status == WaitlistStatus.ESPERANDO
+
+    # El horario está retenido para FIRST: SECOND no puede reservarlo
+    with as_user(SECOND, field_id):
+        blocked = client.post("/reservations/", json=slot_body(field_id), headers=AUTH)
+    assert blocked.status_code == 400
+    assert blocked.json()["detail"] == routes.HOLD_CONFLICT_DETAIL
+
+    with as_user(FIRST, field_id):
+        confirmed = client.post(f"/reservations/holds/{first.hold_id}/confirm", headers=AUTH)
+    assert confirmed.status_code == 200, confirmed.text
+    assert load_entries(entry_ids[:1])[0].status == WaitlistStatus.ATENDIDA
+    print("✅ Al cancelar, el horario se ofrece al primero de la lista de espera")
+
+def test_expired_offer_passes_to_next_waiter():
+    client = TestClient(app)
+    field_id = new_field_id()
+    reservation_id, entry_ids = book_and_queue(client, field_id)
+
+    with as_user(OWNER, field_id):
+        client.post(f"/reservations/{reservation_id}/cancel", json={}, headers=AUTH)
+    first_hold_id = load_entries(entry_ids[:1])[0].hold_id
+
+    # La oferta a FIRST caduca sin confirmarse
+    db = SessionLocal()
+    try:
+        past = datetime.now() - timedelta(seconds=1)
+        db.query(WaitlistEntry).filter(WaitlistEntry.id == entry_ids[0]).update(
+            {WaitlistEntry.offer_expires_at: past}, synchronize_session=False
+        )
+        db.query(ReservationHold).filter(ReservationHold.id == first_hold_id).update(
+            {ReservationHold.expires_at: past}, synchronize_session=False
+        )
+        db.commit()
+        expire_waitlist_entries(db)
+        # La retención de FIRST se borra y se crea otra para SECOND
+        holds = db.query(ReservationHold.user_id).filter(ReservationHold.field_id == field_id).all()
+        assert [user_id for (user_id,) in holds] == [SECOND["user_id"]]
+    finally:
+        db.close()
+
+    first, second = load_entries(entry_ids)
+    assert first.status == WaitlistStatus.CADUCADA
+    assert second.status == WaitlistStatus.OFRECIDA
+    assert second.hold_id is not None
+
+    with as_user(SECOND, field_id):
+        confirmed = client.post(f"/reservations/holds/{second.hold_id}/confirm", headers=AUTH)
+    assert confirmed.status_code == 200, confirmed.text
+    print("✅ Una oferta caducada pasa al siguiente de la lista de espera")
+
+def test_released_offer_passes_to_next_waiter():
+    client = TestClient(app)
+    field_id = new_field_id()
+    reservation_id, entry_ids = book_and_queue(client, field_id)
+
+    with as_user(OWNER, field_id):
+        client.post(f"/reservations/{reservation_id}/cancel", json={}, headers=AUTH)
+    first_hold_id = load_entries(entry_ids[:1])[0].hold_id
+
+    with as_user(FIRST, field_id):
+        released = client.delete(f"/reservations/holds/{first_hold_id}", headers=AUTH)
+    assert released.status_code == 200, released.text
+
+    first, second = load_entries(entry_ids)
+    assert first.status == WaitlistStatus.CADUCADA
+    assert second.status == WaitlistStatus.OFRECIDA
+    print("✅ Una oferta liberada pasa al siguiente de la lista de espera")
+
+if __name__ == "__main__":
+    test_cancellation_offers_slot_to_earliest_waiter()
+    test_expired_offer_passes_to_next_waiter()
+    test_released_offer_passes_to_next_waiter()
@@ -0,0 +1,135 @@
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from app.holds import find_conflicting_hold
+from app.locking import field_booking_lock
+from app.models import Reservation, ReservationHold, ReservationStatus, WaitlistEntry, WaitlistStatus
+from app.outbox import enqueue_email, reservation_email_data
+
+# Tiempo que se retiene el horario liberado para el primero de la lista de espera
+WAITLIST_OFFER_TTL_SECONDS = int(os.getenv("WAITLIST_OFFER_TTL_SECONDS", "900"))
+WAITLIST_EXPIRY_INTERVAL_SECONDS = float(os.getenv("WAITLIST_EXPIRY_INTERVAL_SECONDS", "300"))
+
+# Entradas en espera que se revisan por horario liberado (las que no caben se saltan)
+WAITLIST_OFFER_CANDIDATES = 20
+
+
+def slot_is_free(db: Session, field_id: int, start_time: datetime, end_time: datetime) -> bool:
+    """Sin reservas confirmadas ni retenciones vigentes en [start_time, end_time)"""
+    booked = db.query(Reservation.id).filter(
+        Reservation.field_id == field_id,
+        Reservation.status == ReservationStatus.CONFIRMADA,
+        Reservation.start_time < end_time,
+        Reservation.end_time > start_time
+    ).first()
+    return booked is None and find_conflicting_hold(db, field_id, start_time, end_time) is None
+
+
+def offer_freed_slot(db: Session, freed) -> Optional[WaitlistEntry]:
+    """Ofrecer un horario liberado (reserva cancelada, retención liberada o oferta caducada)
+    al primero de la lista de espera que cabe en él.
+
+    Se llama bajo el lock de la cancha y dentro de la transacción que libera el horario:
+    la retención y el aviso se confirman junto con ella.
+    """
+    now = datetime.now()
+    # La cancelación o el borrado de la retención deben verse en las comprobaciones de abajo
+    db.flush()
+    # Una sola consulta por (field_id, start_time); SKIP LOCKED evita ofrecer dos veces la misma entrada
+    candidates = db.query(WaitlistEntry).filter(
+        WaitlistEntry.field_id == freed.field_id,
+        WaitlistEntry.start_time >= max(freed.start_time, now),
+        WaitlistEntry.start_time < freed.end_time,
+        WaitlistEntry.end_time <= freed.end_time,
+        WaitlistEntry.status == WaitlistStatus.ESPERANDO
+    ).order_by(WaitlistEntry.created_at, WaitlistEntry.id).with_for_update(skip_locked=True).limit(
+        WAITLIST_OFFER_CANDIDATES
+    ).all()
+    # Tras caducar una oferta el horario pudo reservarse en parte antes de volver a ofrecerlo
+    entry = next(
+        (c for c in candidates if slot_is_free(db, c.field_id, c.start_time, c.end_time)),
+        None
+    )
+    if entry is None:
+        return None
+
+    hold = ReservationHold(
+        user_id=entry.user_id,
+        field_id=entry.field_id,
+        start_time=entry.start_time,
+        end_time=entry.end_time,
+        duration_hours=entry.duration_hours,
+        field_name=freed.field_name,
+        field_location=freed.field_location,
+        total_price=freed.total_price / freed.duration_hours * entry.duration_hours,
+        notes=entry.notes,
+        expires_at=now + timedelta(seconds=WAITLIST_OFFER_TTL_SECONDS)
+    )
+    db.add(hold)
+    db.flush()
+
+    entry.status = WaitlistStatus.OFRECIDA
+    entry.hold_id = hold.id
+    entry.offer_expires_at = hold.expires_at
+
+    payload = reservation_email_data(hold)
+    payload.update(hold_id=hold.id, expires_at=hold.expires_at.strftime("%d/%m/%Y %H:%M"))
+    # El worker de emails resuelve el destinatario con auth_service
+    enqueue_email(db, "waitlist_offer", entry.user_id, None, payload)
+    return entry
+
+
+def mark_offer_accepted(db: Session, hold_id: int):
+    """Marcar como atendida la entrada cuya retención ofrecida se confirmó"""
+    db.query(WaitlistEntry).filter(
+        WaitlistEntry.hold_id == hold_id,
+        WaitlistEntry.status == WaitlistStatus.OFRECIDA
+    ).update({WaitlistEntry.status: WaitlistStatus.ATENDIDA}, synchronize_session=False)
+
+
+def decline_offer(db: Session, hold_id: int):
+    """Caducar la entrada cuya retención ofrecida se liberó sin confirmar"""
+    db.query(WaitlistEntry).filter(
+        WaitlistEntry.hold_id == hold_id,
+        WaitlistEntry.status == WaitlistStatus.OFRECIDA
+    ).update({WaitlistEntry.status: WaitlistStatus.CADUCADA}, synchronize_session=False)
+
+
+def expire_waitlist_entries(db: Session) -> str:
+    """Tarea periódica: caducar ofertas no confirmadas (el horario pasa al siguiente) y esperas de horarios ya pasados"""
+    now = datetime.now()
+    expired_offers = db.query(WaitlistEntry.id, WaitlistEntry.field_id).filter(
+        WaitlistEntry.status == WaitlistStatus.OFRECIDA,
+        WaitlistEntry.offer_expires_at <= now
+    ).order_by(WaitlistEntry.field_id).all()
+
+    offers = reoffered = 0
+    for entry_id, field_id in expired_offers:
+        with field_booking_lock(db, field_id):
+            # Otra instancia del scheduler pudo tomar la misma oferta
+            entry = db.query(WaitlistEntry).filter(
+                WaitlistEntry.id == entry_id,
+                WaitlistEntry.status == WaitlistStatus.OFRECIDA
+            ).with_for_update(skip_locked=True).first()
+            if entry is None:
+                db.rollback()
+                continue
+            entry.status = WaitlistStatus.CADUCADA
+            offers += 1
+            # purge_expired_holds conserva las retenciones ofrecidas hasta llegar aquí
+            hold = db.get(ReservationHold, entry.hold_id) if entry.hold_id else None
+            if hold is not None:
+                db.delete(hold)
+                if offer_freed_slot(db, hold) is not None:
+                    reoffered += 1
+            db.commit()
+
+    waiting = db.query(WaitlistEntry).filter(
+        WaitlistEntry.status == WaitlistStatus.ESPERANDO,
+        WaitlistEntry.start_time <= now
+    ).update({WaitlistEntry.status: WaitlistStatus.CADUCADA}, synchronize_session=False)
+    db.commit()
+    return f"{offers} ofertas caducadas ({reoffered} ofrecidas al siguiente) y {waiting} esperas caducadas"
@@ -1,20 +1,43 @@
 import os
-from sqlalchemy import create_engine
+
+from fastapi import Request, Response
+from sqlalchemy import event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 
+from app.db_common import create_db_engine, is_pinned_to_primary, pin_client_after_commit
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("ROLES_DB_URL")
+# Réplica de solo lectura opcional: sin ella las lecturas también van a la principal
+READ_DATABASE_URL = os.getenv("ROLES_DB_READ_URL")
 
-engine = create_engine(DATABASE_URL)
+engine = create_db_engine(DATABASE_URL, "primary")
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+read_engine = create_db_engine(READ_DATABASE_URL, "replica") if READ_DATABASE_URL else engine
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+if READ_DATABASE_URL:
+    event.listen(SessionLocal, "after_commit", pin_client_after_commit)
 
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
+def get_db(request: Request = None, response: Response = None):
+    # La respuesta recibe el plazo de lectura en la principal si la sesión confirma cambios
+    db = SessionLocal(info={"response": response})
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_read_db(request: Request = None):
+    """Sesión para rutas de solo lectura: réplica, salvo que el cliente haya escrito hace poco"""
+    if READ_DATABASE_URL and not is_pinned_to_primary(request):
+        db = ReadSessionLocal()
+    else:
+        db = SessionLocal()
     try:
         yield db
     finally:
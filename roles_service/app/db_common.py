@@ -0,0 +1,207 @@
+# Motor, pool y read-your-writes comunes a los servicios con base de datos.
+# Cada imagen copia solo su servicio, así que este fichero está duplicado SIN CAMBIOS en
+# auth_service, roles_service, fields_service y reservations_service: cualquier
+# corrección se aplica a las cuatro copias. Lo propio de cada servicio (variables
+# de conexión, init_db) vive en su app/database.py.
+import math
+import os
+import threading
+import time
+
+from fastapi import Request, Response
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Tras escribir, un cliente lee de la principal durante este tiempo (retraso de la réplica)
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+# El plazo viaja con el cliente (cookie o cabecera): cualquier réplica del servicio lo respeta
+PRIMARY_PIN_COOKIE = "read_primary_until"
+PRIMARY_PIN_HEADER = "X-Read-Primary-Until"
+
+# Pool de conexiones (por proceso): size + overflow es el máximo de conexiones abiertas
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Espera máxima por una conexión libre antes de fallar con "QueuePool limit ... timed out"
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+# Reabrir conexiones más viejas que esto (cortes de proxies y balanceadores por inactividad)
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Límite por sentencia en PostgreSQL; 0 desactiva el límite
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+pool_metrics = {}  # nombre del pool -> (engine, PoolMetrics)
+
+
+class PoolMetrics:
+    """Contadores de un pool: préstamos, esperas por conexión y timeouts"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+
+    def record_wait(self, seconds: float, timed_out: bool):
+        with self.lock:
+            self.waits += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool que mide cuánto se espera por una conexión y cuenta los timeouts"""
+
+    metrics: PoolMetrics = None
+
+    def _do_get(self):
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            timed_out = True
+            raise
+        finally:
+            self.metrics.record_wait(time.perf_counter() - started, timed_out)
+
+
+def create_db_engine(url: str, name: str):
+    """Engine con el pool configurado por entorno e instrumentado en pool_metrics[name]"""
+    metrics = PoolMetrics(name)
+    # Una subclase por engine: el pool se recrea (dispose) con la misma clase y conserva sus métricas
+    pool_class = type(f"InstrumentedQueuePool_{name}", (InstrumentedQueuePool,), {"metrics": metrics})
+    connect_args = {}
+    if url.startswith("postgresql") and DB_STATEMENT_TIMEOUT_MS > 0:
+        connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+    db_engine = create_engine(
+        url,
+        poolclass=pool_class,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+        pool_recycle=DB_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=connect_args
+    )
+
+    @event.listens_for(db_engine, "connect")
+    def count_connect(dbapi_connection, connection_record):
+        with metrics.lock:
+            metrics.connects += 1
+
+    @event.listens_for(db_engine, "checkout")
+    def count_checkout(dbapi_connection, connection_record, connection_proxy):
+        with metrics.lock:
+            metrics.checkouts += 1
+
+    @event.listens_for(db_engine, "invalidate")
+    def count_invalidate(dbapi_connection, connection_record, exception):
+        with metrics.lock:
+            metrics.invalidations += 1
+
+    pool_metrics[name] = (db_engine, metrics)
+    return db_engine
+
+
+def disable_statement_timeout(conn):
+    """Sin DB_STATEMENT_TIMEOUT_MS en la transacción en curso: migraciones, archivado y recálculos"""
+    if conn.dialect.name == "postgresql" and DB_STATEMENT_TIMEOUT_MS > 0:
+        conn.execute(text("SET LOCAL statement_timeout = 0"))
+
+
+
+def pool_status() -> list:
+    """Estado actual y contadores acumulados de cada pool"""
+    status = []
+    for name, (db_engine, metrics) in pool_metrics.items():
+        pool = db_engine.pool
+        checked_out = pool.checkedout()
+        with metrics.lock:
+            status.append({
+                "pool": name,
+                "size": pool.size(),
+                "max_overflow": DB_MAX_OVERFLOW,
+                "checked_out": checked_out,
+                "checked_in": pool.checkedin(),
+                # Conexiones abiertas por encima de size (negativo: huecos aún sin abrir)
+                "overflow": pool.overflow(),
+                "exhausted": checked_out >= pool.size() + DB_MAX_OVERFLOW,
+                "checkouts_total": metrics.checkouts,
+                "connects_total": metrics.connects,
+                "invalidations_total": metrics.invalidations,
+                "waits_total": metrics.waits,
+                "wait_seconds_total": round(metrics.wait_seconds_total, 6),
+                "wait_seconds_max": round(metrics.wait_seconds_max, 6),
+                "timeouts_total": metrics.timeouts,
+            })
+    return status
+
+
+POOL_METRICS = (
+    ("size", "gauge", "Conexiones permanentes del pool"),
+    ("checked_out", "gauge", "Conexiones prestadas ahora mismo"),
+    ("overflow", "gauge", "Conexiones abiertas por encima de size"),
+    ("exhausted", "gauge", "1 si no quedan conexiones por prestar"),
+    ("checkouts_total", "counter", "Conexiones prestadas desde el arranque"),
+    ("connects_total", "counter", "Conexiones nuevas abiertas contra la base de datos"),
+    ("invalidations_total", "counter", "Conexiones descartadas por error o pre-ping"),
+    ("waits_total", "counter", "Peticiones de conexión al pool"),
+    ("wait_seconds_total", "counter", "Segundos acumulados esperando una conexión"),
+    ("wait_seconds_max", "gauge", "Mayor espera por una conexión en segundos"),
+    ("timeouts_total", "counter", "Esperas que superaron DB_POOL_TIMEOUT_SECONDS"),
+)
+
+
+def pool_metrics_text() -> str:
+    """pool_status() en formato de exposición de Prometheus"""
+    statuses = pool_status()
+    lines = []
+    for name, kind, help_text in POOL_METRICS:
+        lines.append(f"# HELP db_pool_{name} {help_text}")
+        lines.append(f"# TYPE db_pool_{name} {kind}")
+        for status in statuses:
+            value = int(status[name]) if isinstance(status[name], bool) else status[name]
+            lines.append(f'db_pool_{name}{{pool="{status["pool"]}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def pin_response_to_primary(response: Response):
+    """Devolver al cliente el instante (epoch) hasta el que sus lecturas van a la principal"""
+    until = f"{time.time() + READ_YOUR_WRITES_SECONDS:.3f}"
+    response.set_cookie(
+        PRIMARY_PIN_COOKIE, until,
+        max_age=math.ceil(READ_YOUR_WRITES_SECONDS), httponly=True, samesite="lax"
+    )
+    response.headers[PRIMARY_PIN_HEADER] = until
+
+
+def is_pinned_to_primary(request: Request) -> bool:
+    """El cliente escribió hace menos de READ_YOUR_WRITES_SECONDS (cabecera o cookie)"""
+    if request is None:
+        return False
+    value = request.headers.get(PRIMARY_PIN_HEADER) or request.cookies.get(PRIMARY_PIN_COOKIE)
+    try:
+        until = float(value)
+    except (TypeError, ValueError):
+        return False
+    now = time.time()
+    # Un plazo manipulado no fija al cliente en la principal más allá de la ventana
+    return now < until <= now + READ_YOUR_WRITES_SECONDS + 1
+
+
+def pin_client_after_commit(session):
+    """Cada commit en la principal fija a su cliente en ella durante READ_YOUR_WRITES_SECONDS"""
+    response = session.info.get("response")
+    if response is not None:
+        pin_response_to_primary(response)
@@ -1,7 +1,9 @@
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.routes import roles_router
 from app.database import init_db
+from app.db_common import pool_metrics_text, pool_status
 
 app = FastAPI(title="Roles and Permissions Service")
 
@@ -19,4 +21,20 @@ app.include_router(roles_router, prefix="/roles", tags=["Roles"])
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy", "service": "roles_service"}
\ No newline at end of file
+    return {"status": "healthy", "service": "roles_service"}
+
+@app.get("/ready")
+def readiness_check():
+    """Sonda del balanceador: 503 con el pool de conexiones agotado para que desvíe tráfico"""
+    pools = pool_status()
+    if any(pool["exhausted"] for pool in pools):
+        return JSONResponse(
+            status_code=503,
+            content={"status": "exhausted", "service": "roles_service", "pools": pools},
+            headers={"Retry-After": "1"}
+        )
+    return {"status": "ready", "service": "roles_service", "pools": pools}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(pool_metrics_text(), media_type="text/plain; version=0.0.4")
@@ -10,7 +10,7 @@ roles_router = APIRouter()
 def validate_user_permission(
     validation_request: schemas.PermissionValidationRequest,
     authorization: str = Header(...),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_read_db)
 ):
 
     # Validar token (puede ser cualquier usuario autenticado)
@@ -66,7 +66,7 @@ def validate_user_permission(
 @roles_router.get("/roles", response_model=List[schemas.RoleResponse])
 def get_all_roles(
     authorization: str = Header(...),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_read_db)
 ):
     """Obtener todos los roles (solo administradores)"""
     # Validar que sea administrador
@@ -105,7 +105,7 @@ def create_role(
 def get_all_permissions(
     resource: Optional[str] = None,
     authorization: str = Header(...),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_read_db)
 ):
     """Obtener todos los permisos, opcionalmente filtrados por recurso"""
     # Validar token
@@ -188,7 +188,7 @@ def assign_role_to_user(
 def get_user_permissions(
     user_id: int,
     authorization: str = Header(...),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_read_db)
 ):
     """Obtener todos los permisos de un usuario"""
     # Validar token